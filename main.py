@@ -1,17 +1,62 @@
+import argparse
+
+from src.config import settings
 from src.init.Init_controller import get_controller
 from src.types_.base_types import UserQuestion
 
 
-def main():
-    controller = get_controller()
-    controller.startup()
+def run_cli(controller):
+    controller.startup(background=settings.WARMUP_IN_BACKGROUND)
     try:
         while True:
             question: UserQuestion = str(input("Введите ваш запрос: ").strip())
             if not question:
                 continue
-            controller.get_answer(question)
+            controller.get_answer(question, stream=settings.LLM_STREAM)
     except KeyboardInterrupt:
         print("\nСервис остановлен!")
+    finally:
+        controller.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simple RAG System")
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=("cli", "serve"),
+        default="cli",
+        help="cli - интерактивный режим, serve - HTTP-сервис"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Профилировать загрузку индекса и каждый запрос CLI (cProfile и tracemalloc) в PROFILE_DIR"
+    )
+    parser.add_argument(
+        "--rebuild-shard",
+        metavar="NAME",
+        default=None,
+        help="Перестроить один шард индекса (RAG_ENGINE_TYPE=faiss_sharded) и выйти"
+    )
+    args = parser.parse_args()
+    if args.profile:
+        settings.PROFILE_ENABLED = True
+
+    controller = get_controller()
+    if args.rebuild_shard is not None:
+        try:
+            controller.rebuild_shard(args.rebuild_shard)
+        finally:
+            controller.shutdown()
+        return
+    if args.mode == "serve":
+        from src.server.app import serve
+
+        serve(controller, host=settings.SERVER_HOST, port=settings.SERVER_PORT)
+    else:
+        run_cli(controller)
+
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,138 @@
 from abc import ABC, abstractmethod
 from enum import Enum
 from functools import wraps
-import time
-from typing import Generic, TypeVar
+import inspect
+from typing import AsyncIterator, ClassVar, Generic, Iterator, Type, TypeVar
 
+import httpx
 from pydantic import BaseModel
 
+from src.utils.metrics import metrics
+
 
 class LLMChoice(str, Enum):
     MISTRAL = "mistral"
     OLLAMA = "ollama"
 
 
+class ModelsEnum(str, Enum):
+    """ Доступные модели для Mistral API SDK """
+    MEDIUM = "mistral-medium"
+    TINY = "mistral-tiny"
+    SMALL = "mistral-small"
+    LARGE = "mistral-large-latest"
+
+
+class OllamaModelsEnum(str, Enum):
+    """ Доступные модели для Ollama """
+    QWEN_2_5 = "qwen2.5"
+
+
 def measure_time(func):
+    """
+    Записывает время запроса к LLM в метрики как этап llm.<имя метода>.
+    Клиенты вызываются и из сервера, поэтому время печатает CLI по спанам запроса
+    """
+    stage = f"llm.{func.__name__}"
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with metrics.span(stage):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.perf_counter()
-        try:
+        with metrics.span(stage):
             return func(*args, **kwargs)
-        finally:
-            end_time = time.perf_counter()
-            print(f"Время выполнения запроса: {end_time - start_time:.2f} сек")
     return wrapper
 
 
-InitDataTypeVar = TypeVar("InitDataTypeVar", bound=BaseModel)
+class Prompt(BaseModel):
+    """
+    Промпт запроса к LLM: system - неизменные инструкции, общий префикс всех запросов,
+    user - заметки и вопрос
+    """
+    system: str = ""
+    user: str
+
+    @property
+    def text(self) -> str:
+        """Промпт одной строкой для API без ролей сообщений"""
+        return f"{self.system}\n\n{self.user}" if self.system else self.user
+
+
+class BaseLLMInitData(BaseModel):
+    """Общие настройки HTTP-соединений LLM-клиентов"""
+    pool_size: int = 10
+    timeout: float = 120.0
+    keepalive_expiry: float = 60.0
+
+    @property
+    def httpx_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+
+InitDataTypeVar = TypeVar("InitDataTypeVar", bound=BaseLLMInitData)
 
 
 class BaseLLMClient(ABC, Generic[InitDataTypeVar]):
     
     client_type: LLMChoice = None
+    init_data_class: ClassVar[Type[BaseLLMInitData]]
 
     def __init__(self, init_data: InitDataTypeVar):
         self._data = init_data
 
+    def close(self) -> None:
+        """Закрывает соединения клиента"""
+        pass
+
+    async def aclose(self) -> None:
+        """Закрывает асинхронные соединения клиента"""
+        pass
+
+    def warm_up(self) -> None:
+        """Готовит модель к первому запросу, чтобы он не ждал её загрузки"""
+        pass
+
+    @property
+    @abstractmethod
+    def model_name(self) -> str:
+        """Модель, которая отвечает на запросы: "<клиент>:<модель>" """
+        ...
+
+    def _record_usage(self, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+        """Токены запроса и ответа по данным API, если модель их вернула"""
+        if prompt_tokens is not None:
+            metrics.inc("llm_prompt_tokens_total", prompt_tokens, model=self.model_name)
+        if completion_tokens is not None:
+            metrics.inc("llm_completion_tokens_total", completion_tokens, model=self.model_name)
+
+    @property
+    def max_prompt_tokens(self) -> int | None:
+        """Сколько токенов промпта помещается в контекст модели вместе с ответом, None - неизвестно"""
+        return None
+
+    @abstractmethod
+    def send_request(self, prompt: Prompt) -> str:
+        ...
+
+    @abstractmethod
+    def stream_request(self, prompt: Prompt) -> Iterator[str]:
+        """Отдаёт фрагменты ответа по мере их генерации моделью"""
+        ...
+
+    @abstractmethod
+    async def send_request_async(self, prompt: Prompt) -> str:
+        ...
+
     @abstractmethod
-    def send_request(self, text_request: str) -> str:
+    def stream_request_async(self, prompt: Prompt) -> AsyncIterator[str]:
+        """Асинхронно отдаёт фрагменты ответа по мере их генерации моделью"""
         ...
\ No newline at end of file
@@ -1,20 +1,24 @@
+from importlib import import_module
 from typing import Type
 from src.api_clients.base import BaseLLMClient, LLMChoice
-from src.api_clients.mistral_api_client import MistralClient
-from src.api_clients.ollama_api_client import OllamaApiClient
 
 
 class ApiClientFactory:
-    
-    api_client_classes: list[Type[BaseLLMClient]] = [
-        OllamaApiClient,
-        MistralClient
-    ]
+
+    # Модули клиентов импортируются только при выборе клиента,
+    # чтобы не загружать SDK неиспользуемых LLM
+    api_client_classes: dict[LLMChoice, str] = {
+        LLMChoice.OLLAMA: "src.api_clients.ollama_api_client:OllamaApiClient",
+        LLMChoice.MISTRAL: "src.api_clients.mistral_api_client:MistralClient",
+    }
 
     @classmethod
     def get_client_by_type(cls, target_type: LLMChoice) -> type[BaseLLMClient]:
-        for client in cls.api_client_classes:
+        path = cls.api_client_classes.get(target_type)
+        if path is not None:
+            module_name, class_name = path.split(":")
+            client: Type[BaseLLMClient] = getattr(import_module(module_name), class_name)
             if client.client_type == target_type:
                 print(f"В системе найден класс для работы с {target_type.value}")
                 return client
-        raise RuntimeError(f"Не удалось подобрать llm-клиента по типу {target_type}")
\ No newline at end of file
+        raise RuntimeError(f"Не удалось подобрать llm-клиента по типу {target_type}")
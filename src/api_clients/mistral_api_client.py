@@ -1,21 +1,15 @@
-from enum import Enum
+import asyncio
+from functools import cached_property
 import time
+from typing import AsyncIterator, Iterator
 
-from mistralai import Mistral, SDKError
-from pydantic import BaseModel
+import httpx
+from mistralai import Mistral, SDKError, UsageInfo
 
-from src.api_clients.base import BaseLLMClient, LLMChoice, measure_time
+from src.api_clients.base import BaseLLMClient, BaseLLMInitData, LLMChoice, ModelsEnum, Prompt, measure_time
 
 
-class ModelsEnum(str, Enum):
-    """ Доступные модели для Mistral API SDK """
-    MEDIUM = "mistral-medium"
-    TINY = "mistral-tiny"
-    SMALL = "mistral-small"
-    LARGE = "mistral-large-latest"
-
-
-class MistralInitData(BaseModel):
+class MistralInitData(BaseLLMInitData):
     api_key: str
     model: ModelsEnum
 
@@ -24,14 +18,64 @@ class MistralClient(BaseLLMClient[MistralInitData]):
     """ Клиент для выполнения запросов к API Mistral """
 
     client_type = LLMChoice.MISTRAL
+    init_data_class = MistralInitData
     
-    @property
+    @cached_property
+    def _http_client(self) -> httpx.Client:
+        """Пул keep-alive соединений, общий для всех запросов и повторов"""
+        return httpx.Client(limits=self._data.httpx_limits, timeout=self._data.timeout)
+
+    @cached_property
     def _client(self) -> Mistral:
         api_key = self._data.api_key
-        return Mistral(api_key=api_key)
+        return Mistral(api_key=api_key, client=self._http_client)
+
+    @cached_property
+    def _async_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(limits=self._data.httpx_limits, timeout=self._data.timeout)
+
+    @cached_property
+    def _async_client(self) -> Mistral:
+        api_key = self._data.api_key
+        return Mistral(api_key=api_key, async_client=self._async_http_client)
+
+    def close(self) -> None:
+        if "_http_client" in self.__dict__:
+            self._http_client.close()
+            del self.__dict__["_http_client"]
+        self.__dict__.pop("_client", None)
+
+    async def aclose(self) -> None:
+        if "_async_http_client" in self.__dict__:
+            await self._async_http_client.aclose()
+            del self.__dict__["_async_http_client"]
+        self.__dict__.pop("_async_client", None)
+
+    def warm_up(self) -> None:
+        """Открывает соединение из пула заранее, чтобы первый запрос не ждал TLS-рукопожатия"""
+        try:
+            self._client.models.list()
+        except (SDKError, httpx.HTTPError) as e:
+            print(f"Не удалось прогреть соединение с Mistral: {e}")
+
+    @property
+    def model_name(self) -> str:
+        return f"{self.client_type.value}:{self._data.model.value}"
+
+    def _record_mistral_usage(self, usage: UsageInfo | None) -> None:
+        if usage is not None:
+            self._record_usage(usage.prompt_tokens, usage.completion_tokens)
+
+    @staticmethod
+    def _messages(prompt: Prompt) -> list[dict[str, str]]:
+        """Инструкции - системным сообщением, чтобы они оставались общим префиксом запросов"""
+        messages = [{"role": "user", "content": prompt.user}]
+        if prompt.system:
+            messages.insert(0, {"role": "system", "content": prompt.system})
+        return messages
 
     @measure_time
-    def send_request(self, text_request: str) -> str:
+    def send_request(self, prompt: Prompt) -> str:
         counter = 0
 
         model = self._data.model
@@ -40,13 +84,91 @@ class MistralClient(BaseLLMClient[MistralInitData]):
             try:
                 response = self._client.chat.complete(
                     model=model,
-                    messages=[
-                        {"role": "user", "content": text_request},
-                    ]
+                    messages=self._messages(prompt)
                 )
+                self._record_mistral_usage(response.usage)
                 return response.choices[0].message.content
             except SDKError:
                 print("Произошла ошибка при запросе. Спросим еще раз через 5 секунд")
                 counter += 1
                 time.sleep(5)
-        raise RuntimeError("Не удалось подключиться к Mistral")
\ No newline at end of file
+        raise RuntimeError("Не удалось подключиться к Mistral")
+
+    def stream_request(self, prompt: Prompt) -> Iterator[str]:
+        counter = 0
+
+        model = self._data.model
+
+        while counter < 3:
+            started = False
+            try:
+                with self._client.chat.stream(
+                    model=model,
+                    messages=self._messages(prompt)
+                ) as events:
+                    for event in events:
+                        # usage приходит в последнем событии потока
+                        if event.data.usage is not None:
+                            self._record_mistral_usage(event.data.usage)
+                        token = event.data.choices[0].delta.content
+                        if isinstance(token, str) and token:
+                            started = True
+                            yield token
+                return
+            except SDKError:
+                # Повтор после первых токенов продублировал бы уже отданную часть ответа
+                if started:
+                    raise RuntimeError("Соединение с Mistral прервано во время генерации ответа")
+                print("Произошла ошибка при запросе. Спросим еще раз через 5 секунд")
+                counter += 1
+                time.sleep(5)
+        raise RuntimeError("Не удалось подключиться к Mistral")
+
+    @measure_time
+    async def send_request_async(self, prompt: Prompt) -> str:
+        counter = 0
+
+        model = self._data.model
+
+        while counter < 3:
+            try:
+                response = await self._async_client.chat.complete_async(
+                    model=model,
+                    messages=self._messages(prompt)
+                )
+                self._record_mistral_usage(response.usage)
+                return response.choices[0].message.content
+            except SDKError:
+                print("Произошла ошибка при запросе. Спросим еще раз через 5 секунд")
+                counter += 1
+                await asyncio.sleep(5)
+        raise RuntimeError("Не удалось подключиться к Mistral")
+
+    async def stream_request_async(self, prompt: Prompt) -> AsyncIterator[str]:
+        counter = 0
+
+        model = self._data.model
+
+        while counter < 3:
+            started = False
+            try:
+                events = await self._async_client.chat.stream_async(
+                    model=model,
+                    messages=self._messages(prompt)
+                )
+                async with events:
+                    async for event in events:
+                        if event.data.usage is not None:
+                            self._record_mistral_usage(event.data.usage)
+                        token = event.data.choices[0].delta.content
+                        if isinstance(token, str) and token:
+                            started = True
+                            yield token
+                return
+            except SDKError:
+                if started:
+                    raise RuntimeError("Соединение с Mistral прервано во время генерации ответа")
+                print("Произошла ошибка при запросе. Спросим еще раз через 5 секунд")
+                counter += 1
+                await asyncio.sleep(5)
+        raise RuntimeError("Не удалось подключиться к Mistral")
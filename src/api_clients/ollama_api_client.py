@@ -1,52 +1,198 @@
-from enum import Enum
-from pydantic import BaseModel
+from functools import cached_property
+import json
+from typing import AsyncIterator, Iterator
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 
-from src.api_clients.base import BaseLLMClient, LLMChoice, measure_time
+from src.api_clients.base import BaseLLMClient, BaseLLMInitData, LLMChoice, OllamaModelsEnum, Prompt, measure_time
 from src.utils.strip_slash import strip_slash
 
 
-class OllamaModelsEnum(str, Enum):
-    """ Доступные модели для Mistral API SDK """
-    QWEN_2_5 = "qwen2.5"
-
-
-class OllamaInitModel(BaseModel):
+class OllamaInitModel(BaseLLMInitData):
     base_url: str
     model: OllamaModelsEnum
     num_ctx: int = 8192
     temperature: float = 0.0
     num_predict: int = 500
+    # Сколько модель остаётся в памяти после запроса ("30m", "-1" - всегда), None - по умолчанию Ollama
+    keep_alive: str | None = None
+    # Продолжать диалог: context ответа передаётся в следующий запрос, и Ollama не пересчитывает
+    # предыдущие реплики. Под историю отводится половина num_ctx, при переполнении она сбрасывается
+    reuse_context: bool = False
 
 
 class OllamaApiClient(BaseLLMClient[OllamaInitModel]):
 
     client_type = LLMChoice.OLLAMA
+    init_data_class = OllamaInitModel
 
+    def __init__(self, init_data: OllamaInitModel):
+        super().__init__(init_data)
+        # Токены диалога из последнего ответа, только для синхронных запросов одной сессии CLI
+        self._context: list[int] | None = None
 
-    @measure_time
-    def send_request(self, text_request: str) -> str:
+    @cached_property
+    def _session(self) -> requests.Session:
+        """Сессия с пулом keep-alive соединений к Ollama, живёт всё время работы клиента"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._data.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @cached_property
+    def _async_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(limits=self._data.httpx_limits, timeout=self._data.timeout)
+
+    def close(self) -> None:
+        if "_session" in self.__dict__:
+            self._session.close()
+            del self.__dict__["_session"]
+
+    async def aclose(self) -> None:
+        if "_async_client" in self.__dict__:
+            await self._async_client.aclose()
+            del self.__dict__["_async_client"]
+
+    def warm_up(self) -> None:
+        """Запрос без prompt загружает модель в память Ollama и открывает соединение из пула"""
+        try:
+            r = self._session.post(
+                url=self._url,
+                json=self._with_keep_alive({"model": self._data.model}),
+                timeout=self._data.timeout
+            )
+            r.raise_for_status()
+            print(f"Модель {self._data.model.value} загружена в Ollama")
+        except requests.RequestException as e:
+            print(f"Не удалось прогреть Ollama: {e}")
+
+    @property
+    def model_name(self) -> str:
+        return f"{self.client_type.value}:{self._data.model.value}"
+
+    @property
+    def max_prompt_tokens(self) -> int:
+        # Ollama молча обрезает начало промпта, не поместившееся в num_ctx
+        return self._data.num_ctx - self._data.num_predict - self._history_limit
+
+    @property
+    def _history_limit(self) -> int:
+        return self._data.num_ctx // 2 if self._data.reuse_context else 0
+
+    def reset_context(self) -> None:
+        """Начинает новый диалог"""
+        self._context = None
+
+    def _remember_context(self, data: dict) -> None:
+        if not self._data.reuse_context:
+            return
+        context = data.get("context")
+        self._context = context if context and len(context) <= self._history_limit else None
 
-        model = self._data.model
-        num_ctx = self._data.num_ctx
-        temperature = self._data.temperature
-        num_predict = self._data.num_predict
+    def _record_ollama_usage(self, data: dict) -> None:
+        # prompt_eval_count - токены промпта, которые модель посчитала (без переиспользованного префикса),
+        # eval_count - токены ответа
+        self._record_usage(data.get("prompt_eval_count"), data.get("eval_count"))
+
+    @property
+    def _url(self) -> str:
         base_url = strip_slash(self._data.base_url)
-        url = f"{base_url}/api/generate"
+        return f"{base_url}/api/generate"
+
+    def _with_keep_alive(self, payload: dict) -> dict:
+        if self._data.keep_alive is not None:
+            payload["keep_alive"] = self._data.keep_alive
+        return payload
+
+    def _payload(self, prompt: Prompt, stream: bool, context: list[int] | None = None) -> dict:
+        # Инструкции передаются в system: шаблон модели ставит их первыми,
+        # и Ollama переиспользует KV-кэш этого общего префикса между запросами
+        payload = {
+            "model": self._data.model,
+            "system": prompt.system,
+            "prompt": prompt.user,
+            "stream": stream,
+            "options": {
+                "num_ctx": self._data.num_ctx,
+                "temperature": self._data.temperature,
+                "num_predict": self._data.num_predict
+            }
+        }
+        if context:
+            payload["context"] = context
+        return self._with_keep_alive(payload)
+
+    @measure_time
+    def send_request(self, prompt: Prompt) -> str:
+        try:
+            r = self._session.post(
+                url=self._url,
+                json=self._payload(prompt, stream=False, context=self._context),
+                timeout=self._data.timeout
+            )
+            data = r.json()
+            self._remember_context(data)
+            self._record_ollama_usage(data)
+            ans = data.get("response", "Ошибка модели")
+            return ans
+        except Exception as e:
+            raise RuntimeError(f"Ollama не отвечает. ({e})")
+
+    def stream_request(self, prompt: Prompt) -> Iterator[str]:
         try:
-            r = requests.post(
-                url=url,
-                json={
-                    "model": model, 
-                    "prompt": text_request, 
-                    "stream": False, 
-                    "options": {
-                        "num_ctx": num_ctx,
-                        "temperature": temperature, 
-                        "num_predict": num_predict
-                    }
-                })
-            ans = r.json().get("response", "Ошибка модели")
+            with self._session.post(
+                url=self._url,
+                json=self._payload(prompt, stream=True, context=self._context),
+                stream=True,
+                timeout=self._data.timeout
+            ) as r:
+                r.raise_for_status()
+                for line in r.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if token := data.get("response"):
+                        yield token
+                    if data.get("done"):
+                        self._remember_context(data)
+                        self._record_ollama_usage(data)
+                        break
+        except requests.RequestException as e:
+            raise RuntimeError(f"Ollama не отвечает. ({e})")
+
+    @measure_time
+    async def send_request_async(self, prompt: Prompt) -> str:
+        try:
+            r = await self._async_client.post(
+                url=self._url,
+                json=self._payload(prompt, stream=False)
+            )
+            data = r.json()
+            self._record_ollama_usage(data)
+            ans = data.get("response", "Ошибка модели")
             return ans
         except Exception as e:
-            raise RuntimeError(f"Ollama не отвечает. ({e})")
\ No newline at end of file
+            raise RuntimeError(f"Ollama не отвечает. ({e})")
+
+    async def stream_request_async(self, prompt: Prompt) -> AsyncIterator[str]:
+        try:
+            async with self._async_client.stream(
+                "POST",
+                url=self._url,
+                json=self._payload(prompt, stream=True)
+            ) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if token := data.get("response"):
+                        yield token
+                    if data.get("done"):
+                        self._record_ollama_usage(data)
+                        break
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Ollama не отвечает. ({e})")
@@ -0,0 +1,109 @@
+"""
+Бенчмарк индексации и поиска на синтетическом корпусе.
+
+    python -m src.benchmarks --documents 500 --output bench.json
+    python -m src.benchmarks --baseline bench.json --tolerance 0.2
+
+С --baseline отчёт сравнивается с сохранённым, при регрессиях код возврата - 1.
+"""
+import argparse
+import json
+from pathlib import Path
+import sys
+import tempfile
+
+from src.benchmarks.corpus import CorpusFormat, CorpusSpec
+from src.benchmarks.runner import BenchmarkConfig, BenchmarkRunner, compare_reports, format_report
+from src.services.retrieval.base import EmbeddingModel, RAGEngineType
+from src.services.retrieval.embedding_backend import EmbeddingBackend
+from src.services.retrieval.rag_engine import RetrievalMode
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк индексации и поиска")
+    parser.add_argument("--documents", type=int, default=200, help="Число документов в корпусе")
+    parser.add_argument("--words", type=int, default=800, help="Слов в документе")
+    parser.add_argument(
+        "--formats", nargs="+", type=CorpusFormat, default=[CorpusFormat.MD, CorpusFormat.TXT],
+        help="Форматы документов: md, txt, docx, pdf"
+    )
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="Доля документов-копий")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--engines", nargs="+", type=RAGEngineType, default=[RAGEngineType.FAISS, RAGEngineType.CHROMADB]
+    )
+    parser.add_argument("--embedding-model", default=EmbeddingModel.multilingual_e5_small.value)
+    parser.add_argument("--embedding-backend", type=EmbeddingBackend, default=EmbeddingBackend.TORCH)
+    parser.add_argument("--retrieval-mode", type=RetrievalMode, default=RetrievalMode.DENSE)
+    parser.add_argument("--chunk-size", type=int, default=600)
+    parser.add_argument("--overlap", type=int, default=80)
+    parser.add_argument("--batch-size", type=int, default=256, help="Размер пакета эмбеддингов")
+    parser.add_argument("--parse-workers", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=100, help="Число запросов для замера поиска")
+    parser.add_argument("--num-shards", type=int, default=4, help="Число шардов для faiss_sharded")
+    parser.add_argument(
+        "--work-dir", type=Path, default=None,
+        help="Директория для корпуса и индексов, по умолчанию - временная"
+    )
+    parser.add_argument("--output", type=Path, default=None, help="Куда сохранить JSON-отчёт")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON-отчёт для сравнения")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="Допустимое ухудшение относительно baseline (0.2 - на 20%%)"
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    config = BenchmarkConfig(
+        corpus=CorpusSpec(
+            documents=args.documents,
+            words_per_document=args.words,
+            formats=args.formats,
+            duplicate_ratio=args.duplicate_ratio,
+            seed=args.seed
+        ),
+        engines=args.engines,
+        embedding_model=args.embedding_model,
+        embedding_backend=args.embedding_backend,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        embedding_batch_size=args.batch_size,
+        parse_workers=args.parse_workers,
+        retrieval_mode=args.retrieval_mode,
+        queries=args.queries,
+        num_shards=args.num_shards
+    )
+
+    if args.work_dir is not None:
+        args.work_dir.mkdir(parents=True, exist_ok=True)
+        report = BenchmarkRunner(config, args.work_dir).run()
+    else:
+        with tempfile.TemporaryDirectory(prefix="rag_bench_") as work_dir:
+            report = BenchmarkRunner(config, Path(work_dir)).run()
+
+    print()
+    print(format_report(report))
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Отчёт сохранён в {args.output}")
+
+    if args.baseline is None:
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare_reports(report, baseline, tolerance=args.tolerance)
+    if not regressions:
+        print(f"Регрессий относительно {args.baseline} нет")
+        return 0
+    print(f"Регрессии относительно {args.baseline}:")
+    for regression in regressions:
+        print(
+            f"  {regression.stage} {regression.metric}: "
+            f"{regression.baseline:.3f} -> {regression.current:.3f} (x{regression.ratio:.2f})"
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+from enum import Enum
+from pathlib import Path
+import random
+
+from pydantic import BaseModel
+
+
+class CorpusFormat(str, Enum):
+    MD = "md"
+    TXT = "txt"
+    DOCX = "docx"
+    PDF = "pdf"
+
+
+# Словарь синтетических документов: юридическая лексика и технические термины,
+# чтобы токенизация и BM25 работали на похожем на реальные заметки тексте
+_WORDS = (
+    "договор стороны обязательство исполнение срок давности иск суд решение статья кодекс "
+    "работодатель работник увольнение заявление налог вычет имущество собственность аренда "
+    "займ проценты неустойка ответственность претензия порядок рассмотрения требования закон "
+    "индекс поиск эмбеддинг модель запрос ответ контекст документ заметка чанк вектор кластер "
+    "index search embedding model query answer context document note chunk vector cluster "
+    "pipeline retrieval latency throughput memory batch cache config python numpy faiss"
+).split()
+# Стандартный шрифт PDF без встраивания умеет только латиницу
+_ASCII_WORDS = [word for word in _WORDS if word.isascii()]
+
+
+class CorpusSpec(BaseModel):
+    documents: int = 200
+    words_per_document: int = 800
+    formats: list[CorpusFormat] = [CorpusFormat.MD, CorpusFormat.TXT]
+    # Доля документов - копий предыдущих, как шаблоны и повторяющиеся пункты в реальных заметках
+    duplicate_ratio: float = 0.0
+    seed: int = 0
+
+
+def _paragraphs(rng: random.Random, words: list[str], count: int) -> list[str]:
+    paragraphs = []
+    left = count
+    while left > 0:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            size = min(rng.randint(6, 18), max(left, 1))
+            left -= size
+            sentence = " ".join(rng.choice(words) for _ in range(size))
+            sentences.append(f"{sentence.capitalize()} {rng.randint(1, 400)}.")
+            if left <= 0:
+                break
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def _write_docx(file: Path, paragraphs: list[str]) -> None:
+    import docx
+
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(str(file))
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _write_pdf(file: Path, paragraphs: list[str], line_width: int = 90, page_lines: int = 60) -> None:
+    """Минимальный PDF со стандартным шрифтом Helvetica: по странице на page_lines строк"""
+    lines: list[str] = []
+    for paragraph in paragraphs:
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + len(word) + 1 > line_width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    pages = [lines[i:i + page_lines] for i in range(0, len(lines), page_lines)] or [[""]]
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "", "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in pages:
+        text = "\n".join(f"({_pdf_escape(line)}) Tj T*" for line in page)
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td\n{text}\nET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    file.write_bytes(bytes(data))
+
+
+def generate_corpus(spec: CorpusSpec, target_dir: Path) -> list[Path]:
+    """
+    Создаёт в target_dir spec.documents документов по кругу из spec.formats.
+    Текст детерминирован spec.seed, поэтому прогоны с одинаковым spec сравнимы.
+    """
+    rng = random.Random(spec.seed)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    files: list[Path] = []
+    generated: list[list[str]] = []
+    for number in range(spec.documents):
+        fmt = spec.formats[number % len(spec.formats)]
+        words = _ASCII_WORDS if fmt == CorpusFormat.PDF else _WORDS
+        if generated and rng.random() < spec.duplicate_ratio:
+            paragraphs = rng.choice(generated)
+        else:
+            paragraphs = _paragraphs(rng, words, spec.words_per_document)
+            generated.append(paragraphs)
+        if fmt == CorpusFormat.PDF:
+            paragraphs = [" ".join(w if w.isascii() else rng.choice(_ASCII_WORDS) for w in p.split()) for p in paragraphs]
+
+        file = target_dir / f"doc_{number:05d}.{fmt.value}"
+        if fmt == CorpusFormat.DOCX:
+            _write_docx(file, paragraphs)
+        elif fmt == CorpusFormat.PDF:
+            _write_pdf(file, paragraphs)
+        elif fmt == CorpusFormat.MD:
+            file.write_text(f"# Документ {number}\n\n" + "\n\n".join(paragraphs) + "\n", encoding="utf-8")
+        else:
+            file.write_text("\n\n".join(paragraphs) + "\n", encoding="utf-8")
+        files.append(file)
+    return files
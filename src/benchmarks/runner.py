@@ -0,0 +1,353 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+import platform
+import random
+import threading
+import time
+from typing import Any, Callable, TypeVar
+
+import numpy as np
+import psutil
+from pydantic import BaseModel
+
+from src.benchmarks.corpus import CorpusSpec, generate_corpus
+from src.services.retrieval.base import EmbeddingModel, RAGEngineBase, RAGEngineType
+from src.services.retrieval.chunk_generator import Chunk, ChunkGenerator
+from src.services.retrieval.embedding_backend import EmbeddingBackend, EmbeddingParams, create_embedding_model
+from src.services.retrieval.embedding_cache import TextEncoder
+from src.services.retrieval.rag_engine import (
+    ChromaClientType,
+    ChromaRAGConfig,
+    FAISSRAGConfig,
+    RagEngineFactory,
+    RetrievalMode,
+    ShardedFAISSRAGConfig,
+    ShardingMode,
+)
+from src.services.local_manger.local_manager import LocalManager
+
+
+ResultTypeVar = TypeVar("ResultTypeVar")
+
+_MB = 1024 * 1024
+
+
+class BenchmarkConfig(BaseModel):
+    corpus: CorpusSpec = CorpusSpec()
+    engines: list[RAGEngineType] = [RAGEngineType.FAISS, RAGEngineType.CHROMADB]
+    # Имя модели из EmbeddingModel или путь к локальной модели sentence-transformers
+    embedding_model: str = EmbeddingModel.multilingual_e5_small.value
+    embedding_backend: EmbeddingBackend = EmbeddingBackend.TORCH
+    # Экспортированные ONNX-модели, по умолчанию - общая с приложением директория
+    onnx_models_dir: Path = Path("onnx_models")
+    chunk_size: int = 600
+    overlap: int = 80
+    embedding_batch_size: int = 256
+    parse_workers: int = 1
+    retrieval_k: int = 4
+    retrieval_mode: RetrievalMode = RetrievalMode.DENSE
+    # Число запросов для замера задержки поиска
+    queries: int = 100
+    # Шарды faiss_sharded: синтетический корпус лежит в одной папке, поэтому шардирование по хэшу
+    num_shards: int = 4
+
+
+@dataclass
+class StageResult:
+    name: str
+    seconds: float
+    # Сколько единиц (документов, чанков, запросов) обработано за этап
+    items: int
+    unit: str
+    # Пик RSS процесса за время этапа и его прирост относительно начала этапа
+    peak_rss_mb: float
+    rss_growth_mb: float
+    # Задержки отдельных вызовов в мс (p50, p95, p99, mean, max), если этап их замеряет
+    latency_ms: dict[str, float] | None = None
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "throughput": self.throughput}
+
+
+@dataclass
+class Regression:
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def latency_stats(latencies: list[float]) -> dict[str, float]:
+    """Перцентили задержек в мс по списку длительностей в секундах"""
+    values = np.asarray(latencies, dtype="float64") * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(values.mean()),
+        "max": float(values.max()),
+    }
+
+
+class _PeakRSS:
+    """Опрашивает RSS процесса в фоновом потоке: пик включает память FAISS, torch и ONNX Runtime"""
+
+    def __init__(self, interval: float = 0.01):
+        self._process = psutil.Process()
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.start = self.peak = self._process.memory_info().rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def __enter__(self) -> "_PeakRSS":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+
+def _measure(
+        name: str,
+        func: Callable[[], ResultTypeVar],
+        count: Callable[[ResultTypeVar], int],
+        unit: str
+) -> tuple[ResultTypeVar, StageResult]:
+    with _PeakRSS() as memory:
+        start_time = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start_time
+    stage = StageResult(
+        name=name,
+        seconds=seconds,
+        items=count(result),
+        unit=unit,
+        peak_rss_mb=memory.peak / _MB,
+        rss_growth_mb=(memory.peak - memory.start) / _MB,
+    )
+    print(f"{name}: {seconds:.2f} сек, {stage.throughput:.1f} {unit}/сек")
+    return result, stage
+
+
+def _make_queries(chunks: list[Chunk], count: int, seed: int) -> list[str]:
+    """Запросы из начал случайных чанков: у каждого запроса в индексе есть релевантный чанк"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(chunks)["text"].split()[:8]) for _ in range(count)]
+
+
+class BenchmarkRunner:
+    """
+    Прогоняет конвейер на синтетическом корпусе и замеряет каждый этап:
+    разбор документов, нарезку на чанки, эмбеддинг, а для каждого движка -
+    build_index, load_index и поиск. Индексы строятся во временной work_dir
+    без кэша эмбеддингов и кэша запросов, чтобы замерялась сама работа.
+    """
+
+    def __init__(self, config: BenchmarkConfig, work_dir: Path):
+        self.config = config
+        self.work_dir = work_dir
+        self.stages: dict[str, StageResult] = {}
+        self.skipped: dict[str, str] = {}
+
+    def _add(self, stage: StageResult) -> None:
+        self.stages[stage.name] = stage
+
+    def _engine_config(self, engine_type: RAGEngineType) -> FAISSRAGConfig | ChromaRAGConfig:
+        engine_dir = self.work_dir / engine_type.value
+        common = dict(
+            retrieval_k=self.config.retrieval_k,
+            embedding_batch_size=self.config.embedding_batch_size,
+            query_cache_size=0,
+            embedding=EmbeddingParams(model=self.config.embedding_model, backend=self.config.embedding_backend),
+        )
+        faiss_paths = dict(
+            index_dir=engine_dir,
+            index_file=engine_dir / "index.faiss",
+            docs_dir=engine_dir / "docs",
+            manifest_file=engine_dir / "manifest.json",
+            bm25_dir=engine_dir / "bm25",
+            retrieval_mode=self.config.retrieval_mode,
+        )
+        if engine_type == RAGEngineType.FAISS:
+            return FAISSRAGConfig(**faiss_paths, **common)
+        if engine_type == RAGEngineType.FAISS_SHARDED:
+            return ShardedFAISSRAGConfig(
+                sharding=ShardingMode.HASH,
+                num_shards=self.config.num_shards,
+                **faiss_paths,
+                **common
+            )
+        return ChromaRAGConfig(
+            db_dir=engine_dir,
+            collection_name="benchmark",
+            host="localhost",
+            port=8000,
+            client_type=ChromaClientType.PERSISTENT,
+            **common
+        )
+
+    def _create_engine(
+            self,
+            engine_type: RAGEngineType,
+            chunk_generator: ChunkGenerator,
+            model: TextEncoder
+    ) -> RAGEngineBase:
+        engine_class = RagEngineFactory.get_rag_engine_by_type(engine_type)
+        return engine_class(
+            config=self._engine_config(engine_type),
+            chunk_generator=chunk_generator,
+            embedding_model=model,
+        )
+
+    def _run_engine(
+            self,
+            engine_type: RAGEngineType,
+            chunk_generator: ChunkGenerator,
+            model: TextEncoder,
+            queries: list[str],
+            chunks_count: int
+    ) -> None:
+        prefix = engine_type.value
+        builder = self._create_engine(engine_type, chunk_generator, model)
+        _, stage = _measure(f"{prefix}.build_index", builder.build_index, lambda _: chunks_count, "чанков")
+        self._add(stage)
+
+        # Загрузка - новым экземпляром движка, как при перезапуске приложения
+        engine = self._create_engine(engine_type, chunk_generator, model)
+        loaded, stage = _measure(f"{prefix}.load_index", engine.load_index, lambda _: chunks_count, "чанков")
+        self._add(stage)
+        if not loaded:
+            raise RuntimeError(f"{prefix}: сохранённый индекс не загрузился")
+
+        # Первый запрос платит за ленивую инициализацию, в задержки он не входит
+        engine.search(queries[0])
+
+        def search_each() -> list[float]:
+            latencies = []
+            for query in queries:
+                start_time = time.perf_counter()
+                engine.search(query)
+                latencies.append(time.perf_counter() - start_time)
+            return latencies
+
+        latencies, stage = _measure(f"{prefix}.retrieve", search_each, len, "запросов")
+        stage.latency_ms = latency_stats(latencies)
+        self._add(stage)
+
+        _, stage = _measure(
+            f"{prefix}.retrieve_many", lambda: engine.retrieve_many(queries), len, "запросов"
+        )
+        self._add(stage)
+
+    def run(self) -> dict[str, Any]:
+        config = self.config
+        corpus_dir = self.work_dir / "corpus"
+        files = generate_corpus(config.corpus, corpus_dir)
+        corpus_mb = sum(file.stat().st_size for file in files) / _MB
+
+        local_manager = LocalManager(dir_path=corpus_dir, parse_workers=config.parse_workers)
+        chunk_generator = ChunkGenerator(
+            local_manager=local_manager, chunk_size=config.chunk_size, overlap=config.overlap
+        )
+        docs, stage = _measure("parse", local_manager.get_documents_data, len, "документов")
+        self._add(stage)
+        chunks, stage = _measure("chunk", lambda: chunk_generator.chunk_documents(docs), len, "чанков")
+        self._add(stage)
+        if not chunks:
+            raise RuntimeError("В синтетическом корпусе не нашлось текста")
+
+        model, stage = _measure(
+            "load_model",
+            lambda: create_embedding_model(
+                backend=config.embedding_backend,
+                model_name=config.embedding_model,
+                models_dir=config.onnx_models_dir
+            ),
+            lambda _: 1,
+            "моделей"
+        )
+        self._add(stage)
+        texts = [chunk["text"] for chunk in chunks]
+        _, stage = _measure(
+            "embed", lambda: model.encode(texts, batch_size=config.embedding_batch_size), len, "чанков"
+        )
+        self._add(stage)
+
+        queries = _make_queries(chunks, max(config.queries, 1), config.corpus.seed)
+        for engine_type in config.engines:
+            try:
+                self._run_engine(engine_type, chunk_generator, model, queries, len(chunks))
+            except ImportError as e:
+                print(f"{engine_type.value}: пропущен, не установлен пакет: {e.name}")
+                self.skipped[engine_type.value] = f"не установлен пакет {e.name}"
+
+        return {
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": psutil.cpu_count(),
+                "config": config.model_dump(mode="json"),
+                "corpus_mb": corpus_mb,
+                "documents": len(docs),
+                "chunks": len(chunks),
+                "skipped": self.skipped,
+            },
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+
+def compare_reports(
+        current: dict[str, Any],
+        baseline: dict[str, Any],
+        tolerance: float = 0.2
+) -> list[Regression]:
+    """
+    Этапы, ставшие медленнее базового отчёта больше чем на tolerance:
+    у поиска сравнивается p95 задержки, у остальных этапов - длительность.
+    Пик памяти сравнивается у всех этапов. Этапы, которых нет в одном из отчётов, пропускаются.
+    """
+    regressions = []
+    for name, stage in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        metrics = [("peak_rss_mb", base["peak_rss_mb"], stage["peak_rss_mb"])]
+        if stage.get("latency_ms") and base.get("latency_ms"):
+            metrics.append(("latency_p95_ms", base["latency_ms"]["p95"], stage["latency_ms"]["p95"]))
+        else:
+            metrics.append(("seconds", base["seconds"], stage["seconds"]))
+        for metric, base_value, value in metrics:
+            if value > base_value * (1 + tolerance):
+                regressions.append(Regression(stage=name, metric=metric, baseline=base_value, current=value))
+    return regressions
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [f"{'Этап':<30}{'сек':>10}{'в сек':>12}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'пик RSS МБ':>12}"]
+    for name, stage in report["stages"].items():
+        latency = stage.get("latency_ms") or {}
+        percentiles = "".join(
+            f"{latency[key]:>10.2f}" if key in latency else f"{'-':>10}" for key in ("p50", "p95", "p99")
+        )
+        lines.append(
+            f"{name:<30}{stage['seconds']:>10.3f}{stage['throughput']:>12.1f}"
+            f"{percentiles}{stage['peak_rss_mb']:>12.1f}"
+        )
+    return "\n".join(lines)
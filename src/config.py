@@ -1,34 +1,62 @@
 from pathlib import Path
 from typing import Optional
 from pydantic_settings import BaseSettings
-from src.api_clients.base import LLMChoice
-from src.api_clients.mistral_api_client import ModelsEnum
-from src.api_clients.ollama_api_client import OllamaModelsEnum
-from src.services.retrieval.rag_engine import EmbeddingModel
+from src.api_clients.base import LLMChoice, ModelsEnum, OllamaModelsEnum
+from src.services.retrieval.base import EmbeddingModel
+from src.services.retrieval.chunk_generator import ChunkerType
+from src.services.retrieval.embedding_backend import EmbeddingBackend
+from src.services.retrieval.faiss_index import FAISSIndexType
+from src.services.retrieval.rag_engine import ChromaClientType, RetrievalMode, ShardingMode
 from src.types_.base_types import ChunkSize
 from src.utils.prompt_manager import PromptTypes
 
 
 INDEX_DIR = Path("faiss_index")
 INDEX_FILE = INDEX_DIR / "index.faiss"
-DOCS_FILE = INDEX_DIR / "documents.pkl"
+DOCS_DIR = INDEX_DIR / "documents"
+MANIFEST_FILE = INDEX_DIR / "manifest.json"
+BM25_DIR = INDEX_DIR / "bm25"
+EMBEDDING_CACHE_DIR = Path("embedding_cache")
+ONNX_MODELS_DIR = Path("onnx_models")
+ANSWER_CACHE_DIR = Path("answer_cache")
 
 
 class Settings(BaseSettings):
     NOTES_DIR: str
+    PARSE_WORKERS: int = 1
     CHUNK_SIZE: ChunkSize
     OVERLAP: int
+    CHUNKER: ChunkerType = ChunkerType.CHARS
+    CHUNK_TOKENS: Optional[int] = None
+    CHUNK_OVERLAP_TOKENS: int = 32
+    DEDUP_ENABLED: bool = False
+    DEDUP_THRESHOLD: float = 0.8
     PROMPT_TYPE: PromptTypes
 
     LLM_TYPE: LLMChoice
+    LLM_STREAM: bool = False
+    LLM_POOL_SIZE: int = 10
+    LLM_TIMEOUT: float = 120.0
+    LLM_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_WARMUP: bool = True
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_SIZE: int = 1000
+    ANSWER_CACHE_TTL: Optional[float] = None
+    WARMUP_IN_BACKGROUND: bool = True
 
     EMBEDDING_MODEL: EmbeddingModel
+    EMBEDDING_BACKEND: EmbeddingBackend = EmbeddingBackend.TORCH
+    EMBEDDING_ONNX_THREADS: int = 0
+    EMBEDDING_CACHE_ENABLED: bool = True
 
     OLLAMA_BASE_URL: str
     OLLAMA_MODEL: OllamaModelsEnum
     OLLAMA_NUM_CTX: int = 8192
     OLLAMA_TEMPERATURE: float = 0.0
     OLLAMA_NUM_PREDICT: int = 500
+    OLLAMA_KEEP_ALIVE: Optional[str] = None
+    OLLAMA_REUSE_CONTEXT: bool = False
 
     CHROMA_DIR_PATH: str
     CHROMA_COLLECTION_NAME: str
@@ -37,8 +65,44 @@ class Settings(BaseSettings):
     CHROMA_PERSIST_DIRECTORY: Optional[str] = None
     CHROMA_ALLOW_RESET: bool = False
     CHROMA_ANONYMIZED_TELEMETRY: bool = False
+    CHROMA_CLIENT_TYPE: ChromaClientType = ChromaClientType.PERSISTENT
+    CHROMA_UPSERT_BATCH_SIZE: int = 1000
 
     RETRIEVAL_K: int
+    RETRIEVAL_MODE: RetrievalMode = RetrievalMode.DENSE
+    RETRIEVAL_FUSION_CANDIDATES: int = 20
+    RETRIEVAL_WORKERS: int = 4
+    RETRIEVAL_MAX_DISTANCE: Optional[float] = None
+    CONTEXT_MAX_TOKENS: Optional[int] = None
+    CONTEXT_RESERVE_TOKENS: int = 64
+    CONTEXT_TOKENIZER_FILE: Optional[str] = None
+    QUERY_BATCH_MAX_SIZE: int = 32
+    QUERY_BATCH_MAX_WAIT_MS: float = 5.0
+
+    SERVER_HOST: str = "127.0.0.1"
+    SERVER_PORT: int = 8080
+    METRICS_FILE: Optional[str] = None
+    PROFILE_ENABLED: bool = False
+    PROFILE_DIR: str = "profiles"
+    PROFILE_TOP: int = 20
+    PROFILE_MEMORY: bool = True
+    QUERY_CACHE_SIZE: int = 1024
+    QUERY_CACHE_TTL: Optional[float] = None
+
+    FAISS_INDEX_TYPE: FAISSIndexType = FAISSIndexType.FLAT
+    FAISS_NLIST: int = 1024
+    FAISS_NPROBE: int = 16
+    FAISS_PQ_M: int = 16
+    FAISS_PQ_NBITS: int = 8
+    FAISS_HNSW_M: int = 32
+    FAISS_EF_CONSTRUCTION: int = 40
+    FAISS_EF_SEARCH: int = 64
+    FAISS_TRAIN_SAMPLE_SIZE: int = 50_000
+    FAISS_SHARDING: ShardingMode = ShardingMode.FOLDER
+    FAISS_NUM_SHARDS: int = 4
+    FAISS_SHARD_WORKERS: int = 4
+
+    EMBEDDING_BATCH_SIZE: int = 256
 
     MISTRAL_API_TOKEN: str
     MISTRAL_MODEL: ModelsEnum
@@ -15,4 +15,15 @@ class BaseUseCase(ABC, Generic[DataTypeVar]):
 
     @abstractmethod
     def execute(self):
-        ...
\ No newline at end of file
+        ...
+
+
+class BaseAsyncUseCase(ABC, Generic[DataTypeVar]):
+
+    def __init__(self, app: AppContainer, data: DataTypeVar):
+        self._app = app
+        self._data = data
+
+    @abstractmethod
+    async def execute(self):
+        ...
@@ -1,25 +1,106 @@
-from typing import Type
-from src.controllers.base import BaseUseCase
-from src.controllers.use_cases.create_chunks import LoadIndex
-from src.controllers.use_cases.get_request import RequestUseCase
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import time
+from typing import Any, Type
+from src.controllers.base import BaseAsyncUseCase, BaseUseCase
+from src.controllers.use_cases.create_chunks import LoadIndex, RebuildShard
+from src.controllers.use_cases.get_request import (
+    AsyncRequestUseCase,
+    AsyncRetrieveUseCase,
+    RequestUseCase,
+    StreamRequestUseCase,
+)
+from src.controllers.use_cases.warm_up import WarmUp
 from src.init.init_app import AppContainer
+from src.utils.metrics import metrics
 
 
 class Controller:
     
     def __init__(self, app: AppContainer):
         self.app = app
+        self._ready: Future | None = None
     
     def _execute(self, use_case: Type[BaseUseCase], data=None):
-        use_case(app=self.app, data=data).execute()
+        profiler = self.app.profiler
+        if profiler is None:
+            use_case(app=self.app, data=data).execute()
+            return
+        title = use_case.__name__ if data is None else f"{use_case.__name__}: {data}"
+        with profiler.profile(use_case.__name__, title=title):
+            use_case(app=self.app, data=data).execute()
+
+    async def _execute_async(self, use_case: Type[BaseAsyncUseCase], data=None):
+        # Асинхронные сценарии не профилируются: одновременные запросы смешались бы в одном профиле
+        return await use_case(app=self.app, data=data).execute()
     
-    def startup(self):
+    def _warm_up(self):
+        start_time = time.perf_counter()
         self._execute(
             use_case=LoadIndex
         )
+        self._execute(
+            use_case=WarmUp
+        )
+        print(f"Сервис готов к работе за {time.perf_counter() - start_time:.2f} сек")
+
+    def startup(self, background: bool = False):
+        """
+        Загружает индекс и прогревает модели.
+        В фоновом режиме сразу возвращает управление, а запросы ждут окончания загрузки.
+        """
+        if not background:
+            self._warm_up()
+            return
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm-up")
+        self._ready = executor.submit(self._warm_up)
+        executor.shutdown(wait=False)
+        print("Загрузка индекса и прогрев моделей запущены в фоне")
+
+    def _wait_ready(self):
+        if self._ready is None:
+            return
+        if not self._ready.done():
+            print("Ожидание загрузки индекса...")
+        self._ready.result()
+
+    async def _wait_ready_async(self):
+        if self._ready is not None:
+            await asyncio.wrap_future(self._ready)
+
+    def shutdown(self):
+        self.app.close()
+
+    async def shutdown_async(self):
+        await self.app.aclose()
+
+    def stats(self) -> dict[str, Any]:
+        """Метрики этапов и токенов LLM и статистика кэшей"""
+        return {**metrics.to_dict(), "caches": self.app.cache_stats()}
+
+    def rebuild_shard(self, name: str):
+        self._execute(
+            use_case=RebuildShard,
+            data=name
+        )
 
-    def get_answer(self, question: str):
+    def get_answer(self, question: str, stream: bool = False):
+        self._wait_ready()
         self._execute(
-            use_case=RequestUseCase,
+            use_case=StreamRequestUseCase if stream else RequestUseCase,
             data=question
-        )
\ No newline at end of file
+        )
+
+    async def get_answer_async(self, question: str) -> str:
+        await self._wait_ready_async()
+        return await self._execute_async(
+            use_case=AsyncRequestUseCase,
+            data=question
+        )
+
+    async def retrieve_async(self, query: str) -> str:
+        await self._wait_ready_async()
+        return await self._execute_async(
+            use_case=AsyncRetrieveUseCase,
+            data=query
+        )
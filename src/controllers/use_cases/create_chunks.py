@@ -1,8 +1,27 @@
 from src.controllers.base import BaseUseCase
+from src.services.retrieval.base import RAGEngineType
+from src.services.retrieval.rag_engine import ShardedFAISSRAGEngine
 
 
 class LoadIndex(BaseUseCase[None]):
 
     def execute(self):
         engine = self._app.engine
-        engine.load_or_build_index()
\ No newline at end of file
+        engine.load_or_build_index()
+        answer_cache = self._app.answer_cache
+        if answer_cache is not None:
+            answer_cache.invalidate(engine.index_version)
+
+
+class RebuildShard(BaseUseCase[str]):
+    """Перестройка одного шарда индекса faiss_sharded, остальные шарды не переиндексируются"""
+
+    def execute(self):
+        engine = self._app.engine
+        if not isinstance(engine, ShardedFAISSRAGEngine):
+            print(f"Перестройка шарда доступна только для RAG_ENGINE_TYPE={RAGEngineType.FAISS_SHARDED.value}")
+            return
+        engine.rebuild_shard(self._data)
+        answer_cache = self._app.answer_cache
+        if answer_cache is not None:
+            answer_cache.invalidate(engine.index_version)
@@ -1,15 +1,183 @@
-from src.controllers.base import BaseUseCase
+import asyncio
+import time
+
+import numpy as np
+
+from src.api_clients.base import Prompt
+from src.controllers.base import BaseAsyncUseCase, BaseUseCase
+from src.init.init_app import AppContainer
+from src.services.answer_cache.answer_cache import AnswerCacheEntry, AnswerCacheKey
+from src.services.retrieval.base import SearchHit, format_chunks
+from src.services.retrieval.context_packer import PackedContext
 from src.types_.base_types import UserQuestion
+from src.utils.metrics import format_spans, metrics
+
+
+@metrics.timed("request.build_prompt")
+def build_prompt(app: AppContainer, question: UserQuestion, hits: list[SearchHit]) -> tuple[Prompt, PackedContext]:
+    """
+    Промпт с найденными чанками, уложенными в контекстное окно LLM, и результат упаковки.
+    Не вошедшие в контекст чанки считаются в метриках, печатает отчёт только CLI
+    """
+    prompt_manager_class = app.prompt_manager_class
+    packer = app.context_packer
+    packed = packer.pack(hits, prompt_tokens=packer.count(prompt_manager_class(question=question).result.text))
+    if packed.dropped_by_distance:
+        metrics.inc("rag_context_dropped_chunks_total", len(packed.dropped_by_distance), reason="distance")
+    if packed.dropped_by_budget:
+        metrics.inc("rag_context_dropped_chunks_total", len(packed.dropped_by_budget), reason="budget")
+    return prompt_manager_class(question=question, context=packed.context).result, packed
+
+
+def _answer_cache_key(app: AppContainer) -> AnswerCacheKey:
+    return AnswerCacheKey(
+        prompt_type=app.settings.PROMPT_TYPE.value,
+        llm_model=app.llm_client.model_name,
+        index_version=app.engine.index_version
+    )
+
+
+def find_cached_answer(
+        app: AppContainer,
+        question: UserQuestion,
+        embedding: np.ndarray | None = None
+) -> AnswerCacheEntry | None:
+    """Ответ на похожий вопрос из кэша ответов, если кэш включён. embedding - уже посчитанный эмбеддинг вопроса"""
+    answer_cache = app.answer_cache
+    if answer_cache is None:
+        return None
+    with metrics.span("request.answer_cache"):
+        if embedding is None:
+            embedding = app.engine.embed_query(question)
+        entry = answer_cache.get(_answer_cache_key(app), embedding)
+    if entry is None:
+        return None
+    metrics.inc("rag_answer_cache_hits_total")
+    return entry
+
+
+def cache_answer(app: AppContainer, question: UserQuestion, answer: str, embedding: np.ndarray | None = None) -> None:
+    answer_cache = app.answer_cache
+    if answer_cache is not None:
+        if embedding is None:
+            # Эмбеддинг вопроса берётся из кэша запросов движка
+            embedding = app.engine.embed_query(question)
+        answer_cache.set(_answer_cache_key(app), question, embedding, answer)
 
 
 class RequestUseCase(BaseUseCase[UserQuestion]):
-    
-    def execute(self):
+    """Ответ на вопрос в CLI. После ответа печатается, сколько заняли этапы запроса"""
+
+    def _build_prompt(self) -> Prompt:
         question = self._data
         engine = self._app.engine
+        with metrics.span("request.search"):
+            hits = engine.search(question)
+        prompt, packed = build_prompt(self._app, question, hits)
+        if packed.report:
+            print(packed.report)
+        return prompt
+
+    def _print_cached_answer(self) -> bool:
+        """Печатает ответ из кэша ответов, если он там есть"""
+        entry = find_cached_answer(self._app, self._data)
+        if entry is None:
+            return False
+        print(f"Ответ из кэша на вопрос: {entry.question}")
+        print(entry.answer)
+        return True
+
+    def execute(self):
+        with metrics.trace() as spans:
+            with metrics.span("request"):
+                self._answer()
+        print(f"Этапы запроса: {format_spans(spans)}")
+
+    def _answer(self):
+        if self._print_cached_answer():
+            return
         llm_client = self._app.llm_client
-        prompt_manager_class = self._app.prompt_manager_class
-        context = engine.retrieve(question)
-        prompt = prompt_manager_class(question=question, context=context).result
+        prompt = self._build_prompt()
         answer = llm_client.send_request(prompt)
-        print(answer)
\ No newline at end of file
+        print(answer)
+        cache_answer(self._app, self._data, answer)
+
+
+class StreamRequestUseCase(RequestUseCase):
+    """Печатает ответ LLM по мере генерации и сообщает время до первого токена"""
+
+    def _answer(self):
+        if self._print_cached_answer():
+            return
+        llm_client = self._app.llm_client
+        prompt = self._build_prompt()
+
+        start_time = time.perf_counter()
+        first_token_time = None
+        tokens = []
+        with metrics.span("llm.stream_request"):
+            for token in llm_client.stream_request(prompt):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                tokens.append(token)
+                print(token, end="", flush=True)
+        end_time = time.perf_counter()
+        print()
+        cache_answer(self._app, self._data, "".join(tokens))
+
+        if first_token_time is not None:
+            metrics.observe("llm_time_to_first_token_seconds", first_token_time - start_time)
+            print(f"Время до первого токена: {first_token_time - start_time:.2f} сек")
+        print(f"Время выполнения запроса: {end_time - start_time:.2f} сек")
+
+
+class AsyncRetrieveUseCase(BaseAsyncUseCase[UserQuestion]):
+    """
+    Асинхронный поиск контекста. Одновременные запросы объединяются в пакеты,
+    которые эмбеддятся и ищутся одним вызовом search_many в пуле потоков.
+    """
+
+    async def execute(self) -> str:
+        with metrics.span("retrieve"):
+            hits = await self._app.query_batcher.submit(self._data)
+        return format_chunks([hit.chunk for hit in hits])
+
+
+class AsyncRequestUseCase(BaseAsyncUseCase[UserQuestion]):
+    """
+    Асинхронный запрос: поиск выполняется пакетно в пуле потоков,
+    запрос к LLM - без блокировки цикла событий. Возвращает ответ LLM.
+    """
+
+    async def _build_prompt(self) -> Prompt:
+        question = self._data
+        # Включает ожидание пакета в MicroBatcher
+        with metrics.span("request.search"):
+            hits = await self._app.query_batcher.submit(question)
+        # Токенизация контекста упаковщиком не должна блокировать цикл событий
+        loop = asyncio.get_running_loop()
+        prompt, _ = await loop.run_in_executor(self._app.retrieval_executor, build_prompt, self._app, question, hits)
+        return prompt
+
+    async def execute(self) -> str:
+        with metrics.span("request"):
+            return await self._answer()
+
+    async def _answer(self) -> str:
+        loop = asyncio.get_running_loop()
+        # Эмбеддинг вопроса и поиск по кэшу ответов не должны блокировать цикл событий
+        executor = self._app.retrieval_executor
+        embedding = None
+        if self._app.answer_cache is not None:
+            # Вопросы одновременных запросов эмбеддятся одним пакетом
+            embedding = await self._app.embedding_batcher.submit(self._data)
+            entry = await loop.run_in_executor(
+                executor, find_cached_answer, self._app, self._data, embedding
+            )
+            if entry is not None:
+                return entry.answer
+        llm_client = self._app.llm_client
+        prompt = await self._build_prompt()
+        answer = await llm_client.send_request_async(prompt)
+        await loop.run_in_executor(executor, cache_answer, self._app, self._data, answer, embedding)
+        return answer
@@ -0,0 +1,10 @@
+from src.controllers.base import BaseUseCase
+
+
+class WarmUp(BaseUseCase[None]):
+    """Прогрев модели эмбеддингов и LLM, чтобы первый запрос пользователя не ждал их загрузки"""
+
+    def execute(self):
+        self._app.engine.warm_up()
+        if self._app.settings.LLM_WARMUP:
+            self._app.llm_client.warm_up()
@@ -1,98 +1,312 @@
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+import json
 from pathlib import Path
-from typing import Type
+from typing import Any, Type
 
-from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
+import numpy as np
 
 from src.api_clients.base import BaseLLMClient, LLMChoice
 from src.api_clients.factory import ApiClientFactory
-from src.api_clients.ollama_api_client import OllamaInitModel
-from src.config import DOCS_FILE, INDEX_DIR, INDEX_FILE, settings
+from src.config import (
+    ANSWER_CACHE_DIR,
+    BM25_DIR,
+    DOCS_DIR,
+    EMBEDDING_CACHE_DIR,
+    INDEX_DIR,
+    INDEX_FILE,
+    MANIFEST_FILE,
+    ONNX_MODELS_DIR,
+    Settings,
+    settings,
+)
 
-from src.services.retrieval.base import BaseRetrievalConfig, RAGEngineBase, RAGEngineType
-from src.services.retrieval.chunk_generator import ChunkGenerator
-from src.services.retrieval.rag_engine import ChromaRAGConfig, FAISSRAGConfig, RagEngineFactory
+from src.services.answer_cache.answer_cache import AnswerCache
+from src.services.retrieval.base import RAGEngineBase, RAGEngineType, SearchHit
+from src.services.retrieval.chunk_generator import ChunkerType, ChunkGenerator, TokenChunkGenerator
+from src.services.retrieval.context_packer import ContextBudget, ContextPacker, tokenizer_counter
+from src.services.retrieval.dedup import DedupParams
+from src.services.retrieval.embedding_backend import (
+    EmbeddingBackend,
+    EmbeddingParams,
+    create_embedding_model,
+    get_fast_tokenizer,
+)
+from src.services.retrieval.embedding_cache import EmbeddingCache, TextEncoder
+from src.services.retrieval.faiss_index import FAISSIndexParams
+from src.services.retrieval.rag_engine import RagEngineFactory
 
-from src.api_clients.mistral_api_client import MistralClient, MistralInitData
+from src.server.batcher import MicroBatcher
 from src.services.local_manger.local_manager import LocalManager
+from src.types_.base_types import UserQuestion
+from src.utils.locked_cached_property import locked_cached_property
+from src.utils.metrics import metrics
+from src.utils.profiler import UseCaseProfiler
 from src.utils.prompt_manager import BasePromptManager, PromptFactory
 
 
-__local_manager = LocalManager(dir_path=Path(settings.NOTES_DIR))
-__embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL.value)
-__chunk_generator = ChunkGenerator(
-    local_manager=__local_manager,
-    chunk_size=settings.CHUNK_SIZE,
-    overlap=settings.OVERLAP
-)
+def get_rag_engine_init_data(settings: Settings) -> dict[RAGEngineType, dict[str, Any]]:
+    """Параметры конфигов движков, конфиг создаётся только для выбранного движка"""
+    dedup = DedupParams(enabled=settings.DEDUP_ENABLED, threshold=settings.DEDUP_THRESHOLD)
+    embedding = EmbeddingParams(model=settings.EMBEDDING_MODEL.value, backend=settings.EMBEDDING_BACKEND)
+    init_data = {
+        RAGEngineType.CHROMADB: dict(
+            db_dir=Path(settings.CHROMA_DIR_PATH),
+            collection_name=settings.CHROMA_COLLECTION_NAME,
+            host=settings.CHROMA_DB_HOST,
+            port=settings.CHROMA_DB_PORT,
+            persist_directory=settings.CHROMA_PERSIST_DIRECTORY,
+            allow_reset=settings.CHROMA_ALLOW_RESET,
+            anonymized_telemetry=settings.CHROMA_ANONYMIZED_TELEMETRY,
+            client_type=settings.CHROMA_CLIENT_TYPE,
+            upsert_batch_size=settings.CHROMA_UPSERT_BATCH_SIZE,
+            retrieval_k=settings.RETRIEVAL_K,
+            embedding_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            query_cache_size=settings.QUERY_CACHE_SIZE,
+            query_cache_ttl=settings.QUERY_CACHE_TTL,
+            dedup=dedup,
+            embedding=embedding
+        ),
+        RAGEngineType.FAISS: dict(
+            index_file=INDEX_FILE,
+            docs_dir=DOCS_DIR,
+            manifest_file=MANIFEST_FILE,
+            bm25_dir=BM25_DIR,
+            index_dir=INDEX_DIR,
+            retrieval_k=settings.RETRIEVAL_K,
+            embedding_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            query_cache_size=settings.QUERY_CACHE_SIZE,
+            query_cache_ttl=settings.QUERY_CACHE_TTL,
+            dedup=dedup,
+            index_params=FAISSIndexParams(
+                index_type=settings.FAISS_INDEX_TYPE,
+                nlist=settings.FAISS_NLIST,
+                pq_m=settings.FAISS_PQ_M,
+                pq_nbits=settings.FAISS_PQ_NBITS,
+                hnsw_m=settings.FAISS_HNSW_M,
+                ef_construction=settings.FAISS_EF_CONSTRUCTION
+            ),
+            train_sample_size=settings.FAISS_TRAIN_SAMPLE_SIZE,
+            nprobe=settings.FAISS_NPROBE,
+            ef_search=settings.FAISS_EF_SEARCH,
+            retrieval_mode=settings.RETRIEVAL_MODE,
+            fusion_candidates=settings.RETRIEVAL_FUSION_CANDIDATES,
+            embedding=embedding
+        )
+    }
+    init_data[RAGEngineType.FAISS_SHARDED] = dict(
+        init_data[RAGEngineType.FAISS],
+        sharding=settings.FAISS_SHARDING,
+        num_shards=settings.FAISS_NUM_SHARDS,
+        shard_workers=settings.FAISS_SHARD_WORKERS
+    )
+    return init_data
 
 
-RAG_ENGINE_INIT_DATA: dict[RAGEngineType, BaseRetrievalConfig] = {
-    RAGEngineType.CHROMADB: ChromaRAGConfig(
-        db_dir=Path(settings.CHROMA_DIR_PATH),
-        collection_name="rag_collection",
-        host=settings.CHROMA_DB_HOST,
-        port=settings.CHROMA_DB_PORT,
-        persist_directory=settings.CHROMA_PERSIST_DIRECTORY,
-        allow_reset=settings.CHROMA_ALLOW_RESET,
-        anonymized_telemetry=settings.CHROMA_ANONYMIZED_TELEMETRY,
-        retrieval_k=settings.RETRIEVAL_K
-    ),
-    RAGEngineType.FAISS: FAISSRAGConfig(
-        index_file=INDEX_FILE,
-        docs_file=DOCS_FILE,
-        index_dir=INDEX_DIR,
-        retrieval_k=settings.RETRIEVAL_K
-    )
-}
-
-def init_rag_client(rag_type: RAGEngineType) -> RAGEngineBase:
-    rag_engine_class = RagEngineFactory.get_rag_engine_by_type(rag_type)
-    return rag_engine_class(
-        config=RAG_ENGINE_INIT_DATA.get(rag_type),
-        chunk_generator=__chunk_generator,
-        embedding_model=__embedding_model,
-    )
+def get_llm_clients_init_data(settings: Settings) -> dict[LLMChoice, dict[str, Any]]:
+    """Параметры LLM-клиентов, init data создаётся только для выбранного клиента"""
+    return {
+        LLMChoice.MISTRAL: dict(
+            api_key=settings.MISTRAL_API_TOKEN,
+            model=settings.MISTRAL_MODEL,
+            pool_size=settings.LLM_POOL_SIZE,
+            timeout=settings.LLM_TIMEOUT,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+        ),
+        LLMChoice.OLLAMA: dict(
+            model=settings.OLLAMA_MODEL,
+            base_url=settings.OLLAMA_BASE_URL,
+            num_ctx=settings.OLLAMA_NUM_CTX,
+            temperature=settings.OLLAMA_TEMPERATURE,
+            num_predict=settings.OLLAMA_NUM_PREDICT,
+            keep_alive=settings.OLLAMA_KEEP_ALIVE,
+            reuse_context=settings.OLLAMA_REUSE_CONTEXT,
+            pool_size=settings.LLM_POOL_SIZE,
+            timeout=settings.LLM_TIMEOUT,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+        )
+    }
 
 
+class AppContainer:
+    """
+    Контейнер зависимостей приложения.
+    Компоненты создаются при первом обращении, поэтому импортируются и загружаются
+    только выбранные движок и LLM-клиент, а модель эмбеддингов - только когда она нужна.
+    """
 
-LLM_CLIENTS_INIT_DATA: dict[LLMChoice, BaseModel] = {
-    LLMChoice.MISTRAL: MistralInitData(
-        api_key=settings.MISTRAL_API_TOKEN,
-        model=settings.MISTRAL_MODEL
-    ),
-    LLMChoice.OLLAMA: OllamaInitModel(
-        model=settings.OLLAMA_MODEL,
-        base_url=settings.OLLAMA_BASE_URL,
-        num_ctx=settings.OLLAMA_NUM_CTX,
-        temperature=settings.OLLAMA_TEMPERATURE,
-        num_predict=settings.OLLAMA_NUM_PREDICT
-    )   
-}
+    def __init__(self, settings: Settings):
+        self.settings = settings
 
-def init_llm_client(llm_type: LLMChoice) -> BaseLLMClient:
-    print(f"Запуск с LLM: {llm_type.value}")
-    llm_client_class = ApiClientFactory.get_client_by_type(llm_type)
-    return llm_client_class(LLM_CLIENTS_INIT_DATA.get(llm_type))
+    @locked_cached_property
+    def local_manager(self) -> LocalManager:
+        return LocalManager(
+            dir_path=Path(self.settings.NOTES_DIR),
+            parse_workers=self.settings.PARSE_WORKERS
+        )
 
+    @locked_cached_property
+    def embedding_model(self) -> TextEncoder:
+        print(f"Эмбеддинги считаются через {self.settings.EMBEDDING_BACKEND.value}")
+        return create_embedding_model(
+            backend=self.settings.EMBEDDING_BACKEND,
+            model_name=self.settings.EMBEDDING_MODEL.value,
+            models_dir=ONNX_MODELS_DIR,
+            threads=self.settings.EMBEDDING_ONNX_THREADS
+        )
 
-@dataclass
-class AppContainer:
-    llm_client: MistralClient
-    engine: RAGEngineBase
-    prompt_manager_class: Type[BasePromptManager]
+    @property
+    def embedding_model_name(self) -> str:
+        model_name = self.settings.EMBEDDING_MODEL.value
+        # Векторы int8-модели отличаются от float-векторов, поэтому кэшируются отдельно
+        if self.settings.EMBEDDING_BACKEND == EmbeddingBackend.ONNX_INT8:
+            model_name += "@int8"
+        return model_name
+
+    @locked_cached_property
+    def embedding_cache(self) -> EmbeddingCache | None:
+        if not self.settings.EMBEDDING_CACHE_ENABLED:
+            return None
+        return EmbeddingCache(cache_dir=EMBEDDING_CACHE_DIR, model_name=self.embedding_model_name)
+
+    @locked_cached_property
+    def answer_cache(self) -> AnswerCache | None:
+        if not self.settings.ANSWER_CACHE_ENABLED:
+            return None
+        return AnswerCache(
+            cache_dir=ANSWER_CACHE_DIR,
+            model_name=self.embedding_model_name,
+            threshold=self.settings.ANSWER_CACHE_THRESHOLD,
+            max_entries=self.settings.ANSWER_CACHE_SIZE,
+            ttl=self.settings.ANSWER_CACHE_TTL
+        )
+
+    @locked_cached_property
+    def chunk_generator(self) -> ChunkGenerator:
+        if self.settings.CHUNKER == ChunkerType.TOKENS:
+            max_seq_length = self.embedding_model.max_seq_length
+            return TokenChunkGenerator(
+                local_manager=self.local_manager,
+                tokenizer=get_fast_tokenizer(self.embedding_model),
+                chunk_size=min(self.settings.CHUNK_TOKENS or max_seq_length, max_seq_length),
+                overlap=self.settings.CHUNK_OVERLAP_TOKENS
+            )
+        return ChunkGenerator(
+            local_manager=self.local_manager,
+            chunk_size=self.settings.CHUNK_SIZE,
+            overlap=self.settings.OVERLAP
+        )
+
+    @locked_cached_property
+    def engine(self) -> RAGEngineBase:
+        rag_type = RAGEngineType(self.settings.RAG_ENGINE_TYPE)
+        rag_engine_class = RagEngineFactory.get_rag_engine_by_type(rag_type)
+        config_data = get_rag_engine_init_data(self.settings)[rag_type]
+        return rag_engine_class(
+            config=rag_engine_class.config_class(**config_data),
+            chunk_generator=self.chunk_generator,
+            embedding_model=self.embedding_model,
+            embedding_cache=self.embedding_cache,
+        )
+
+    @locked_cached_property
+    def llm_client(self) -> BaseLLMClient:
+        llm_type = self.settings.LLM_TYPE
+        print(f"Запуск с LLM: {llm_type.value}")
+        llm_client_class = ApiClientFactory.get_client_by_type(llm_type)
+        init_data = get_llm_clients_init_data(self.settings)[llm_type]
+        return llm_client_class(llm_client_class.init_data_class(**init_data))
+
+    @locked_cached_property
+    def prompt_manager_class(self) -> Type[BasePromptManager]:
+        return PromptFactory.get_prompt_class_by_type(self.settings.PROMPT_TYPE)
+
+    @locked_cached_property
+    def context_packer(self) -> ContextPacker:
+        if self.settings.CONTEXT_TOKENIZER_FILE:
+            from tokenizers import Tokenizer
+
+            tokenizer = Tokenizer.from_file(self.settings.CONTEXT_TOKENIZER_FILE)
+        else:
+            # Токенизатор LLM обычно недоступен локально, длина оценивается токенизатором эмбеддингов
+            tokenizer = get_fast_tokenizer(self.embedding_model)
+        return ContextPacker(
+            count_tokens=tokenizer_counter(tokenizer),
+            budget=ContextBudget(
+                max_prompt_tokens=self.settings.CONTEXT_MAX_TOKENS or self.llm_client.max_prompt_tokens,
+                reserve_tokens=self.settings.CONTEXT_RESERVE_TOKENS,
+                max_distance=self.settings.RETRIEVAL_MAX_DISTANCE
+            )
+        )
+
+    @locked_cached_property
+    def profiler(self) -> UseCaseProfiler | None:
+        if not self.settings.PROFILE_ENABLED:
+            return None
+        return UseCaseProfiler(
+            profile_dir=Path(self.settings.PROFILE_DIR),
+            top=self.settings.PROFILE_TOP,
+            memory=self.settings.PROFILE_MEMORY
+        )
+
+    @locked_cached_property
+    def retrieval_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.settings.RETRIEVAL_WORKERS,
+            thread_name_prefix="retrieval"
+        )
+
+    @locked_cached_property
+    def query_batcher(self) -> MicroBatcher[UserQuestion, list[SearchHit]]:
+        return MicroBatcher(
+            handler=self.engine.search_many,
+            executor=self.retrieval_executor,
+            max_batch_size=self.settings.QUERY_BATCH_MAX_SIZE,
+            max_wait=self.settings.QUERY_BATCH_MAX_WAIT_MS / 1000
+        )
+
+    @locked_cached_property
+    def embedding_batcher(self) -> MicroBatcher[UserQuestion, np.ndarray]:
+        """Пакетный эмбеддинг вопросов для поиска в кэше ответов, эмбеддинги остаются в кэше запросов движка"""
+        return MicroBatcher(
+            handler=self.engine.embed_queries,
+            executor=self.retrieval_executor,
+            max_batch_size=self.settings.QUERY_BATCH_MAX_SIZE,
+            max_wait=self.settings.QUERY_BATCH_MAX_WAIT_MS / 1000
+        )
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        """Счётчики кэшей, которые успели создаться"""
+        stats = {}
+        if "engine" in self.__dict__:
+            stats.update(self.engine.cache_stats())
+        if self.__dict__.get("answer_cache") is not None:
+            stats["answers"] = self.answer_cache.stats()
+        return stats
 
-prompt_manager_class = PromptFactory.get_prompt_class_by_type(settings.PROMPT_TYPE)
+    def dump_metrics(self) -> None:
+        """Сохраняет метрики процесса в METRICS_FILE, если он задан"""
+        if not self.settings.METRICS_FILE:
+            return
+        report = {**metrics.to_dict(), "caches": self.cache_stats()}
+        Path(self.settings.METRICS_FILE).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Метрики сохранены в {self.settings.METRICS_FILE}")
 
+    def close(self) -> None:
+        """Освобождает только те ресурсы, которые успели создаться"""
+        self.dump_metrics()
+        if self.__dict__.get("answer_cache") is not None:
+            # Сохраняет счётчики попаданий, которые не пишутся на диск при каждом чтении
+            self.answer_cache.save()
+        if "llm_client" in self.__dict__:
+            self.llm_client.close()
+        if "retrieval_executor" in self.__dict__:
+            self.retrieval_executor.shutdown(wait=False)
 
-__llm_client = init_llm_client(settings.LLM_TYPE)
+    async def aclose(self) -> None:
+        if "llm_client" in self.__dict__:
+            await self.llm_client.aclose()
+        self.close()
 
-__rag_engine = init_rag_client(settings.RAG_ENGINE_TYPE)
 
 def get_app_container() -> AppContainer:
-    return AppContainer(
-        llm_client=__llm_client,
-        engine=__rag_engine,
-        prompt_manager_class=prompt_manager_class
-    )
\ No newline at end of file
+    return AppContainer(settings=settings)
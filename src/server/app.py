@@ -0,0 +1,138 @@
+import asyncio
+import json
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from src.utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from src.controllers.core import Controller
+
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class RAGServer:
+    """
+    ASGI-приложение поверх Controller.
+
+    - GET  /health - проверка готовности;
+    - GET  /metrics - метрики в текстовом формате Prometheus;
+    - GET  /stats - метрики и статистика кэшей в JSON;
+    - POST /retrieve {"query": "..."} - найденный контекст;
+    - POST /ask {"question": "..."} - ответ LLM.
+    Одновременные запросы к /retrieve и /ask объединяются в пакеты поиска.
+    """
+
+    def __init__(self, controller: "Controller"):
+        self._controller = controller
+        self._routes: dict[tuple[str, str], Callable[[dict[str, Any]], Awaitable[dict[str, Any]]]] = {
+            ("GET", "/health"): self._health,
+            ("GET", "/stats"): self._stats,
+            ("POST", "/retrieve"): self._retrieve,
+            ("POST", "/ask"): self._ask,
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.to_thread(self._controller.startup)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self._controller.shutdown_async()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope["method"], scope["path"]) == ("GET", "/metrics"):
+            await self._send(send, 200, metrics.to_prometheus().encode("utf-8"), b"text/plain; version=0.0.4")
+            return
+        try:
+            handler = self._routes.get((scope["method"], scope["path"]))
+            if handler is None:
+                if any(path == scope["path"] for _, path in self._routes):
+                    raise HTTPError(405, "Метод не поддерживается")
+                raise HTTPError(404, "Не найдено")
+            body = await self._read_json(receive) if scope["method"] == "POST" else {}
+            status, payload = 200, await handler(body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": e.message}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+        await self._send_json(send, status, payload)
+
+    @staticmethod
+    async def _read_json(receive: Receive) -> dict[str, Any]:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "Тело запроса должно быть JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Тело запроса должно быть JSON-объектом")
+        return data
+
+    @staticmethod
+    async def _send(send: Send, status: int, body: bytes, content_type: bytes) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @classmethod
+    async def _send_json(cls, send: Send, status: int, payload: dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await cls._send(send, status, body, b"application/json; charset=utf-8")
+
+    @staticmethod
+    def _get_text(body: dict[str, Any], field: str) -> str:
+        value = body.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise HTTPError(400, f"Поле {field} должно быть непустой строкой")
+        return value.strip()
+
+    async def _health(self, body: dict[str, Any]) -> dict[str, Any]:
+        return {"status": "ok"}
+
+    async def _stats(self, body: dict[str, Any]) -> dict[str, Any]:
+        return self._controller.stats()
+
+    async def _retrieve(self, body: dict[str, Any]) -> dict[str, Any]:
+        query = self._get_text(body, "query")
+        return {"context": await self._controller.retrieve_async(query)}
+
+    async def _ask(self, body: dict[str, Any]) -> dict[str, Any]:
+        question = self._get_text(body, "question")
+        return {"answer": await self._controller.get_answer_async(question)}
+
+
+def serve(controller: "Controller", host: str, port: int) -> None:
+    import uvicorn
+
+    uvicorn.run(RAGServer(controller), host=host, port=port, lifespan="on")
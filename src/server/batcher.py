@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, Generic, TypeVar
+
+
+ItemTypeVar = TypeVar("ItemTypeVar")
+ResultTypeVar = TypeVar("ResultTypeVar")
+
+
+class MicroBatcher(Generic[ItemTypeVar, ResultTypeVar]):
+    """
+    Собирает одновременные запросы в пакеты и обрабатывает каждый пакет одним вызовом handler
+    в пуле потоков. Пакет отправляется, когда в нём набралось max_batch_size элементов
+    или с момента прихода первого элемента прошло max_wait секунд.
+    """
+
+    def __init__(
+            self,
+            handler: Callable[[list[ItemTypeVar]], list[ResultTypeVar]],
+            executor: Executor,
+            max_batch_size: int,
+            max_wait: float
+    ):
+        self._handler = handler
+        self._executor = executor
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max_wait
+        self._pending: list[tuple[ItemTypeVar, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    async def submit(self, item: ItemTypeVar) -> ResultTypeVar:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self._max_batch_size or self._max_wait <= 0:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        loop = asyncio.get_running_loop()
+        done = loop.run_in_executor(self._executor, self._handler, [item for item, _ in batch])
+        done.add_done_callback(lambda task: self._resolve(batch, task))
+
+    @staticmethod
+    def _resolve(batch: list[tuple[ItemTypeVar, asyncio.Future]], task: asyncio.Future) -> None:
+        if task.cancelled():
+            error: BaseException | None = asyncio.CancelledError()
+        else:
+            error = task.exception()
+        results = task.result() if error is None else [None] * len(batch)
+        for (_, future), result in zip(batch, results):
+            # Клиент мог отключиться и отменить ожидание
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
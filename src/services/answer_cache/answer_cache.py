@@ -0,0 +1,199 @@
+import json
+from pathlib import Path
+from threading import Lock
+import time
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.types_.base_types import UserQuestion
+
+
+_ENTRIES_FILE = "entries.jsonl"
+_VECTORS_FILE = "vectors.f32"
+_META_FILE = "meta.json"
+
+
+class AnswerCacheKey(BaseModel, frozen=True):
+    """Ответ переиспользуется только для того же типа промпта, той же LLM и той же версии индекса"""
+    prompt_type: str
+    llm_model: str
+    index_version: str
+
+
+class AnswerCacheEntry(BaseModel):
+    key: AnswerCacheKey
+    question: UserQuestion
+    answer: str
+    created_at: float
+    last_hit_at: float
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    Персистентный семантический кэш ответов LLM.
+
+    Для каждой модели эмбеддингов заводится своя директория, в ней:
+    - entries.jsonl - вопросы, ответы и ключи записей, по записи в строке;
+    - vectors.f32 - подряд записанные нормированные float32 эмбеддинги вопросов в том же порядке;
+    - meta.json - размерность эмбеддингов.
+    Векторы записей лежат одной матрицей в памяти, поиск - скалярным произведением
+    с эмбеддингом запроса среди записей того же ключа. Ответ возвращается,
+    если косинусное сходство вопросов не меньше threshold.
+    При переполнении вытесняются давно не использованные записи,
+    записи других версий индекса удаляются в invalidate.
+    Как и в EmbeddingCache, новая запись дописывается в конец файлов. Вытесненные записи
+    остаются в файлах до сжатия, которое переписывает файлы целиком: в save, в invalidate
+    и когда записей в файлах становится вдвое больше max_entries.
+    """
+
+    def __init__(
+            self,
+            cache_dir: Path,
+            model_name: str,
+            threshold: float = 0.95,
+            max_entries: int = 1000,
+            ttl: float | None = None
+    ):
+        self._dir = cache_dir / model_name.replace("/", "__")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries: list[AnswerCacheEntry] = []
+        self._vectors = np.empty((0, 0), dtype="float32")
+        # Сколько записей в файлах, включая вытесненные
+        self._stored = 0
+        self._load()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self) -> None:
+        entries_file = self._dir / _ENTRIES_FILE
+        vectors_file = self._dir / _VECTORS_FILE
+        meta_file = self._dir / _META_FILE
+        if not entries_file.exists() or not vectors_file.exists() or not meta_file.exists():
+            return
+        dim = json.loads(meta_file.read_text(encoding="utf-8"))["dim"]
+        vectors = np.fromfile(vectors_file, dtype="float32")
+        vectors = vectors[:len(vectors) // dim * dim].reshape(-1, dim)
+        entries: list[AnswerCacheEntry] = []
+        with open(entries_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(AnswerCacheEntry.model_validate_json(line))
+                except ValueError:
+                    # Запись прервалась на середине строки
+                    break
+        # Вектор пишется раньше записи, поэтому учитываются только записи, у которых есть оба
+        count = min(len(entries), len(vectors))
+        self._entries, self._vectors = entries[:count], np.array(vectors[:count])
+        self._stored = count
+        self._evict()
+        if count != len(entries) or count != len(vectors) or len(self._entries) != count:
+            self._compact()
+
+    def save(self) -> None:
+        """Сжимает файлы и сохраняет счётчики попаданий, которые не пишутся на диск при каждом чтении"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Переписывает файлы текущими записями"""
+        self._dir.mkdir(parents=True, exist_ok=True)
+        tmp_vectors = self._dir / (_VECTORS_FILE + ".tmp")
+        tmp_entries = self._dir / (_ENTRIES_FILE + ".tmp")
+        tmp_vectors.write_bytes(np.ascontiguousarray(self._vectors, dtype="float32").tobytes())
+        tmp_entries.write_text(
+            "".join(entry.model_dump_json() + "\n" for entry in self._entries), encoding="utf-8"
+        )
+        (self._dir / _META_FILE).write_text(json.dumps({"dim": self._vectors.shape[1]}), encoding="utf-8")
+        tmp_vectors.replace(self._dir / _VECTORS_FILE)
+        tmp_entries.replace(self._dir / _ENTRIES_FILE)
+        self._stored = len(self._entries)
+
+    def _append(self, entry: AnswerCacheEntry, vector: np.ndarray) -> None:
+        if self._stored == 0:
+            self._compact()
+            return
+        with open(self._dir / _VECTORS_FILE, "ab") as f:
+            f.write(np.ascontiguousarray(vector, dtype="float32").tobytes())
+        with open(self._dir / _ENTRIES_FILE, "a", encoding="utf-8") as f:
+            f.write(entry.model_dump_json() + "\n")
+        self._stored += 1
+
+    def _evict(self) -> None:
+        """Вытесняет давно не использованные записи сверх max_entries"""
+        if len(self._entries) <= self.max_entries:
+            return
+        order = np.argsort([entry.last_hit_at for entry in self._entries], kind="stable")
+        mask = np.ones(len(self._entries), dtype=bool)
+        mask[order[:len(self._entries) - self.max_entries]] = False
+        self._keep(mask)
+
+    def _keep(self, mask: np.ndarray) -> None:
+        self._entries = [entry for entry, keep in zip(self._entries, mask) if keep]
+        self._vectors = self._vectors[mask]
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype="float32").reshape(-1)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def get(self, key: AnswerCacheKey, embedding: np.ndarray) -> AnswerCacheEntry | None:
+        """Запись с самым похожим вопросом того же ключа или None"""
+        query = self._normalize(embedding)
+        with self._lock:
+            if not self._entries or self._vectors.shape[1] != len(query):
+                self.misses += 1
+                return None
+            now = time.time()
+            candidates = np.array([
+                entry.key == key and (self.ttl is None or now - entry.created_at <= self.ttl)
+                for entry in self._entries
+            ])
+            scores = np.where(candidates, self._vectors @ query, -np.inf)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry = self._entries[best]
+            entry.hits += 1
+            entry.last_hit_at = now
+            self.hits += 1
+            return entry
+
+    def set(self, key: AnswerCacheKey, question: UserQuestion, embedding: np.ndarray, answer: str) -> None:
+        if self.max_entries <= 0 or not answer:
+            return
+        vector = self._normalize(embedding)
+        now = time.time()
+        entry = AnswerCacheEntry(key=key, question=question, answer=answer, created_at=now, last_hit_at=now)
+        with self._lock:
+            if not self._entries or self._vectors.shape[1] != len(vector):
+                # Записи с другой размерностью файлы не сохраняют: они будут переписаны
+                self._entries, self._vectors = [], np.empty((0, len(vector)), dtype="float32")
+                self._stored = 0
+            self._entries.append(entry)
+            self._vectors = np.vstack([self._vectors, vector[None, :]])
+            self._evict()
+            if self._stored >= 2 * self.max_entries:
+                self._compact()
+            else:
+                self._append(entry, vector)
+
+    def invalidate(self, index_version: str) -> None:
+        """Удаляет ответы, полученные на других версиях индекса"""
+        with self._lock:
+            mask = np.array([entry.key.index_version == index_version for entry in self._entries], dtype=bool)
+            if len(mask) and not mask.all():
+                print(f"Кэш ответов: удалено устаревших ответов: {int((~mask).sum())}")
+                self._keep(mask)
+                self._compact()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from unstructured.documents.elements import Element
+if TYPE_CHECKING:
+    from unstructured.documents.elements import Element
 
 class DocumentParser(ABC):
     
     @abstractmethod
-    def parse(self, file: Path) -> list[Element]:
+    def parse(self, file: Path) -> list["Element"]:
         pass
\ No newline at end of file
@@ -1,39 +1,58 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from enum import Enum
 from pathlib import Path
-from typing import Any, Generator
+import time
+from typing import TYPE_CHECKING, Any, Generator, Iterable, Iterator
 
-from unstructured.documents.elements import Element
+from src.services.local_manger.base import DocumentParser
+from src.utils.metrics import metrics
 
-from unstructured.partition.md import partition_md
-from unstructured.partition.pdf import partition_pdf
-from unstructured.partition.docx import partition_docx
-from unstructured.partition.text import partition_text
+if TYPE_CHECKING:
+    from unstructured.documents.elements import Element
 
-from src.services.local_manger.base import DocumentParser
 
+# Модули unstructured.partition импортируются несколько секунд,
+# поэтому каждый парсер загружает свой модуль при первом разборе файла своего формата
 
 class MDParser(DocumentParser):
-    def parse(self, file: Path) -> list[Element]:
+    def parse(self, file: Path) -> list["Element"]:
+        from unstructured.partition.md import partition_md
         return partition_md(filename=str(file))
 
 
 
 class PDFParser(DocumentParser):
-    def parse(self, file: Path) -> list[Element]:
+    def parse(self, file: Path) -> list["Element"]:
+        from unstructured.partition.pdf import partition_pdf
         return partition_pdf(filename=str(file))
 
 
 
 class DOCXParser(DocumentParser):
-    def parse(self, file: Path) -> list[Element]:
+    def parse(self, file: Path) -> list["Element"]:
+        from unstructured.partition.docx import partition_docx
         return partition_docx(filename=str(file))
 
 
 
 class TextParser(DocumentParser):
-    def parse(self, file: Path) -> list[Element]:
+    def parse(self, file: Path) -> list["Element"]:
+        from unstructured.partition.text import partition_text
         return partition_text(filename=str(file))
 
 
+class ParseStatus(Enum):
+    # Файл не удалось разобрать: в отличие от пустого файла (None) он не считается
+    # проиндексированным и разбирается заново при следующем обновлении индекса
+    FAILED = "failed"
+
+
+DocumentData = dict[str, str]
+
+_PARSE_STAGE = "index.parse_document"
+
+
 class DocumentParserFactory:
     _parsers: dict[str, DocumentParser] = {
         ".md": MDParser(),
@@ -54,8 +73,14 @@ class LocalManager:
 
     SUPPORTED_EXTENSIONS = {".md", ".pdf", ".docx", ".txt"}
     
-    def __init__(self, dir_path: Path):
+    def __init__(self, dir_path: Path, parse_workers: int = 1):
+        """
+        Args:
+            dir_path (Path): Директория с документами
+            parse_workers (int): Число процессов для разбора документов, 1 - разбор в текущем процессе
+        """
         self._dir_path = dir_path
+        self._parse_workers = parse_workers
     
     def _load_documents(self) -> Generator[Path, Any, None]:
         if not self._dir_path.exists():
@@ -63,30 +88,87 @@ class LocalManager:
             print(f"Папка {self._dir_path} создана. Добавьте туда документы!")
             return
 
-        for file in self._dir_path.iterdir():
-            if file.suffix.lower() in self.SUPPORTED_EXTENSIONS:
+        # Заметки ищутся и во вложенных папках, кроме скрытых (.git, .obsidian)
+        for file in sorted(self._dir_path.rglob("*")):
+            relative_parts = file.relative_to(self._dir_path).parts
+            if any(part.startswith(".") for part in relative_parts):
+                continue
+            if file.is_file() and file.suffix.lower() in self.SUPPORTED_EXTENSIONS:
                 yield file
 
-    def _partition_file(self, file: Path) -> list[Element]:
+    def _partition_file(self, file: Path) -> list["Element"]:
         parser = DocumentParserFactory.get_parser(file.suffix)
         return parser.parse(file)
 
-    def get_documents_data(self) -> list[dict[str, str]]:
-        docs: list[dict[str, str]] = []
-
-        for file in self._load_documents():
-            try:
-                elements = self._partition_file(file)
-                text = "\n".join(str(el) for el in elements)
-
-                if text.strip():
-                    docs.append({
-                        "text": text,
-                        "source": file.name,
-                    })
+    def get_files(self) -> dict[str, Path]:
+        """Поддерживаемые файлы директории по их имени относительно неё"""
+        return {
+            file.relative_to(self._dir_path).as_posix(): file
+            for file in self._load_documents()
+        }
+
+    @metrics.timed(_PARSE_STAGE)
+    def get_document_data(self, file: Path) -> DocumentData | ParseStatus | None:
+        """Текст одного документа. None, если файл пустой, ParseStatus.FAILED, если его не удалось разобрать"""
+        return self._parse_document(file)
+
+    def _parse_document(self, file: Path) -> DocumentData | ParseStatus | None:
+        try:
+            elements = self._partition_file(file)
+            text = "\n".join(str(el) for el in elements)
+        except Exception as e:
+            print(f"Ошибка при обработке {file}: {e}")
+            return ParseStatus.FAILED
+
+        if not text.strip():
+            return None
+        return {
+            "text": text,
+            "source": file.relative_to(self._dir_path).as_posix(),
+        }
+
+    def _parse_document_timed(self, file: Path) -> tuple[DocumentData | ParseStatus | None, float]:
+        """Разбор в дочернем процессе: его метрики не видны родителю, поэтому длительность возвращается вместе с данными"""
+        start_time = time.perf_counter()
+        data = self._parse_document(file)
+        return data, time.perf_counter() - start_time
+
+    def _collect(self, future: Future) -> DocumentData | ParseStatus | None:
+        data, elapsed = future.result()
+        metrics.record_span(_PARSE_STAGE, elapsed)
+        return data
+
+    def iter_documents_data(self, files: Iterable[Path]) -> Iterator[tuple[Path, DocumentData | ParseStatus | None]]:
+        """
+        Разбирает файлы и отдаёт пары (файл, данные документа) в порядке входного списка.
+        При parse_workers > 1 файлы разбираются параллельно в пуле процессов.
+        Одновременно в работе не больше 2 * parse_workers файлов, чтобы разобранные,
+        но ещё не обработанные документы не копились в памяти.
+        """
+        files = list(files)
+        if self._parse_workers <= 1 or len(files) <= 1:
+            for file in files:
+                yield file, self.get_document_data(file)
+            return
 
-            except Exception as e:
-                print(f"Ошибка при обработке {file}: {e}")
+        workers = min(self._parse_workers, len(files))
+        pending: deque[tuple[Path, Future]] = deque()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for file in files:
+                pending.append((file, executor.submit(self._parse_document_timed, file)))
+                if len(pending) >= workers * 2:
+                    done_file, future = pending.popleft()
+                    yield done_file, self._collect(future)
+            while pending:
+                done_file, future = pending.popleft()
+                yield done_file, self._collect(future)
+
+    def get_documents_data(self) -> list[DocumentData]:
+        docs: list[DocumentData] = []
+
+        for _, doc in self.iter_documents_data(self._load_documents()):
+            if isinstance(doc, dict):
+                docs.append(doc)
 
         print(f"Загружено {len(docs)} документов.")
-        return docs
\ No newline at end of file
+        return docs
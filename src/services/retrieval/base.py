@@ -1,22 +1,59 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from enum import Enum
-from typing import ClassVar, Generic, TypeVar
+from typing import ClassVar, Generic, Type, TypeVar
 
+import numpy as np
 from pydantic import BaseModel
 
-from sentence_transformers import SentenceTransformer
-
-from src.services.retrieval.chunk_generator import ChunkGenerator
+from src.services.retrieval.chunk_generator import Chunk, ChunkGenerator
+from src.services.retrieval.dedup import DedupParams
+from src.services.retrieval.embedding_backend import EmbeddingParams
+from src.services.retrieval.embedding_cache import EmbeddingCache, TextEncoder
 from src.types_.base_types import UserQuestion
+from src.utils.lru_cache import LRUCache
+from src.utils.metrics import metrics
+
+
+class EmbeddingModel(str, Enum):
+    all_MiniLM_L6_v2 = "sentence-transformers/all-MiniLM-L6-v2"
+    multilingual_e5_small = "intfloat/multilingual-e5-small"
+
+
+CHUNKS_SEPARATOR = "\n\n---\n\n"
+
+
+def format_chunk(chunk: Chunk) -> str:
+    return f"[Источник: {chunk['source']}]\n{chunk['text']}"
+
+
+def format_chunks(chunks: list[Chunk]) -> str:
+    """Контекст для промпта из найденных чанков"""
+    return CHUNKS_SEPARATOR.join(format_chunk(chunk) for chunk in chunks)
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    chunk: Chunk
+    # Квадрат расстояния L2 до запроса в dense-поиске (так его возвращают FAISS и Chroma),
+    # None - если чанк найден только BM25
+    distance: float | None = None
 
 
 class RAGEngineType(str, Enum):
     FAISS = "faiss"
+    FAISS_SHARDED = "faiss_sharded"
     CHROMADB = "chromadb"
 
 
 class BaseRetrievalConfig(BaseModel):
     retrieval_k: int
+    embedding_batch_size: int = 256
+    query_cache_size: int = 1024
+    query_cache_ttl: float | None = None
+    # Дубликаты чанков не эмбеддятся, их источники добавляются к каноническому чанку
+    dedup: DedupParams = DedupParams()
+    embedding: EmbeddingParams = EmbeddingParams()
 
 
 RAGEngineConfigTypeVar = TypeVar("RAGEngineConfigTypeVar", bound=BaseRetrievalConfig)
@@ -28,11 +65,70 @@ class RAGEngineBase(ABC, Generic[RAGEngineConfigTypeVar]):
     Каждый наследник должен определить атрибут `engine_type`.
     """
     engine_type: ClassVar[RAGEngineType]
-
-    def __init__(self, config: RAGEngineConfigTypeVar, chunk_generator: ChunkGenerator, embedding_model: SentenceTransformer):
+    config_class: ClassVar[Type[BaseRetrievalConfig]]
+
+    def __init__(
+            self,
+            config: RAGEngineConfigTypeVar,
+            chunk_generator: ChunkGenerator,
+            embedding_model: TextEncoder,
+            embedding_cache: EmbeddingCache | None = None
+    ):
         self.chunk_generator = chunk_generator
         self.embedding_model = embedding_model
+        self.embedding_cache = embedding_cache
         self.config = config
+        # Меняется при каждом изменении проиндексированных данных, задаётся наследником
+        self.index_version = ""
+        # Эмбеддинги запросов зависят только от модели, а результаты поиска - ещё и от индекса,
+        # поэтому при перестройке индекса сбрасывается только results_cache
+        self.query_embeddings_cache: LRUCache[UserQuestion, np.ndarray] = LRUCache(
+            maxsize=config.query_cache_size, ttl=config.query_cache_ttl
+        )
+        self.results_cache: LRUCache[UserQuestion, list[SearchHit]] = LRUCache(
+            maxsize=config.query_cache_size, ttl=config.query_cache_ttl
+        )
+
+    def _encode_chunks(self, texts: list[str]) -> np.ndarray:
+        """Эмбеддинги чанков с учётом дискового кэша"""
+        with metrics.span("index.embed_chunks"):
+            if self.embedding_cache is None:
+                return self.embedding_model.encode(texts)
+            return self.embedding_cache.encode(self.embedding_model, texts)
+
+    def embed_query(self, query: UserQuestion) -> np.ndarray:
+        """Эмбеддинг запроса через тот же кэш, что и при поиске"""
+        return self._encode_queries([query])[0]
+
+    def embed_queries(self, queries: list[UserQuestion]) -> list[np.ndarray]:
+        """Эмбеддинги пакета запросов через тот же кэш, что и при поиске"""
+        return list(self._encode_queries(queries))
+
+    def _encode_queries(self, queries: list[UserQuestion]) -> np.ndarray:
+        """Эмбеддинги запросов с учётом кэша, промахи эмбеддятся одним батчем"""
+        vectors = [self.query_embeddings_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(q for q, vector in zip(queries, vectors) if vector is None))
+        if missing:
+            with metrics.span("retrieval.encode_queries"):
+                embeddings = self.embedding_model.encode(missing, batch_size=self.config.embedding_batch_size)
+            encoded = dict(zip(missing, np.asarray(embeddings, dtype="float32")))
+            for query, vector in encoded.items():
+                self.query_embeddings_cache.set(query, vector)
+            vectors = [encoded[q] if vector is None else vector for q, vector in zip(queries, vectors)]
+        return np.stack(vectors)
+
+    def warm_up(self) -> None:
+        """Пробный прогон модели эмбеддингов, чтобы первый запрос не платил за её инициализацию"""
+        self.embedding_model.encode(["warm-up"])
+
+    def _invalidate_caches(self) -> None:
+        self.results_cache.clear()
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            "query_embeddings": self.query_embeddings_cache.stats(),
+            "results": self.results_cache.stats(),
+        }
 
     @abstractmethod
     def build_index(self) -> None:
@@ -43,9 +139,37 @@ class RAGEngineBase(ABC, Generic[RAGEngineConfigTypeVar]):
         pass
 
     @abstractmethod
-    def retrieve(self, query: UserQuestion) -> str:
+    def _search_many(self, queries: list[UserQuestion]) -> list[list[SearchHit]]:
+        """
+        Поиск сразу для нескольких запросов: запросы эмбеддятся
+        одним батчем и ищутся одним обращением к индексу.
+        Возвращает найденные чанки каждого запроса по убыванию релевантности
+        в порядке входного списка.
+        """
         pass
 
+    def search_many(self, queries: list[UserQuestion]) -> list[list[SearchHit]]:
+        """Поиск чанков для нескольких запросов с учётом кэша результатов"""
+        results = [self.results_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(q for q, result in zip(queries, results) if result is None))
+        if missing:
+            with metrics.span("retrieval.search"):
+                found = dict(zip(missing, self._search_many(missing)))
+            for query, result in found.items():
+                self.results_cache.set(query, result)
+            results = [found[q] if result is None else result for q, result in zip(queries, results)]
+        return results
+
+    def search(self, query: UserQuestion) -> list[SearchHit]:
+        return self.search_many([query])[0]
+
+    def retrieve_many(self, queries: list[UserQuestion]) -> list[str]:
+        """Контекст для нескольких запросов из всех найденных чанков"""
+        return [format_chunks([hit.chunk for hit in hits]) for hits in self.search_many(queries)]
+
+    def retrieve(self, query: UserQuestion) -> str:
+        return self.retrieve_many([query])[0]
+
     def load_or_build_index(self) -> None:
         if not self.load_index():
             self.build_index()
@@ -0,0 +1,217 @@
+import json
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from src.services.retrieval.manifest import VectorId
+from src.services.retrieval.segments import SegmentCatalog, SegmentWriter
+
+
+_VOCAB_FILE = "vocab.json"
+_INDPTR_FILE = "indptr.npy"
+_POSTINGS_FILE = "postings.npy"
+_TFS_FILE = "tfs.npy"
+_DOC_IDS_FILE = "doc_ids.npy"
+_DOC_LENS_FILE = "doc_lens.npy"
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Слова и числа в нижнем регистре: номера статей и идентификаторы сохраняются как есть"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class _BM25Segment:
+    """
+    Неизменяемый сегмент BM25-индекса.
+    removed - id документов сегмента, удалённых более поздними сегментами.
+    """
+
+    def __init__(
+            self,
+            vocab: dict[str, int],
+            indptr: np.ndarray,
+            postings: np.ndarray,
+            tfs: np.ndarray,
+            doc_ids: np.ndarray,
+            doc_lens: np.ndarray,
+            removed: set[VectorId] | None = None
+    ):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.postings = postings
+        self.tfs = tfs
+        self.doc_ids = doc_ids
+        self.doc_lens = doc_lens
+        self.removed = np.fromiter(removed or (), dtype="int64")
+        self.total_len = int(doc_lens.sum())
+
+    @classmethod
+    def open(cls, segment_dir: Path, removed: set[VectorId]) -> "_BM25Segment":
+        terms = json.loads((segment_dir / _VOCAB_FILE).read_text(encoding="utf-8"))
+        return cls(
+            vocab={term: term_id for term_id, term in enumerate(terms)},
+            indptr=np.load(segment_dir / _INDPTR_FILE, mmap_mode="r"),
+            postings=np.load(segment_dir / _POSTINGS_FILE, mmap_mode="r"),
+            tfs=np.load(segment_dir / _TFS_FILE, mmap_mode="r"),
+            doc_ids=np.load(segment_dir / _DOC_IDS_FILE, mmap_mode="r"),
+            doc_lens=np.load(segment_dir / _DOC_LENS_FILE, mmap_mode="r"),
+            removed=removed
+        )
+
+    def postings_of(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """Номера документов с термином и частоты термина в них"""
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return np.empty(0, dtype="int32"), np.empty(0, dtype="int32")
+        start, end = int(self.indptr[term_id]), int(self.indptr[term_id + 1])
+        return np.asarray(self.postings[start:end]), np.asarray(self.tfs[start:end])
+
+
+class BM25Index:
+    """
+    Лексический индекс BM25 по чанкам из сегментов, перечисленных в segments.json.
+
+    Постинги сегмента хранятся в CSR-виде в numpy-массивах:
+    - vocab.json - список терминов, номер термина - его позиция в списке;
+    - indptr.npy - границы постингов каждого термина (n_terms + 1 значений);
+    - postings.npy, tfs.npy - номера документов и частоты термина в них;
+    - doc_ids.npy, doc_lens.npy - id векторов документов и их длины в токенах.
+    Массивы открываются через mmap, в памяти остаются только словари.
+    Обновление дописывает сегмент и скрывает удалённые документы старых. Как в Lucene,
+    удалённые документы учитываются в статистике (число документов, средняя длина, df)
+    до перезаписи индекса целиком, но не попадают в результаты.
+    """
+
+    def __init__(self, segments: list[_BM25Segment], k1: float = 1.2, b: float = 0.75):
+        self._segments = segments
+        self._docs_count = sum(len(segment.doc_ids) for segment in segments)
+        total_len = sum(segment.total_len for segment in segments)
+        self._avg_doc_len = total_len / self._docs_count if self._docs_count else 0.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def empty(cls) -> "BM25Index":
+        return cls([])
+
+    @staticmethod
+    def exists(index_dir: Path) -> bool:
+        return SegmentCatalog.exists(index_dir)
+
+    @classmethod
+    def open(cls, index_dir: Path) -> "BM25Index":
+        catalog = SegmentCatalog.load(index_dir)
+        return cls([
+            _BM25Segment.open(index_dir / entry.name, removed)
+            for entry, removed in zip(catalog.segments, catalog.removed_sets())
+        ])
+
+    def __len__(self) -> int:
+        return sum(int(np.count_nonzero(~np.isin(segment.doc_ids, segment.removed))) for segment in self._segments)
+
+    def search(self, query: str, k: int) -> list[tuple[VectorId, float]]:
+        """k документов с наибольшим BM25 по убыванию оценки"""
+        terms = set(tokenize(query))
+        if not self._docs_count or not terms:
+            return []
+
+        postings = {
+            term: [segment.postings_of(term) for segment in self._segments]
+            for term in terms
+        }
+        found_ids = []
+        found_scores = []
+        for number, segment in enumerate(self._segments):
+            positions = []
+            weights = []
+            for term, segment_postings in postings.items():
+                docs, tf = segment_postings[number]
+                if not len(docs):
+                    continue
+                df = sum(len(term_docs) for term_docs, _ in segment_postings)
+                idf = np.log(1.0 + (self._docs_count - df + 0.5) / (df + 0.5))
+                tf = tf.astype("float32")
+                norm = self.k1 * (1.0 - self.b + self.b * segment.doc_lens[docs] / self._avg_doc_len)
+                positions.append(docs)
+                weights.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+            if not positions:
+                continue
+            matched, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(weights))
+            doc_ids = np.asarray(segment.doc_ids[matched])
+            live = ~np.isin(doc_ids, segment.removed)
+            found_ids.append(doc_ids[live])
+            found_scores.append(scores[live])
+        if not found_ids:
+            return []
+
+        doc_ids = np.concatenate(found_ids)
+        scores = np.concatenate(found_scores)
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(doc_ids[i]), float(scores[i])) for i in top]
+
+    def search_many(self, queries: list[str], k: int) -> list[list[tuple[VectorId, float]]]:
+        return [self.search(query, k) for query in queries]
+
+
+class BM25IndexWriter:
+    """
+    Потоковая сборка сегмента BM25-индекса.
+    При append сегмент дописывается к индексу, а id из remove скрываются в старых сегментах,
+    иначе индекс заменяется новым из одного сегмента. Изменения видны после commit.
+    """
+
+    def __init__(self, index_dir: Path, append: bool = False):
+        self._index_dir = index_dir
+        self._append = append
+        self._removed: set[VectorId] = set()
+        self._vocab: dict[str, int] = {}
+        self._term_postings: list[array] = []
+        self._term_tfs: list[array] = []
+        self._doc_ids = array("q")
+        self._doc_lens = array("i")
+
+    def add(self, vector_id: VectorId, text: str) -> None:
+        tokens = tokenize(text)
+        position = len(self._doc_ids)
+        self._doc_ids.append(vector_id)
+        self._doc_lens.append(len(tokens))
+        for token, tf in Counter(tokens).items():
+            term_id = self._vocab.get(token)
+            if term_id is None:
+                term_id = self._vocab[token] = len(self._vocab)
+                self._term_postings.append(array("i"))
+                self._term_tfs.append(array("i"))
+            self._term_postings[term_id].append(position)
+            self._term_tfs[term_id].append(tf)
+
+    def remove(self, ids: set[VectorId]) -> None:
+        self._removed.update(ids)
+
+    def commit(self) -> None:
+        segment = SegmentWriter(self._index_dir, append=self._append)
+        segment.remove(self._removed)
+
+        lengths = [len(postings) for postings in self._term_postings]
+        indptr = np.zeros(len(lengths) + 1, dtype="int64")
+        np.cumsum(lengths, out=indptr[1:])
+        postings = np.empty(int(indptr[-1]), dtype="int32")
+        tfs = np.empty(int(indptr[-1]), dtype="int32")
+        for term_id, (term_postings, term_tfs) in enumerate(zip(self._term_postings, self._term_tfs)):
+            postings[indptr[term_id]:indptr[term_id + 1]] = np.frombuffer(term_postings, dtype="int32")
+            tfs[indptr[term_id]:indptr[term_id + 1]] = np.frombuffer(term_tfs, dtype="int32")
+
+        (segment.segment_dir / _VOCAB_FILE).write_text(
+            json.dumps(list(self._vocab), ensure_ascii=False), encoding="utf-8"
+        )
+        np.save(segment.segment_dir / _INDPTR_FILE, indptr)
+        np.save(segment.segment_dir / _POSTINGS_FILE, postings)
+        np.save(segment.segment_dir / _TFS_FILE, tfs)
+        np.save(segment.segment_dir / _DOC_IDS_FILE, np.frombuffer(self._doc_ids, dtype="int64"))
+        np.save(segment.segment_dir / _DOC_LENS_FILE, np.frombuffer(self._doc_lens, dtype="int32"))
+        segment.commit()
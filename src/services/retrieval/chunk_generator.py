@@ -1,11 +1,27 @@
+from enum import Enum
+from pathlib import Path
+import re
+from typing import TYPE_CHECKING, Any, Iterator
 
-from src.services.local_manger.local_manager import LocalManager
+from src.services.local_manger.local_manager import LocalManager, ParseStatus
 from src.services.retrieval.exc import DocsNotExist
 from src.types_.base_types import ChunkSize, Overlap
+from src.utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from tokenizers import Tokenizer
 
 DocText = str
 Chunk = dict[str, str]
 ChunkText = str
+# Границы фрагмента текста в документе [start, end)
+Span = tuple[int, int]
+
+
+class ChunkerType(str, Enum):
+    CHARS = "chars"
+    TOKENS = "tokens"
+
 
 class ChunkGenerator:
 
@@ -25,6 +41,11 @@ class ChunkGenerator:
         if overlap >= chunk_size:
             raise ValueError("overlap должен быть меньше chunk_size")
 
+    @property
+    def params(self) -> dict[str, Any]:
+        """Параметры нарезки. Для FAISS сохраняются в манифесте, при их изменении индекс перестраивается"""
+        return {"chunker": ChunkerType.CHARS.value, "chunk_size": self.chunk_size, "overlap": self.overlap}
+
     def _chunk_doc(self, doc_text: DocText) -> list[ChunkText]:
         """Разбивает текст на чанки по символам с перекрытием"""
         chunks: list[str] = []
@@ -42,23 +63,145 @@ class ChunkGenerator:
         
         return chunks
 
+    @metrics.timed("index.chunk_document")
+    def _doc_chunks(self, doc: dict[str, str]) -> list[Chunk]:
+        return [
+            {"text": chunk, "source": doc["source"]}
+            for chunk in self._chunk_doc(doc["text"])
+            if chunk.strip()
+        ]
+
+    def iter_files_chunks(self, files: list[Path]) -> Iterator[tuple[Path, list[Chunk] | None]]:
+        """Чанки каждого из файлов в порядке списка. None - файл не удалось разобрать"""
+        for file, doc in self.local_manager.iter_documents_data(files):
+            if doc is ParseStatus.FAILED:
+                yield file, None
+            else:
+                yield file, self._doc_chunks(doc) if doc is not None else []
+
+    def chunk_documents(self, docs: list[dict[str, str]]) -> list[Chunk]:
+        """Чанки уже разобранных документов"""
+        all_chunks: list[Chunk] = []
+
+        for doc in docs:
+            all_chunks.extend(self._doc_chunks(doc))
+
+        return all_chunks
+
     def get_chunks(self) -> list[Chunk]:
         raw_docs = self.local_manager.get_documents_data()
         if not raw_docs:
             raise DocsNotExist
 
-        all_chunks: list[dict[str, str]] = []
-
-        for doc in raw_docs:
-            chunks = self._chunk_doc(doc["text"])
-            for chunk in chunks:
-                if chunk.strip():
-                    all_chunks.append({
-                        "text": chunk,
-                        "source": doc["source"]
-                    })
+        all_chunks = self.chunk_documents(raw_docs)
 
         if not all_chunks:
             print("Нет текста для индексации.")
 
-        return all_chunks
\ No newline at end of file
+        return all_chunks
+
+
+class TokenChunkGenerator(ChunkGenerator):
+    """
+    Нарезка на чанки по токенам модели эмбеддингов.
+    Текст режется по абзацам, слишком длинные абзацы - по предложениям, и лишь
+    предложения длиннее чанка - по токенам. Соседние фрагменты склеиваются в чанк,
+    пока он помещается в max_seq_length модели, поэтому чанки не обрезаются при эмбеддинге.
+    Перекрытие - целые предложения или абзацы суммарно не длиннее overlap токенов.
+    """
+
+    _PARAGRAPH_RE = re.compile(r"\n\s*\n")
+    _SENTENCE_RE = re.compile(r"(?<=[.!?…;])\s+")
+
+    def __init__(
+            self,
+            local_manager: LocalManager,
+            tokenizer: "Tokenizer",
+            chunk_size: ChunkSize,
+            overlap: Overlap
+    ):
+        from tokenizers import Tokenizer
+
+        # Копия без обрезки и паддинга: нужна настоящая длина фрагментов
+        self.tokenizer = Tokenizer.from_str(tokenizer.to_str())
+        self.tokenizer.no_truncation()
+        self.tokenizer.no_padding()
+        # Место под [CLS]/[SEP] и другие служебные токены модели
+        chunk_size -= len(self.tokenizer.encode("").ids)
+        super().__init__(local_manager=local_manager, chunk_size=chunk_size, overlap=overlap)
+
+    @property
+    def params(self) -> dict[str, Any]:
+        return {"chunker": ChunkerType.TOKENS.value, "chunk_size": self.chunk_size, "overlap": self.overlap}
+
+    @staticmethod
+    def _split(text: DocText, span: Span, pattern: re.Pattern) -> list[Span]:
+        start, end = span
+        spans = []
+        for match in pattern.finditer(text, start, end):
+            spans.append((start, match.start()))
+            start = match.end()
+        spans.append((start, end))
+        # Пробелы по краям фрагмента в чанк не попадают
+        result = []
+        for s, e in spans:
+            fragment = text[s:e]
+            if fragment.strip():
+                result.append((s + len(fragment) - len(fragment.lstrip()), e - len(fragment) + len(fragment.rstrip())))
+        return result
+
+    def _lengths(self, text: DocText, spans: list[Span]) -> list[int]:
+        encodings = self.tokenizer.encode_batch([text[s:e] for s, e in spans], add_special_tokens=False)
+        return [len(encoding.ids) for encoding in encodings]
+
+    def _split_by_tokens(self, text: DocText, span: Span) -> list[Span]:
+        """Окна по chunk_size токенов для фрагментов без подходящих границ"""
+        offsets = self.tokenizer.encode(text[span[0]:span[1]], add_special_tokens=False).offsets
+        step = self.chunk_size - self.overlap
+        windows = []
+        for i in range(0, len(offsets), step):
+            window = offsets[i:i + self.chunk_size]
+            windows.append((span[0] + window[0][0], span[0] + window[-1][1]))
+            if i + self.chunk_size >= len(offsets):
+                break
+        return windows
+
+    def _segments(self, text: DocText) -> list[tuple[Span, int]]:
+        """Фрагменты документа по порядку с их длиной в токенах"""
+        segments: list[tuple[Span, int]] = []
+        paragraphs = self._split(text, (0, len(text)), self._PARAGRAPH_RE)
+        for paragraph, length in zip(paragraphs, self._lengths(text, paragraphs)):
+            if length <= self.chunk_size:
+                segments.append((paragraph, length))
+                continue
+            sentences = self._split(text, paragraph, self._SENTENCE_RE)
+            for sentence, sentence_length in zip(sentences, self._lengths(text, sentences)):
+                if sentence_length <= self.chunk_size:
+                    segments.append((sentence, sentence_length))
+                    continue
+                windows = self._split_by_tokens(text, sentence)
+                segments.extend(zip(windows, self._lengths(text, windows)))
+        return segments
+
+    def _chunk_doc(self, doc_text: DocText) -> list[ChunkText]:
+        chunks: list[ChunkText] = []
+        current: list[tuple[Span, int]] = []
+        current_length = 0
+        for segment in self._segments(doc_text):
+            if current and current_length + segment[1] > self.chunk_size:
+                chunks.append(doc_text[current[0][0][0]:current[-1][0][1]])
+                # Хвост предыдущего чанка целыми фрагментами переходит в следующий
+                tail: list[tuple[Span, int]] = []
+                tail_length = 0
+                for previous in reversed(current):
+                    length = tail_length + previous[1]
+                    if length > self.overlap or length + segment[1] > self.chunk_size:
+                        break
+                    tail.insert(0, previous)
+                    tail_length += previous[1]
+                current, current_length = tail, tail_length
+            current.append(segment)
+            current_length += segment[1]
+        if current:
+            chunks.append(doc_text[current[0][0][0]:current[-1][0][1]])
+        return chunks
@@ -0,0 +1,299 @@
+import heapq
+import json
+import mmap
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from src.services.retrieval.chunk_generator import Chunk
+from src.services.retrieval.dedup import merge_sources
+from src.services.retrieval.manifest import VectorId
+from src.services.retrieval.segments import SegmentCatalog, SegmentWriter
+
+
+_TEXTS_FILE = "texts.bin"
+_OFFSETS_FILE = "offsets.npy"
+_IDS_FILE = "ids.npy"
+_SOURCE_IDS_FILE = "source_ids.npy"
+_CANONICAL_IDS_FILE = "canonical_ids.npy"
+_SOURCES_FILE = "sources.json"
+_DUPLICATE_IDS_FILE = "duplicate_ids.npy"
+_DUPLICATE_CANONICAL_IDS_FILE = "duplicate_canonical_ids.npy"
+_DUPLICATE_SOURCE_IDS_FILE = "duplicate_source_ids.npy"
+
+# Хранилище переписывается целиком, когда сегментов становится больше
+MAX_SEGMENTS = 16
+
+
+def _duplicates_index(
+        ids: np.ndarray,
+        canonical_ids: np.ndarray,
+        source_ids: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """id дубликатов, отсортированные по id их канонических чанков, id канонических чанков и номера источников"""
+    positions = np.flatnonzero(canonical_ids != ids)
+    order = np.argsort(canonical_ids[positions], kind="stable")
+    return (
+        np.asarray(ids[positions][order], dtype="int64"),
+        np.asarray(canonical_ids[positions][order], dtype="int64"),
+        np.asarray(source_ids[positions][order], dtype="int32"),
+    )
+
+
+class _Segment:
+    """
+    Неизменяемый сегмент хранилища чанков.
+    removed - id строк сегмента, удалённых более поздними сегментами.
+    """
+
+    def __init__(
+            self,
+            ids: np.ndarray,
+            offsets: np.ndarray,
+            source_ids: np.ndarray,
+            sources: list[str],
+            texts: bytes | mmap.mmap,
+            canonical_ids: np.ndarray,
+            duplicates: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None,
+            removed: set[VectorId] | None = None
+    ):
+        self._ids = ids
+        self._offsets = offsets
+        self._source_ids = source_ids
+        self._sources = sources
+        self._texts = texts
+        self._canonical_ids = canonical_ids
+        if duplicates is None:
+            duplicates = _duplicates_index(self._ids, self._canonical_ids, self._source_ids)
+        self._duplicate_ids, self._duplicate_canonical_ids, self._duplicate_source_ids = duplicates
+        self._removed = removed or set()
+        self.rows = len(ids)
+        self.live = self.rows - sum(1 for vector_id in self._removed if self._find(vector_id) is not None)
+
+    @classmethod
+    def open(cls, segment_dir: Path, removed: set[VectorId]) -> "_Segment":
+        texts: bytes | mmap.mmap = b""
+        if (segment_dir / _TEXTS_FILE).stat().st_size > 0:
+            with open(segment_dir / _TEXTS_FILE, "rb") as f:
+                texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(
+            ids=np.load(segment_dir / _IDS_FILE, mmap_mode="r"),
+            offsets=np.load(segment_dir / _OFFSETS_FILE, mmap_mode="r"),
+            source_ids=np.load(segment_dir / _SOURCE_IDS_FILE, mmap_mode="r"),
+            sources=json.loads((segment_dir / _SOURCES_FILE).read_text(encoding="utf-8")),
+            texts=texts,
+            canonical_ids=np.load(segment_dir / _CANONICAL_IDS_FILE, mmap_mode="r"),
+            # В сегментах, записанных до появления этих файлов, дубликаты собираются при открытии
+            duplicates=(
+                np.load(segment_dir / _DUPLICATE_IDS_FILE, mmap_mode="r"),
+                np.load(segment_dir / _DUPLICATE_CANONICAL_IDS_FILE, mmap_mode="r"),
+                np.load(segment_dir / _DUPLICATE_SOURCE_IDS_FILE, mmap_mode="r"),
+            ) if (segment_dir / _DUPLICATE_IDS_FILE).exists() else None,
+            removed=removed
+        )
+
+    def close(self) -> None:
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self._texts = b""
+
+    def _find(self, vector_id: VectorId) -> int | None:
+        position = int(np.searchsorted(self._ids, vector_id))
+        if position >= len(self._ids) or self._ids[position] != vector_id:
+            return None
+        return position
+
+    def position(self, vector_id: VectorId) -> int | None:
+        """Позиция живой строки с этим id"""
+        if vector_id in self._removed:
+            return None
+        return self._find(vector_id)
+
+    def chunk_at(self, position: int) -> Chunk:
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return {
+            "text": self._texts[start:end].decode("utf-8"),
+            "source": self._sources[int(self._source_ids[position])],
+        }
+
+    def duplicates_of(self, canonical_id: VectorId) -> Iterator[tuple[VectorId, int]]:
+        """Живые дубликаты чанка и номера их источников"""
+        start, end = np.searchsorted(self._duplicate_canonical_ids, [canonical_id, canonical_id + 1])
+        for duplicate_id, source_id in zip(self._duplicate_ids[start:end], self._duplicate_source_ids[start:end]):
+            if int(duplicate_id) not in self._removed:
+                yield int(duplicate_id), int(source_id)
+
+    def source(self, source_id: int) -> str:
+        return self._sources[source_id]
+
+    def entries(self) -> Iterator[tuple[VectorId, VectorId, Chunk]]:
+        for position in range(len(self._ids)):
+            vector_id = int(self._ids[position])
+            if vector_id not in self._removed:
+                yield vector_id, int(self._canonical_ids[position]), self.chunk_at(position)
+
+    @property
+    def duplicates_count(self) -> int:
+        removed_duplicates = 0
+        for vector_id in self._removed:
+            position = self._find(vector_id)
+            if position is not None and self._canonical_ids[position] != vector_id:
+                removed_duplicates += 1
+        return len(self._duplicate_ids) - removed_duplicates
+
+
+class ChunkStore:
+    """
+    Колоночное хранилище чанков индекса из сегментов, перечисленных в segments.json.
+
+    Директория сегмента:
+    - texts.bin - тексты всех чанков одним UTF-8 блобом;
+    - offsets.npy - смещения чанков в блобе (n + 1 значений);
+    - ids.npy - отсортированные id векторов чанков;
+    - source_ids.npy - номер источника чанка в sources.json;
+    - sources.json - список уникальных источников;
+    - canonical_ids.npy - id канонического чанка: у дубликата - id чанка, вектор которого
+      его представляет, у остальных - собственный id;
+    - duplicate_ids.npy, duplicate_canonical_ids.npy, duplicate_source_ids.npy - только дубликаты,
+      отсортированные по id канонического чанка, и их источники: по ним get находит источники дубликатов.
+    Обновление индекса дописывает новый сегмент и скрывает удалённые строки старых,
+    поэтому его стоимость зависит от числа изменённых чанков, а не от размера корпуса.
+    Когда удалённых строк или сегментов становится слишком много, хранилище переписывается целиком.
+    Файлы открываются через mmap, поэтому открытие не зависит от размера корпуса,
+    а при поиске читаются только страницы найденных чанков.
+    get возвращает канонический чанк с источниками всех его дубликатов.
+    """
+
+    def __init__(self, segments: list[_Segment]):
+        self._segments = segments
+
+    @classmethod
+    def empty(cls) -> "ChunkStore":
+        return cls([])
+
+    @staticmethod
+    def exists(store_dir: Path) -> bool:
+        return SegmentCatalog.exists(store_dir)
+
+    @classmethod
+    def open(cls, store_dir: Path) -> "ChunkStore":
+        catalog = SegmentCatalog.load(store_dir)
+        return cls([
+            _Segment.open(store_dir / entry.name, removed)
+            for entry, removed in zip(catalog.segments, catalog.removed_sets())
+        ])
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
+
+    def __len__(self) -> int:
+        return sum(segment.live for segment in self._segments)
+
+    @property
+    def segments_count(self) -> int:
+        return len(self._segments)
+
+    @property
+    def removed_count(self) -> int:
+        """Число удалённых строк, которые ещё лежат в сегментах"""
+        return sum(segment.rows - segment.live for segment in self._segments)
+
+    def needs_compaction(self, removed: int, threshold: float) -> bool:
+        """Переписывать ли хранилище целиком, если удалить из него ещё removed строк"""
+        rows = sum(segment.rows for segment in self._segments)
+        return (
+            not rows or
+            len(self._segments) >= MAX_SEGMENTS or
+            self.removed_count + removed >= threshold * rows
+        )
+
+    def get(self, vector_id: VectorId) -> Chunk | None:
+        chunk = None
+        for segment in reversed(self._segments):
+            position = segment.position(vector_id)
+            if position is not None:
+                chunk = segment.chunk_at(position)
+                break
+        if chunk is None:
+            return None
+        duplicate_sources = [
+            segment.source(source_id)
+            for segment in self._segments
+            for _, source_id in segment.duplicates_of(vector_id)
+        ]
+        if duplicate_sources:
+            chunk["source"] = merge_sources([chunk["source"], *duplicate_sources])
+        return chunk
+
+    def duplicates_of(self, canonical_ids: Iterable[VectorId]) -> list[tuple[VectorId, Chunk]]:
+        """Живые дубликаты этих чанков по возрастанию id"""
+        result = []
+        for canonical_id in canonical_ids:
+            for segment in self._segments:
+                for duplicate_id, _ in segment.duplicates_of(canonical_id):
+                    result.append((duplicate_id, self.get(duplicate_id)))
+        return sorted(result, key=lambda item: item[0])
+
+    def items(self) -> Iterator[tuple[VectorId, Chunk]]:
+        for vector_id, _, chunk in self.entries():
+            yield vector_id, chunk
+
+    def entries(self) -> Iterator[tuple[VectorId, VectorId, Chunk]]:
+        """Все чанки по возрастанию id с id их канонических чанков"""
+        return heapq.merge(*(segment.entries() for segment in self._segments), key=lambda entry: entry[0])
+
+    @property
+    def duplicates_count(self) -> int:
+        return sum(segment.duplicates_count for segment in self._segments)
+
+
+class ChunkStoreWriter:
+    """
+    Потоковая запись сегмента хранилища чанков.
+    При append сегмент дописывается к хранилищу, а id из remove скрываются в старых сегментах,
+    иначе хранилище заменяется новым из одного сегмента. Изменения видны после commit.
+    """
+
+    def __init__(self, store_dir: Path, append: bool = False):
+        self._segment = SegmentWriter(store_dir, append=append)
+        self._texts = open(self._segment.segment_dir / _TEXTS_FILE, "wb")
+        self._ids = array("q")
+        self._offsets = array("q", [0])
+        self._source_ids = array("i")
+        self._canonical_ids = array("q")
+        self._sources: dict[str, int] = {}
+
+    def add(self, vector_id: VectorId, chunk: Chunk, canonical_id: VectorId | None = None) -> None:
+        if self._ids and vector_id <= self._ids[-1]:
+            raise ValueError("id чанков должны добавляться по возрастанию")
+        data = chunk["text"].encode("utf-8")
+        self._texts.write(data)
+        self._ids.append(vector_id)
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._source_ids.append(self._sources.setdefault(chunk["source"], len(self._sources)))
+        self._canonical_ids.append(vector_id if canonical_id is None else canonical_id)
+
+    def remove(self, ids: set[VectorId]) -> None:
+        self._segment.remove(ids)
+
+    def commit(self) -> None:
+        self._texts.close()
+        segment_dir = self._segment.segment_dir
+        ids = np.frombuffer(self._ids, dtype="int64")
+        source_ids = np.frombuffer(self._source_ids, dtype="int32")
+        canonical_ids = np.frombuffer(self._canonical_ids, dtype="int64")
+        np.save(segment_dir / _IDS_FILE, ids)
+        np.save(segment_dir / _OFFSETS_FILE, np.frombuffer(self._offsets, dtype="int64"))
+        np.save(segment_dir / _SOURCE_IDS_FILE, source_ids)
+        np.save(segment_dir / _CANONICAL_IDS_FILE, canonical_ids)
+        duplicate_ids, duplicate_canonical_ids, duplicate_source_ids = _duplicates_index(ids, canonical_ids, source_ids)
+        np.save(segment_dir / _DUPLICATE_IDS_FILE, duplicate_ids)
+        np.save(segment_dir / _DUPLICATE_CANONICAL_IDS_FILE, duplicate_canonical_ids)
+        np.save(segment_dir / _DUPLICATE_SOURCE_IDS_FILE, duplicate_source_ids)
+        (segment_dir / _SOURCES_FILE).write_text(
+            json.dumps(list(self._sources), ensure_ascii=False), encoding="utf-8"
+        )
+        self._segment.commit()
@@ -0,0 +1,121 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable
+
+from pydantic import BaseModel
+
+from src.services.retrieval.base import CHUNKS_SEPARATOR, SearchHit, format_chunk, format_chunks
+
+if TYPE_CHECKING:
+    from tokenizers import Tokenizer
+
+
+TokenCounter = Callable[[list[str]], list[int]]
+
+
+def tokenizer_counter(tokenizer: "Tokenizer") -> TokenCounter:
+    """Подсчёт токенов пакетом текстов быстрым токенизатором, без обрезки по длине"""
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_str(tokenizer.to_str())
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+
+    def count_tokens(texts: list[str]) -> list[int]:
+        encodings = tokenizer.encode_batch(texts, add_special_tokens=False)
+        return [len(encoding.ids) for encoding in encodings]
+
+    return count_tokens
+
+
+class ContextBudget(BaseModel):
+    # Сколько токенов может занять весь промпт: контекстное окно LLM минус место под ответ.
+    # None - без ограничения
+    max_prompt_tokens: int | None = None
+    # Запас на служебные токены шаблона чата и расхождение токенизаторов
+    reserve_tokens: int = 64
+    # Чанки дальше этого расстояния от запроса в контекст не попадают
+    max_distance: float | None = None
+
+
+@dataclass
+class PackedContext:
+    context: str
+    used: list[SearchHit]
+    dropped_by_distance: list[SearchHit] = field(default_factory=list)
+    dropped_by_budget: list[SearchHit] = field(default_factory=list)
+    # Токенов в контексте и сколько было доступно (None - без ограничения)
+    tokens: int = 0
+    available_tokens: int | None = None
+
+    @property
+    def report(self) -> str | None:
+        """Что не вошло в контекст, None - если вошло всё найденное"""
+        lines = []
+        if self.dropped_by_distance:
+            lines.append(f"Отброшено по расстоянию: {len(self.dropped_by_distance)}")
+        if self.dropped_by_budget:
+            sources = ", ".join(hit.chunk["source"] for hit in self.dropped_by_budget)
+            lines.append(
+                f"Не поместилось в {self.available_tokens} токенов контекста: "
+                f"{len(self.dropped_by_budget)} ({sources})"
+            )
+        if not lines:
+            return None
+        return f"Контекст: {len(self.used)} чанков, {self.tokens} токенов. " + "; ".join(lines)
+
+
+class ContextPacker:
+    """
+    Укладывает найденные чанки в контекстное окно LLM.
+    Чанки берутся по порядку релевантности, пока помещаются в бюджет:
+    max_prompt_tokens минус промпт без контекста и reserve_tokens.
+    Чанк, который не поместился, пропускается, а следующие за ним ещё пробуются.
+    """
+
+    def __init__(self, count_tokens: TokenCounter, budget: ContextBudget):
+        self._count_tokens = count_tokens
+        self.budget = budget
+        self._separator_tokens = count_tokens([CHUNKS_SEPARATOR])[0]
+
+    def count(self, text: str) -> int:
+        return self._count_tokens([text])[0]
+
+    def pack(self, hits: list[SearchHit], prompt_tokens: int) -> PackedContext:
+        """
+        Args:
+            hits: Найденные чанки по убыванию релевантности
+            prompt_tokens: Длина промпта без контекста в токенах
+        """
+        max_distance = self.budget.max_distance
+        candidates: list[SearchHit] = []
+        dropped_by_distance: list[SearchHit] = []
+        for hit in hits:
+            if max_distance is not None and hit.distance is not None and hit.distance > max_distance:
+                dropped_by_distance.append(hit)
+            else:
+                candidates.append(hit)
+
+        lengths = self._count_tokens([format_chunk(hit.chunk) for hit in candidates]) if candidates else []
+        available = None
+        if self.budget.max_prompt_tokens is not None:
+            available = max(self.budget.max_prompt_tokens - self.budget.reserve_tokens - prompt_tokens, 0)
+
+        used: list[SearchHit] = []
+        dropped_by_budget: list[SearchHit] = []
+        tokens = 0
+        for hit, length in zip(candidates, lengths):
+            cost = length + (self._separator_tokens if used else 0)
+            if available is not None and tokens + cost > available:
+                dropped_by_budget.append(hit)
+                continue
+            used.append(hit)
+            tokens += cost
+
+        return PackedContext(
+            context=format_chunks([hit.chunk for hit in used]),
+            used=used,
+            dropped_by_distance=dropped_by_distance,
+            dropped_by_budget=dropped_by_budget,
+            tokens=tokens,
+            available_tokens=available
+        )
@@ -0,0 +1,256 @@
+import shutil
+from pathlib import Path
+from typing import Generic, Hashable, Iterable, TypeVar
+
+import mmh3
+import numpy as np
+from pydantic import BaseModel
+
+from src.services.retrieval.bm25_index import tokenize
+from src.services.retrieval.segments import replace_dir
+
+
+ChunkKeyTypeVar = TypeVar("ChunkKeyTypeVar", bound=Hashable)
+
+# Простое число Мерсенна 2^31 - 1: хэши перестановок считаются по модулю без переполнения uint64
+_PRIME = (1 << 31) - 1
+# Фиксированное зерно: сигнатуры должны совпадать между запусками
+_PERMUTATIONS_SEED = 1
+SOURCES_SEPARATOR = ", "
+# Множитель полиномиального хэша полосы сигнатуры (простое число FNV-64)
+_BAND_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+_LOW_BITS = (1 << 64) - 1
+
+_KEYS_FILE = "keys.npy"
+_SIGNATURES_FILE = "signatures.npy"
+_EXACT_LOW_FILE = "exact_low.npy"
+_EXACT_HIGH_FILE = "exact_high.npy"
+_EXACT_KEYS_FILE = "exact_keys.npy"
+_BAND_HASHES_FILE = "band_hashes.npy"
+_BAND_KEYS_FILE = "band_keys.npy"
+
+
+class DedupParams(BaseModel):
+    """
+    Параметры поиска дубликатов чанков. Сохраняются в манифесте FAISS
+    или в метаданных коллекции Chroma, при их изменении индекс перестраивается.
+    """
+    enabled: bool = False
+    # Минимальная оценка сходства Жаккара по шинглам, начиная с которой чанки - дубликаты
+    threshold: float = 0.8
+    # Длина шингла в словах
+    shingle_size: int = 3
+    num_perm: int = 64
+    # LSH: сигнатура делится на bands полос по num_perm // bands значений
+    bands: int = 16
+
+
+def merge_sources(sources: Iterable[str]) -> str:
+    """Источники чанка и его дубликатов одной строкой, без повторов"""
+    return SOURCES_SEPARATOR.join(dict.fromkeys(sources))
+
+
+class _SavedDedupState:
+    """
+    Сохранённое состояние дедупликатора, открытое через mmap:
+    - keys.npy, signatures.npy - id канонических чанков по возрастанию и их MinHash-сигнатуры;
+    - exact_low.npy, exact_high.npy, exact_keys.npy - 128-битные хэши точных копий,
+      отсортированные по младшим 64 битам, и id их чанков;
+    - band_hashes.npy, band_keys.npy - LSH: хэши полос сигнатур (bands строк, каждая
+      отсортирована) и id чанков в том же порядке.
+    """
+
+    def __init__(self, state_dir: Path):
+        self.keys = np.load(state_dir / _KEYS_FILE, mmap_mode="r")
+        self.signatures = np.load(state_dir / _SIGNATURES_FILE, mmap_mode="r")
+        self.exact_low = np.load(state_dir / _EXACT_LOW_FILE, mmap_mode="r")
+        self.exact_high = np.load(state_dir / _EXACT_HIGH_FILE, mmap_mode="r")
+        self.exact_keys = np.load(state_dir / _EXACT_KEYS_FILE, mmap_mode="r")
+        self.band_hashes = np.load(state_dir / _BAND_HASHES_FILE, mmap_mode="r")
+        self.band_keys = np.load(state_dir / _BAND_KEYS_FILE, mmap_mode="r")
+
+    def exact(self, exact_hash: int) -> list[int]:
+        low = np.uint64(exact_hash & _LOW_BITS)
+        start = np.searchsorted(self.exact_low, low, side="left")
+        end = np.searchsorted(self.exact_low, low, side="right")
+        return [
+            int(self.exact_keys[position]) for position in range(start, end)
+            if int(self.exact_high[position]) == exact_hash >> 64
+        ]
+
+    def signature(self, key: int) -> np.ndarray | None:
+        position = int(np.searchsorted(self.keys, key))
+        if position >= len(self.keys) or self.keys[position] != key:
+            return None
+        return np.asarray(self.signatures[position])
+
+    def band(self, band: int, band_hash: int) -> list[int]:
+        hashes = self.band_hashes[band]
+        start = np.searchsorted(hashes, np.uint64(band_hash), side="left")
+        end = np.searchsorted(hashes, np.uint64(band_hash), side="right")
+        return [int(key) for key in self.band_keys[band][start:end]]
+
+
+class ChunkDeduplicator(Generic[ChunkKeyTypeVar]):
+    """
+    Поиск дубликатов среди чанков в порядке их поступления.
+    Точные копии (без учёта регистра, пунктуации и пробелов) находятся по 128-битному mmh3,
+    почти совпадающие - по MinHash-сигнатурам шинглов слов через LSH: кандидаты
+    из общих полос сигнатуры проверяются по оценке сходства Жаккара.
+    Запоминаются только канонические чанки - первые из группы дубликатов.
+    Если ключи - id векторов, состояние сохраняется в директорию (save) и открывается
+    через mmap (load), поэтому при обновлении индекса сигнатуры сохранённых чанков не пересчитываются.
+    """
+
+    def __init__(self, params: DedupParams):
+        if params.num_perm % params.bands:
+            raise ValueError("num_perm должен делиться на bands")
+        self.params = params
+        self._rows = params.num_perm // params.bands
+        rng = np.random.default_rng(_PERMUTATIONS_SEED)
+        self._a = rng.integers(1, _PRIME, size=(params.num_perm, 1), dtype="uint64")
+        self._b = rng.integers(0, _PRIME, size=(params.num_perm, 1), dtype="uint64")
+        self._exact: dict[int, ChunkKeyTypeVar] = {}
+        self._bands: list[dict[int, list[ChunkKeyTypeVar]]] = [{} for _ in range(params.bands)]
+        self._signatures: dict[ChunkKeyTypeVar, np.ndarray] = {}
+        self._saved: _SavedDedupState | None = None
+        self._removed: set[ChunkKeyTypeVar] = set()
+        self.duplicates = 0
+
+    @staticmethod
+    def exists(state_dir: Path) -> bool:
+        return (state_dir / _BAND_KEYS_FILE).exists()
+
+    @classmethod
+    def load(cls, state_dir: Path, params: DedupParams) -> "ChunkDeduplicator[int]":
+        deduplicator = cls(params)
+        deduplicator._saved = _SavedDedupState(state_dir)
+        return deduplicator
+
+    def _signature(self, tokens: list[str]) -> np.ndarray:
+        size = self.params.shingle_size
+        shingles = {" ".join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 1))}
+        hashes = np.fromiter(
+            (mmh3.hash(shingle, signed=False) % _PRIME for shingle in shingles),
+            dtype="uint64", count=len(shingles)
+        )
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype("uint32")
+
+    def _band_hashes(self, signatures: np.ndarray) -> np.ndarray:
+        """64-битные хэши полос сигнатур: (n, num_perm) -> (n, bands)"""
+        rows = signatures.reshape(len(signatures), self.params.bands, self._rows).astype("uint64")
+        hashes = np.zeros(rows.shape[:2], dtype="uint64")
+        for column in range(self._rows):
+            hashes = hashes * _BAND_HASH_MULTIPLIER + rows[:, :, column]
+        return hashes
+
+    def _live(self, keys: Iterable[ChunkKeyTypeVar]) -> list[ChunkKeyTypeVar]:
+        return [key for key in keys if key not in self._removed]
+
+    def _exact_key(self, exact_hash: int) -> ChunkKeyTypeVar | None:
+        candidates = [self._exact[exact_hash]] if exact_hash in self._exact else []
+        if self._saved is not None:
+            candidates.extend(self._saved.exact(exact_hash))
+        live = self._live(candidates)
+        return live[0] if live else None
+
+    def _candidate_signature(self, key: ChunkKeyTypeVar) -> np.ndarray | None:
+        if key in self._signatures:
+            return self._signatures[key]
+        return self._saved.signature(key) if self._saved is not None else None
+
+    def _find(self, exact_hash: int, signature: np.ndarray | None) -> ChunkKeyTypeVar | None:
+        canonical = self._exact_key(exact_hash)
+        if canonical is not None or signature is None:
+            return canonical
+        best, best_similarity = None, self.params.threshold
+        for band, band_hash in enumerate(self._band_hashes(signature[None])[0].tolist()):
+            candidates = self._bands[band].get(band_hash, [])
+            if self._saved is not None:
+                candidates = [*candidates, *self._saved.band(band, band_hash)]
+            for candidate in self._live(candidates):
+                candidate_signature = self._candidate_signature(candidate)
+                similarity = float(np.mean(candidate_signature == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+        return best
+
+    def _hashes(self, text: str) -> tuple[int, np.ndarray | None]:
+        tokens = tokenize(text)
+        exact_hash = mmh3.hash128(" ".join(tokens) if tokens else text, signed=False)
+        return exact_hash, self._signature(tokens) if tokens else None
+
+    def _remember(self, key: ChunkKeyTypeVar, exact_hash: int, signature: np.ndarray | None) -> None:
+        self._removed.discard(key)
+        if self._exact_key(exact_hash) is None:
+            self._exact[exact_hash] = key
+        if signature is not None:
+            self._signatures[key] = signature
+            for band, band_hash in enumerate(self._band_hashes(signature[None])[0].tolist()):
+                self._bands[band].setdefault(band_hash, []).append(key)
+
+    def add(self, key: ChunkKeyTypeVar, text: str) -> None:
+        """Запоминает чанк как канонический без проверки"""
+        self._remember(key, *self._hashes(text))
+
+    def check(self, key: ChunkKeyTypeVar, text: str) -> ChunkKeyTypeVar | None:
+        """
+        Возвращает ключ канонического чанка, дубликатом которого является text.
+        Если такого нет, чанк запоминается как канонический и возвращается None.
+        """
+        exact_hash, signature = self._hashes(text)
+        canonical = self._find(exact_hash, signature)
+        if canonical is not None:
+            self.duplicates += 1
+            return canonical
+        self._remember(key, exact_hash, signature)
+        return None
+
+    def remove(self, keys: Iterable[ChunkKeyTypeVar]) -> None:
+        """Забывает канонические чанки: с ними больше не сравниваются новые"""
+        self._removed.update(keys)
+
+    def save(self, state_dir: Path) -> None:
+        """Сохраняет состояние с ключами - id векторов, удалённые чанки не сохраняются"""
+        if self._saved is not None and not self._exact and not self._removed:
+            return
+        keys = [key for key in self._signatures if key not in self._removed]
+        signatures = [self._signatures[key] for key in keys]
+        exact = [(exact_hash, key) for exact_hash, key in self._exact.items() if key not in self._removed]
+        exact_low = [exact_hash & _LOW_BITS for exact_hash, _ in exact]
+        exact_high = [exact_hash >> 64 for exact_hash, _ in exact]
+        exact_keys = [key for _, key in exact]
+
+        all_keys = np.asarray(keys, dtype="int64")
+        all_signatures = np.asarray(signatures, dtype="uint32").reshape(len(keys), self.params.num_perm)
+        all_exact_low = np.asarray(exact_low, dtype="uint64")
+        all_exact_high = np.asarray(exact_high, dtype="uint64")
+        all_exact_keys = np.asarray(exact_keys, dtype="int64")
+        if self._saved is not None:
+            removed = np.fromiter(self._removed, dtype="int64")
+            live = ~np.isin(self._saved.keys, removed)
+            all_keys = np.concatenate([self._saved.keys[live], all_keys])
+            all_signatures = np.concatenate([self._saved.signatures[live], all_signatures])
+            live = ~np.isin(self._saved.exact_keys, removed)
+            all_exact_low = np.concatenate([self._saved.exact_low[live], all_exact_low])
+            all_exact_high = np.concatenate([self._saved.exact_high[live], all_exact_high])
+            all_exact_keys = np.concatenate([self._saved.exact_keys[live], all_exact_keys])
+
+        order = np.argsort(all_keys, kind="stable")
+        all_keys, all_signatures = all_keys[order], all_signatures[order]
+        order = np.argsort(all_exact_low, kind="stable")
+        band_hashes = self._band_hashes(all_signatures).T
+        band_order = np.argsort(band_hashes, axis=1, kind="stable")
+
+        tmp_dir = state_dir.with_name(state_dir.name + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        np.save(tmp_dir / _KEYS_FILE, all_keys)
+        np.save(tmp_dir / _SIGNATURES_FILE, all_signatures)
+        np.save(tmp_dir / _EXACT_LOW_FILE, all_exact_low[order])
+        np.save(tmp_dir / _EXACT_HIGH_FILE, all_exact_high[order])
+        np.save(tmp_dir / _EXACT_KEYS_FILE, all_exact_keys[order])
+        np.save(tmp_dir / _BAND_HASHES_FILE, np.take_along_axis(band_hashes, band_order, axis=1))
+        np.save(tmp_dir / _BAND_KEYS_FILE, all_keys[band_order])
+        replace_dir(tmp_dir, state_dir)
@@ -0,0 +1,283 @@
+from enum import Enum
+from pathlib import Path
+import time
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.services.retrieval.embedding_cache import TextEncoder
+
+if TYPE_CHECKING:
+    from tokenizers import Tokenizer
+
+
+class EmbeddingBackend(str, Enum):
+    """ Чем считаются эмбеддинги выбранной EmbeddingModel """
+    TORCH = "torch"
+    ONNX = "onnx"
+    ONNX_INT8 = "onnx_int8"
+
+
+class EmbeddingParams(BaseModel):
+    """
+    Модель, которой посчитаны векторы индекса. Сохраняется в манифесте FAISS
+    или в метаданных коллекции Chroma, при её смене индекс перестраивается.
+    """
+    model: str = ""
+    backend: EmbeddingBackend = EmbeddingBackend.TORCH
+
+
+_ONNX_FILE = "model.onnx"
+_ONNX_INT8_FILE = "model.int8.onnx"
+_META_FILE = "meta.json"
+_TOKENIZER_FILE = "tokenizer.json"
+_ONNX_OPSET = 17
+
+# Фразы, на которых после экспорта сравниваются эмбеддинги ONNX и PyTorch
+_PROBE_TEXTS = [
+    "Какой срок исковой давности по договору займа?",
+    "Налоговый вычет при покупке квартиры",
+    "Статья 81 Трудового кодекса: расторжение трудового договора по инициативе работодателя",
+    "Заметки по настройке FAISS индекса и параметру nprobe",
+    "How do I configure the retrieval pipeline?",
+    "The court dismissed the appeal on procedural grounds.",
+    "Рецепт борща со сметаной",
+    "a",
+]
+# Сколько раз повторяются _PROBE_TEXTS при замере скорости эмбеддинга
+_THROUGHPUT_REPEATS = 32
+
+
+class OnnxModelMeta(BaseModel):
+    """Параметры экспортированной модели, нужные для инференса без PyTorch"""
+    pooling: str
+    normalize: bool
+    max_seq_length: int
+    dim: int
+    input_names: list[str]
+    # Сходство с эмбеддингами PyTorch на _PROBE_TEXTS для каждого варианта модели
+    accuracy: dict[EmbeddingBackend, dict[str, float]] = {}
+    # Скорость эмбеддинга _PROBE_TEXTS в текстах в секунду для PyTorch и каждого варианта модели
+    throughput: dict[EmbeddingBackend, float] = {}
+
+
+def compare_embeddings(reference: np.ndarray, candidate: np.ndarray) -> dict[str, float]:
+    """Косинусное сходство построчно: среднее и минимальное"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = np.sum(reference * candidate, axis=1)
+    return {"cosine_mean": float(cosine.mean()), "cosine_min": float(cosine.min())}
+
+
+def measure_throughput(model: TextEncoder, texts: list[str], repeats: int = _THROUGHPUT_REPEATS) -> float:
+    """Тексты в секунду при эмбеддинге texts, повторённых repeats раз. Первый прогон - прогрев"""
+    model.encode(texts)
+    batch = texts * repeats
+    start_time = time.perf_counter()
+    model.encode(batch)
+    return len(batch) / (time.perf_counter() - start_time)
+
+
+def _pooling_mode(module: Any) -> str:
+    # В sentence-transformers 5.x режим отдаёт get_pooling_mode_str, в новых версиях - атрибут pooling_mode
+    if hasattr(module, "get_pooling_mode_str"):
+        return module.get_pooling_mode_str()
+    return str(module.pooling_mode)
+
+
+def export_onnx_model(model_name: str, model_dir: Path) -> OnnxModelMeta:
+    """
+    Экспортирует трансформер модели SentenceTransformer в ONNX, сохраняет токенизатор
+    и параметры пулинга. Выполняется один раз, дальше модель грузится без PyTorch.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    print(f"Экспорт модели {model_name} в ONNX...")
+    st_model = SentenceTransformer(model_name, device="cpu")
+    modules = list(st_model)
+    pooling = _pooling_mode(modules[1]) if len(modules) > 1 else "mean"
+    if pooling not in ("mean", "cls"):
+        raise ValueError(f"Пулинг {pooling} не поддерживается ONNX-бэкендом")
+    normalize = any(type(module).__name__ == "Normalize" for module in modules)
+
+    transformer = modules[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    encoded = tokenizer(["пример текста", "второй пример"], padding=True, return_tensors="pt")
+    input_names = [
+        name for name in ("input_ids", "attention_mask", "token_type_ids") if name in encoded
+    ]
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, model: torch.nn.Module):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(transformer),
+            tuple(encoded[name] for name in input_names),
+            str(model_dir / _ONNX_FILE),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=_ONNX_OPSET,
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(str(model_dir))
+
+    meta = OnnxModelMeta(
+        pooling=pooling,
+        normalize=normalize,
+        max_seq_length=st_model.max_seq_length,
+        dim=st_model.get_sentence_embedding_dimension(),
+        input_names=input_names,
+    )
+    reference = st_model.encode(_PROBE_TEXTS)
+    meta.throughput[EmbeddingBackend.TORCH] = measure_throughput(st_model, _PROBE_TEXTS)
+    quantize_onnx_model(model_dir)
+    for backend in (EmbeddingBackend.ONNX, EmbeddingBackend.ONNX_INT8):
+        encoder = OnnxTextEncoder(model_dir, quantized=backend == EmbeddingBackend.ONNX_INT8, meta=meta)
+        meta.accuracy[backend] = compare_embeddings(reference, encoder.encode(_PROBE_TEXTS))
+        meta.throughput[backend] = measure_throughput(encoder, _PROBE_TEXTS)
+    (model_dir / _META_FILE).write_text(meta.model_dump_json(indent=2), encoding="utf-8")
+
+    torch_throughput = meta.throughput[EmbeddingBackend.TORCH]
+    print(f"{EmbeddingBackend.TORCH.value}: {torch_throughput:.1f} текстов/сек")
+    for backend, accuracy in meta.accuracy.items():
+        throughput = meta.throughput[backend]
+        print(
+            f"{backend.value}: {throughput:.1f} текстов/сек (x{throughput / torch_throughput:.2f} к PyTorch), "
+            f"косинусное сходство с PyTorch "
+            f"среднее {accuracy['cosine_mean']:.5f}, минимальное {accuracy['cosine_min']:.5f}"
+        )
+    return meta
+
+
+def quantize_onnx_model(model_dir: Path) -> None:
+    """Динамическое int8-квантование весов: активации квантуются на лету, калибровка не нужна"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        str(model_dir / _ONNX_FILE),
+        str(model_dir / _ONNX_INT8_FILE),
+        weight_type=QuantType.QInt8,
+    )
+
+
+class OnnxTextEncoder:
+    """
+    Эмбеддинги модели SentenceTransformer через ONNX Runtime на CPU.
+    Токенизация - быстрым токенизатором из tokenizers, пулинг и нормализация - в numpy,
+    поэтому при инференсе PyTorch не импортируется.
+    """
+
+    def __init__(
+            self,
+            model_dir: Path,
+            quantized: bool = False,
+            threads: int = 0,
+            meta: OnnxModelMeta | None = None
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.meta = meta or OnnxModelMeta.model_validate_json(
+            (model_dir / _META_FILE).read_text(encoding="utf-8")
+        )
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(
+            str(model_dir / (_ONNX_INT8_FILE if quantized else _ONNX_FILE)),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._tokenizer = Tokenizer.from_file(str(model_dir / _TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length=self.meta.max_seq_length)
+        self._tokenizer.no_padding()
+
+    @property
+    def tokenizer(self) -> "Tokenizer":
+        return self._tokenizer
+
+    @property
+    def max_seq_length(self) -> int:
+        return self.meta.max_seq_length
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.meta.dim
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        length = max(len(encoding.ids) for encoding in encodings)
+        inputs = {name: np.zeros((len(texts), length), dtype="int64") for name in self.meta.input_names}
+        for row, encoding in enumerate(encodings):
+            size = len(encoding.ids)
+            inputs["input_ids"][row, :size] = encoding.ids
+            inputs["attention_mask"][row, :size] = encoding.attention_mask
+            if "token_type_ids" in inputs:
+                inputs["token_type_ids"][row, :size] = encoding.type_ids
+
+        token_embeddings = self._session.run(None, inputs)[0]
+        if self.meta.pooling == "cls":
+            embeddings = token_embeddings[:, 0]
+        else:
+            mask = inputs["attention_mask"][:, :, None].astype("float32")
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.meta.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype("float32")
+
+    def encode(self, sentences: list[str] | str, batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        result = np.empty((len(texts), self.meta.dim), dtype="float32")
+        # Тексты близкой длины попадают в один батч, чтобы меньше считать паддинг
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            positions = order[start:start + batch_size]
+            result[positions] = self._encode_batch([texts[i] for i in positions])
+        return result[0] if single else result
+
+
+def get_fast_tokenizer(model: TextEncoder) -> "Tokenizer":
+    """Быстрый токенизатор (tokenizers.Tokenizer) модели эмбеддингов любого бэкенда"""
+    if isinstance(model, OnnxTextEncoder):
+        return model.tokenizer
+    return model.tokenizer.backend_tokenizer
+
+
+def create_embedding_model(
+        backend: EmbeddingBackend,
+        model_name: str,
+        models_dir: Path,
+        threads: int = 0
+) -> TextEncoder:
+    """
+    Создаёт модель эмбеддингов для выбранного бэкенда.
+    Для ONNX модель при первом запуске экспортируется в models_dir.
+    """
+    if backend == EmbeddingBackend.TORCH:
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name)
+
+    model_dir = models_dir / model_name.replace("/", "__")
+    if not (model_dir / _META_FILE).exists():
+        start_time = time.perf_counter()
+        export_onnx_model(model_name, model_dir)
+        print(f"Модель экспортирована за {time.perf_counter() - start_time:.2f} сек")
+    return OnnxTextEncoder(
+        model_dir,
+        quantized=backend == EmbeddingBackend.ONNX_INT8,
+        threads=threads,
+    )
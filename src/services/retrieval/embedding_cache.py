@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+
+CacheKey = bytes
+
+_KEY_SIZE = 16
+
+
+class TextEncoder(Protocol):
+    def encode(self, sentences: list[str], **kwargs) -> np.ndarray:
+        ...
+
+
+class EmbeddingCache:
+    """
+    Дисковый кэш эмбеддингов чанков.
+
+    Для каждой модели эмбеддингов заводится своя директория, в ней:
+    - keys.bin - подряд записанные blake2b-хэши текстов чанков;
+    - vectors.f32 - подряд записанные float32 векторы в том же порядке,
+      файл открывается через np.memmap.
+    Запись только дописывает в конец файлов, поэтому кэш переживает смену
+    CHUNK_SIZE/OVERLAP и переключение движков: совпавшие тексты не эмбеддятся повторно.
+    """
+
+    def __init__(self, cache_dir: Path, model_name: str):
+        self._dir = cache_dir / model_name.replace("/", "__")
+        self._keys_file = self._dir / "keys.bin"
+        self._vectors_file = self._dir / "vectors.f32"
+        self._meta_file = self._dir / "meta.json"
+        self._rows: dict[CacheKey, int] | None = None
+        self._vectors: np.memmap | None = None
+        self._dim: int | None = None
+
+    @staticmethod
+    def key(text: str) -> CacheKey:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=_KEY_SIZE).digest()
+
+    def __len__(self) -> int:
+        return len(self._get_rows())
+
+    def _get_rows(self) -> dict[CacheKey, int]:
+        if self._rows is not None:
+            return self._rows
+        self._rows = {}
+        if not self._meta_file.exists():
+            return self._rows
+
+        self._dim = json.loads(self._meta_file.read_text(encoding="utf-8"))["dim"]
+        keys = self._keys_file.read_bytes() if self._keys_file.exists() else b""
+        vector_size = self._dim * np.dtype("float32").itemsize
+        vectors_bytes = self._vectors_file.stat().st_size if self._vectors_file.exists() else 0
+        # Если запись была прервана, учитываем только полностью записанные строки
+        rows_count = min(len(keys) // _KEY_SIZE, vectors_bytes // vector_size)
+        if len(keys) != rows_count * _KEY_SIZE:
+            os.truncate(self._keys_file, rows_count * _KEY_SIZE)
+        if vectors_bytes != rows_count * vector_size:
+            os.truncate(self._vectors_file, rows_count * vector_size)
+        for row in range(rows_count):
+            self._rows[keys[row * _KEY_SIZE:(row + 1) * _KEY_SIZE]] = row
+        return self._rows
+
+    def _get_vectors(self) -> np.memmap:
+        if self._vectors is None:
+            self._vectors = np.memmap(self._vectors_file, dtype="float32", mode="r").reshape(-1, self._dim)
+        return self._vectors
+
+    def _append(self, keys: list[CacheKey], embeddings: np.ndarray) -> None:
+        rows = self._get_rows()
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        self._dir.mkdir(parents=True, exist_ok=True)
+        if self._dim is None:
+            self._dim = embeddings.shape[1]
+            self._meta_file.write_text(json.dumps({"dim": self._dim}), encoding="utf-8")
+
+        start_row = len(rows)
+        with open(self._vectors_file, "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self._keys_file, "ab") as f:
+            f.write(b"".join(keys))
+        for offset, key in enumerate(keys):
+            rows[key] = start_row + offset
+        self._vectors = None
+
+    def encode(self, model: TextEncoder, texts: list[str], **kwargs) -> np.ndarray:
+        """Эмбеддинги текстов: из кэша, а для отсутствующих в нём - через модель"""
+        if not texts:
+            return np.asarray(model.encode(texts, **kwargs), dtype="float32")
+        rows = self._get_rows()
+        keys = [self.key(text) for text in texts]
+
+        missing: dict[CacheKey, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in rows:
+                missing[key] = text
+        if missing:
+            embeddings = model.encode(list(missing.values()), **kwargs)
+            self._append(list(missing), embeddings)
+
+        vectors = self._get_vectors()
+        return np.asarray(vectors[[rows[key] for key in keys]], dtype="float32")
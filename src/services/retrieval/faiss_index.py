@@ -0,0 +1,86 @@
+from enum import Enum
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel
+
+# faiss импортируется при первом создании или настройке индекса, а не при запуске приложения
+if TYPE_CHECKING:
+    import faiss
+
+
+class FAISSIndexType(str, Enum):
+    FLAT = "flat"
+    IVF_FLAT = "ivf_flat"
+    IVF_PQ = "ivf_pq"
+    HNSW = "hnsw"
+
+
+class FAISSIndexParams(BaseModel):
+    """
+    Параметры структуры индекса. Сохраняются в манифесте,
+    при их изменении индекс перестраивается.
+    """
+    index_type: FAISSIndexType = FAISSIndexType.FLAT
+    nlist: int = 1024
+    pq_m: int = 16
+    pq_nbits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 40
+
+    @property
+    def needs_training(self) -> bool:
+        return self.index_type in (FAISSIndexType.IVF_FLAT, FAISSIndexType.IVF_PQ)
+
+    @property
+    def supports_removal(self) -> bool:
+        return self.index_type != FAISSIndexType.HNSW
+
+
+# Минимум обучающих векторов на центроид, меньше faiss считает недостаточным
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def create_index(params: FAISSIndexParams, dim: int, train_size: int = 0) -> "faiss.IndexIDMap2":
+    """
+    Создаёт пустой индекс с поддержкой пользовательских id.
+
+    Args:
+        params (FAISSIndexParams): Параметры индекса
+        dim (int): Размерность векторов
+        train_size (int): Число векторов, на которых индекс будет обучаться.
+            Для IVF по нему уменьшается nlist, если векторов слишком мало.
+    """
+    import faiss
+
+    if params.index_type == FAISSIndexType.FLAT:
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    if params.index_type == FAISSIndexType.HNSW:
+        base = faiss.IndexHNSWFlat(dim, params.hnsw_m)
+        base.hnsw.efConstruction = params.ef_construction
+        return faiss.IndexIDMap2(base)
+
+    nlist = max(1, min(params.nlist, train_size // _MIN_POINTS_PER_CENTROID))
+    if nlist < params.nlist:
+        print(f"Мало векторов для обучения ({train_size}), nlist уменьшен до {nlist}")
+    if params.index_type == FAISSIndexType.IVF_FLAT:
+        return faiss.IndexIDMap2(faiss.index_factory(dim, f"IVF{nlist},Flat"))
+
+    if dim % params.pq_m:
+        raise ValueError(f"Размерность эмбеддингов {dim} не делится на pq_m={params.pq_m}")
+    # Кодовые книги PQ - 2^pq_nbits центроидов в каждом подпространстве, им нужно столько же точек на центроид
+    if train_size < _MIN_POINTS_PER_CENTROID * 2 ** params.pq_nbits:
+        print(f"Мало векторов для обучения PQ ({train_size}), используется IVF-Flat")
+        return faiss.IndexIDMap2(faiss.index_factory(dim, f"IVF{nlist},Flat"))
+    return faiss.IndexIDMap2(faiss.index_factory(dim, f"IVF{nlist},PQ{params.pq_m}x{params.pq_nbits}"))
+
+
+def apply_search_params(index: "faiss.IndexIDMap2", nprobe: int, ef_search: int) -> None:
+    """Выставляет параметры поиска, которые не требуют перестройки индекса"""
+    import faiss
+
+    base = faiss.downcast_index(index.index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = nprobe
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search
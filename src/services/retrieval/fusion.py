@@ -0,0 +1,24 @@
+from typing import Hashable, Sequence, TypeVar
+
+
+ItemTypeVar = TypeVar("ItemTypeVar", bound=Hashable)
+
+# Значение из статьи Cormack et al. о RRF, сглаживает вклад первых позиций
+DEFAULT_RRF_K = 60
+
+
+def reciprocal_rank_fusion(
+        rankings: Sequence[Sequence[ItemTypeVar]],
+        k: int,
+        rrf_k: int = DEFAULT_RRF_K
+) -> list[ItemTypeVar]:
+    """
+    Объединяет несколько ранжированных списков: документ получает сумму 1 / (rrf_k + ранг)
+    по всем спискам, где он встретился. Оценки разных поисков при этом не сравниваются,
+    важны только позиции. Возвращает k лучших документов.
+    """
+    scores: dict[ItemTypeVar, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)[:k]
@@ -0,0 +1,143 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+
+FileKey = str
+VectorId = int
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_content_hash(file: Path) -> str:
+    """Считает sha256 содержимого файла, читая его блоками"""
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ManifestEntry(BaseModel):
+    """Состояние проиндексированного файла и диапазон id его векторов [start_id, end_id)"""
+    size: int
+    mtime: float
+    content_hash: str
+    start_id: VectorId
+    end_id: VectorId
+
+    @property
+    def ids(self) -> range:
+        return range(self.start_id, self.end_id)
+
+
+@dataclass
+class FileState:
+    key: FileKey
+    path: Path
+    size: int
+    mtime: float
+    content_hash: str
+
+
+@dataclass
+class ManifestDiff:
+    changed: list[FileState] = field(default_factory=list)
+    deleted: list[FileKey] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.changed and not self.deleted
+
+
+class IndexManifest(BaseModel):
+    """
+    Манифест индекса: какие файлы и в каком состоянии уже проиндексированы.
+    Хранится рядом с файлом индекса и позволяет перестраивать только изменившиеся файлы.
+    """
+    next_id: VectorId = 0
+    files: dict[FileKey, ManifestEntry] = {}
+    # Параметры, с которыми построен индекс
+    index_params: dict[str, Any] = {}
+    dedup_params: dict[str, Any] = {}
+    chunk_params: dict[str, Any] = {}
+    embedding_params: dict[str, Any] = {}
+    # Отметка последней записи индекса: совпадает с файлом generation, только если запись завершилась
+    generation: str = ""
+
+    @classmethod
+    def load(cls, path: Path) -> "IndexManifest":
+        return cls.model_validate_json(path.read_text(encoding="utf-8"))
+
+    def save(self, path: Path) -> None:
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(self.model_dump_json(), encoding="utf-8")
+        tmp_path.replace(path)
+
+    def diff(self, files: dict[FileKey, Path]) -> ManifestDiff:
+        """
+        Сравнивает манифест с текущим набором файлов.
+        Хэш содержимого считается только для файлов с изменившимися размером или mtime.
+        Если содержимое не поменялось, в манифесте просто обновляется mtime.
+        """
+        result = ManifestDiff()
+        for key, path in files.items():
+            stat = path.stat()
+            entry = self.files.get(key)
+            if entry is not None and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+                continue
+            content_hash = file_content_hash(path)
+            if entry is not None and entry.content_hash == content_hash:
+                entry.size = stat.st_size
+                entry.mtime = stat.st_mtime
+                continue
+            result.changed.append(FileState(
+                key=key,
+                path=path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                content_hash=content_hash,
+            ))
+        result.deleted = [key for key in self.files if key not in files]
+        return result
+
+    @property
+    def version(self) -> str:
+        """Хэш содержимого проиндексированных файлов и параметров индекса, не зависит от mtime"""
+        digest = hashlib.sha256()
+        for key in sorted(self.files):
+            digest.update(f"{key}\0{self.files[key].content_hash}\n".encode("utf-8"))
+        params = [self.index_params, self.dedup_params, self.chunk_params, self.embedding_params]
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def stale_ids(self, diff: ManifestDiff) -> list[VectorId]:
+        """id векторов удалённых и изменённых файлов"""
+        ids: list[VectorId] = []
+        for key in diff.deleted:
+            ids.extend(self.files[key].ids)
+        for state in diff.changed:
+            entry = self.files.get(state.key)
+            if entry is not None:
+                ids.extend(entry.ids)
+        return ids
+
+    def add_file(self, state: FileState, chunks_count: int) -> range:
+        """Регистрирует файл и выделяет ему новый диапазон id"""
+        start_id = self.next_id
+        self.next_id += chunks_count
+        self.files[state.key] = ManifestEntry(
+            size=state.size,
+            mtime=state.mtime,
+            content_hash=state.content_hash,
+            start_id=start_id,
+            end_id=self.next_id,
+        )
+        return range(start_id, self.next_id)
+
+    def remove_file(self, key: FileKey) -> None:
+        self.files.pop(key, None)
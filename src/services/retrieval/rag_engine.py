@@ -1,26 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import cached_property
+import hashlib
 from pathlib import Path
-import pickle
-from typing import Type
-import chromadb
-from chromadb.api import ClientAPI
-from chromadb.config import Settings
-import faiss
+import shutil
+from typing import TYPE_CHECKING, Any, Hashable, Iterator, Type, TypeVar
+from uuid import uuid4
+import mmh3
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from src.services.retrieval.base import BaseRetrievalConfig, RAGEngineBase
-from src.services.retrieval.chunk_generator import ChunkGenerator
-
-
-class EmbeddingModel(str, Enum):
-    all_MiniLM_L6_v2 = "sentence-transformers/all-MiniLM-L6-v2"
-    multilingual_e5_small = "intfloat/multilingual-e5-small"
-
-
-class RAGEngineType(str, Enum):
-    FAISS = "faiss"
-    CHROMADB = "chromadb"
-
+from src.services.retrieval.base import BaseRetrievalConfig, EmbeddingModel, RAGEngineBase, RAGEngineType, SearchHit
+from src.services.retrieval.bm25_index import BM25Index, BM25IndexWriter
+from src.services.retrieval.chunk_generator import Chunk, ChunkGenerator
+from src.services.retrieval.chunk_store import ChunkStore, ChunkStoreWriter
+from src.services.retrieval.dedup import ChunkDeduplicator, merge_sources
+from src.services.retrieval.embedding_cache import EmbeddingCache, TextEncoder
+from src.services.retrieval.exc import DocsNotExist
+from src.services.retrieval.faiss_index import FAISSIndexParams, apply_search_params, create_index
+from src.services.retrieval.fusion import DEFAULT_RRF_K, reciprocal_rank_fusion
+from src.services.retrieval.manifest import IndexManifest, ManifestDiff, VectorId
+from src.utils.batching import batched
+from src.utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from chromadb.api import ClientAPI
+    from chromadb.api.models.Collection import Collection
+    from chromadb.config import Settings
+
+
+CandidateTypeVar = TypeVar("CandidateTypeVar", bound=Hashable)
 
 ChromaDirPath = Path
 ChromaCollectionName = str
@@ -31,6 +38,12 @@ ChromaAllowResetFlag = bool
 ChromaAnonymizedTelemetry = bool
 
 
+class ChromaClientType(str, Enum):
+    HTTP = "http"
+    PERSISTENT = "persistent"
+    EPHEMERAL = "ephemeral"
+
+
 class ChromaRAGConfig(BaseRetrievalConfig):
     db_dir: ChromaDirPath
     collection_name: ChromaCollectionName
@@ -39,165 +52,913 @@ class ChromaRAGConfig(BaseRetrievalConfig):
     persist_directory: ChromaPersistDirectory | None = None
     allow_reset: ChromaAllowResetFlag = False
     anonymized_telemetry: ChromaAnonymizedTelemetry = False
+    # http - сервер ChromaDB на host:port, persistent - локальная база в persist_directory или db_dir
+    client_type: ChromaClientType = ChromaClientType.PERSISTENT
+    upsert_batch_size: int = 1000
+
+
+class RetrievalMode(str, Enum):
+    DENSE = "dense"
+    SPARSE = "sparse"
+    HYBRID = "hybrid"
 
 
 class FAISSRAGConfig(BaseRetrievalConfig):
     index_dir: Path
     index_file: Path
-    docs_file: Path
+    docs_dir: Path
+    manifest_file: Path
+    bm25_dir: Path
     retrieval_k: int = 4
+    index_params: FAISSIndexParams = FAISSIndexParams()
+    train_sample_size: int = 50_000
+    nprobe: int = 16
+    ef_search: int = 64
+    # hybrid - объединение FAISS и BM25 через reciprocal rank fusion
+    retrieval_mode: RetrievalMode = RetrievalMode.DENSE
+    # Сколько кандидатов берётся из каждого поиска перед объединением
+    fusion_candidates: int = 20
+    rrf_k: int = DEFAULT_RRF_K
+    # Доля удалённых строк ChunkStore и BM25, после которой они переписываются целиком
+    compaction_threshold: float = 0.3
+
+
+# Ключ метаданных коллекции Chroma с манифестом файлов
+_CHROMA_MANIFEST_KEY = "rag_manifest"
+
+# Параметры из манифеста, при изменении которых индекс перестраивается, и сообщения об этом
+_REBUILD_PARAMS = {
+    "index_params": "Параметры индекса изменились",
+    "dedup_params": "Параметры дедупликации изменились",
+    "chunk_params": "Параметры нарезки на чанки изменились",
+    "embedding_params": "Модель эмбеддингов изменилась",
+}
+
+
+def rank_candidates(
+        mode: RetrievalMode,
+        dense: list[dict[CandidateTypeVar, float]],
+        sparse: list[list[CandidateTypeVar]],
+        k: int,
+        rrf_k: int = DEFAULT_RRF_K
+) -> list[list[CandidateTypeVar]]:
+    """
+    Итоговый порядок кандидатов каждого запроса: dense - по расстоянию, sparse - по BM25,
+    hybrid - объединение обоих через reciprocal rank fusion
+    """
+    if mode == RetrievalMode.DENSE:
+        return [list(row)[:k] for row in dense]
+    if mode == RetrievalMode.SPARSE:
+        return [row[:k] for row in sparse]
+    return [
+        reciprocal_rank_fusion([list(dense_row), sparse_row], k=k, rrf_k=rrf_k)
+        for dense_row, sparse_row in zip(dense, sparse)
+    ]
 
 
 class FAISSRAGEngine(RAGEngineBase[FAISSRAGConfig]):
+    """
+    Движок на FAISS. Векторы хранятся в IndexIDMap2, id векторов каждого файла
+    записаны в манифесте, поэтому при изменениях в NOTES_DIR переиндексируются
+    только добавленные и изменённые файлы, а векторы удалённых файлов удаляются.
+    Тексты чанков лежат в колоночном ChunkStore, открытом через mmap.
+    Тип индекса (flat, IVF, HNSW) задаётся в FAISSRAGConfig.index_params.
+    В режимах sparse и hybrid рядом с индексом поддерживается BM25-индекс по тем же чанкам.
+    При включённой дедупликации вектор (и запись в BM25) есть только у канонических чанков,
+    дубликаты хранятся в ChunkStore со ссылкой на канонический чанк.
+    """
     engine_type = RAGEngineType.FAISS
+    config_class = FAISSRAGConfig
+
+    def __init__(
+            self,
+            config: FAISSRAGConfig,
+            chunk_generator: ChunkGenerator,
+            embedding_model: TextEncoder,
+            embedding_cache: EmbeddingCache | None = None
+    ):
+        super().__init__(
+            config=config,
+            chunk_generator=chunk_generator,
+            embedding_model=embedding_model,
+            embedding_cache=embedding_cache
+        )
+        self.index = None
+        self.documents = ChunkStore.empty()
+        self.manifest = IndexManifest()
+        self.bm25 = BM25Index.empty()
+        # Векторы, накопленные до обучения IVF-индекса
+        self._train_buffer: list[tuple[np.ndarray, np.ndarray]] = []
+
+    def load_or_build_index(self, files: dict[str, Path] | None = None) -> None:
+        if self.load_index():
+            self.update_index(files)
+        else:
+            self.build_index(files)
 
-    def __init__(self, config: FAISSRAGConfig, chunk_generator: ChunkGenerator, embedding_model: SentenceTransformer):
-        super().__init__(config=config, chunk_generator=chunk_generator, embedding_model=embedding_model)
+    @metrics.timed("index.build")
+    def build_index(self, files: dict[str, Path] | None = None) -> None:
+        """Полная перестройка индекса"""
         self.index = None
-        self.documents: list[dict[str, str]] = []
+        self.documents.close()
+        self.documents = ChunkStore.empty()
+        self.manifest = IndexManifest(**self._manifest_params())
+        self.update_index(files)
+
+    def _manifest_params(self) -> dict[str, dict[str, Any]]:
+        return dict(
+            index_params=self.config.index_params.model_dump(mode="json"),
+            dedup_params=self.config.dedup.model_dump(mode="json"),
+            chunk_params=self.chunk_generator.params,
+            embedding_params=self.config.embedding.model_dump(mode="json")
+        )
 
-    def build_index(self) -> None:
-        chunks = self.chunk_generator.get_chunks()
-        if not chunks:
-            print("Нет чанков для индексации.")
+    @metrics.timed("index.update")
+    def update_index(self, files: dict[str, Path] | None = None) -> None:
+        """
+        Приводит индекс в соответствие с файлами в директории заметок.
+        files - файлы индекса по имени относительно директории, по умолчанию - все файлы директории
+        """
+        if files is None:
+            files = self.chunk_generator.local_manager.get_files()
+        if not files and not self.manifest.files:
+            raise DocsNotExist
+
+        diff = self.manifest.diff(files)
+        if diff.is_empty:
+            print("Индекс актуален.")
+            self.manifest.save(self.config.manifest_file)
             return
+        print(f"Изменено файлов: {len(diff.changed)}, удалено: {len(diff.deleted)}")
 
-        texts = [c["text"] for c in chunks]
-        sources = [c["source"] for c in chunks]
-
-        print(f"Генерация эмбеддингов для {len(texts)} чанков...")
-        embeddings = self.embedding_model.encode(texts, show_progress_bar=True)
-        dim = embeddings.shape[1]
-
-        self.index = faiss.IndexFlatL2(dim)
-        self.index.add(np.array(embeddings).astype("float32"))
+        stale_ids = self.manifest.stale_ids(diff)
+        if stale_ids and not self.config.index_params.supports_removal:
+            print("Индекс не поддерживает удаление векторов и будет перестроен.")
+            self.build_index(files)
+            return
+        if stale_ids and self.index is not None:
+            self.index.remove_ids(np.asarray(stale_ids, dtype="int64"))
+        for key in diff.deleted:
+            self.manifest.remove_file(key)
+
+        stale = set(stale_ids)
+        deduplicator = self._load_deduplicator() if self.config.dedup.enabled else None
+        orphans: list[tuple[VectorId, VectorId, Chunk]] = []
+        if deduplicator is not None:
+            deduplicator.remove(stale)
+            orphans = self._recheck_orphans(stale, deduplicator)
+        repointed = {vector_id: canonical_id for vector_id, canonical_id, _ in orphans}
+        promoted = [(vector_id, chunk) for vector_id, canonical_id, chunk in orphans if canonical_id == vector_id]
+
+        # Новые чанки дописываются сегментом, пока в хранилище не накопится много удалённых строк
+        compact = self.documents.needs_compaction(len(stale) + len(repointed), self.config.compaction_threshold)
+        writer = ChunkStoreWriter(self.config.docs_dir, append=not compact)
+        bm25_writer = BM25IndexWriter(self.config.bm25_dir, append=not compact) if self._uses_bm25 else None
+        if compact:
+            for vector_id, canonical_id, chunk in self.documents.entries():
+                if vector_id not in stale:
+                    canonical_id = repointed.get(vector_id, canonical_id)
+                    writer.add(vector_id, chunk, canonical_id)
+                    if bm25_writer is not None and canonical_id == vector_id:
+                        bm25_writer.add(vector_id, chunk["text"])
+        else:
+            writer.remove(stale | set(repointed))
+            if bm25_writer is not None:
+                bm25_writer.remove(stale)
+            for vector_id, canonical_id, chunk in orphans:
+                writer.add(vector_id, chunk, canonical_id)
+                if bm25_writer is not None and canonical_id == vector_id:
+                    bm25_writer.add(vector_id, chunk["text"])
+        for batch in batched(promoted, self.config.embedding_batch_size):
+            self._embed_batch(batch)
+
+        added = 0
+        for batch in batched(self._iter_new_chunks(diff), self.config.embedding_batch_size):
+            self._add_batch(batch, writer, bm25_writer, deduplicator)
+            added += len(batch)
+            print(f"Проиндексировано чанков: {added}")
+        self._train_index()
+        if deduplicator is not None:
+            print(f"Найдено дубликатов: {deduplicator.duplicates}")
+
+        # До сохранения манифеста файлы индекса не соответствуют ему: отметка поколения
+        # пишется первой, и если запись прервётся, load_index увидит расхождение
+        self.manifest.generation = uuid4().hex
+        self.config.index_dir.mkdir(parents=True, exist_ok=True)
+        self._generation_file.write_text(self.manifest.generation, encoding="utf-8")
+        self.documents.close()
+        writer.commit()
+        self.documents = ChunkStore.open(self.config.docs_dir)
+        if bm25_writer is not None:
+            bm25_writer.commit()
+            self.bm25 = BM25Index.open(self.config.bm25_dir)
+        elif self.config.bm25_dir.exists():
+            # Устаревший BM25-индекс пересоберётся при следующем запуске в режиме sparse/hybrid
+            shutil.rmtree(self.config.bm25_dir)
+        if deduplicator is not None:
+            deduplicator.save(self._dedup_dir)
+        elif self._dedup_dir.exists():
+            shutil.rmtree(self._dedup_dir)
+        self._save()
+        self._invalidate_caches()
+        print(f"Индекс сохранён. Всего чанков: {len(self.documents)}, из них дубликатов: {self.documents.duplicates_count}")
+
+    def _iter_new_chunks(self, diff: ManifestDiff) -> Iterator[tuple[VectorId, Chunk]]:
+        """Поток чанков изменённых файлов с выделенными им id"""
+        states = {state.path: state for state in diff.changed}
+        for file, chunks in self.chunk_generator.iter_files_chunks(list(states)):
+            if chunks is None:
+                # Неразобранный файл не регистрируется и будет разобран заново при следующем обновлении
+                self.manifest.remove_file(states[file].key)
+                continue
+            ids = self.manifest.add_file(states[file], len(chunks))
+            yield from zip(ids, chunks)
 
-        self.documents = [
-            {"text": text, "source": source}
-            for text, source in zip(texts, sources)
-        ]
+    @property
+    def _generation_file(self) -> Path:
+        return self.config.index_dir / "generation"
 
-        self.config.index_dir.mkdir(exist_ok=True)
-        faiss.write_index(self.index, str(self.config.index_file))
+    @property
+    def _dedup_dir(self) -> Path:
+        return self.config.index_dir / "dedup"
+
+    def _load_deduplicator(self) -> ChunkDeduplicator[VectorId]:
+        """
+        Сохранённое состояние дедупликатора. Если его нет (индекс построен до его появления),
+        дедупликатор один раз заполняется каноническими чанками из ChunkStore.
+        """
+        if not len(self.documents):
+            return ChunkDeduplicator(self.config.dedup)
+        if ChunkDeduplicator.exists(self._dedup_dir):
+            return ChunkDeduplicator.load(self._dedup_dir, self.config.dedup)
+        print("Сборка состояния дедупликации по сохранённым чанкам...")
+        deduplicator = ChunkDeduplicator(self.config.dedup)
+        for vector_id, canonical_id, chunk in self.documents.entries():
+            if canonical_id == vector_id:
+                deduplicator.add(vector_id, chunk["text"])
+        return deduplicator
+
+    def _recheck_orphans(
+            self,
+            stale: set[VectorId],
+            deduplicator: ChunkDeduplicator[VectorId]
+    ) -> list[tuple[VectorId, VectorId, Chunk]]:
+        """
+        Дубликаты, чей канонический чанк удалён, проверяются заново: не нашедшие
+        другой пары становятся каноническими, и для них нужно посчитать векторы.
+        Возвращает такие дубликаты с id их новых канонических чанков.
+        """
+        orphans: list[tuple[VectorId, VectorId, Chunk]] = []
+        for vector_id, chunk in self.documents.duplicates_of(stale):
+            if vector_id not in stale:
+                canonical_id = deduplicator.check(vector_id, chunk["text"])
+                orphans.append((vector_id, vector_id if canonical_id is None else canonical_id, chunk))
+        return orphans
+
+    def _embed_batch(self, batch: list[tuple[VectorId, Chunk]]) -> None:
+        ids = [vector_id for vector_id, _ in batch]
+        texts = [chunk["text"] for _, chunk in batch]
+        embeddings = np.asarray(self._encode_chunks(texts), dtype="float32")
+        self._add_vectors(embeddings, np.asarray(ids, dtype="int64"))
+
+    def _add_batch(
+            self,
+            batch: list[tuple[VectorId, Chunk]],
+            writer: ChunkStoreWriter,
+            bm25_writer: BM25IndexWriter | None = None,
+            deduplicator: ChunkDeduplicator[VectorId] | None = None
+    ) -> None:
+        duplicates: dict[VectorId, VectorId] = {}
+        if deduplicator is not None:
+            for vector_id, chunk in batch:
+                canonical_id = deduplicator.check(vector_id, chunk["text"])
+                if canonical_id is not None:
+                    duplicates[vector_id] = canonical_id
+        unique = [(vector_id, chunk) for vector_id, chunk in batch if vector_id not in duplicates]
+        if unique:
+            self._embed_batch(unique)
+        for vector_id, chunk in batch:
+            canonical_id = duplicates.get(vector_id, vector_id)
+            writer.add(vector_id, chunk, canonical_id)
+            if bm25_writer is not None and canonical_id == vector_id:
+                bm25_writer.add(vector_id, chunk["text"])
 
-        with open(self.config.docs_file, "wb") as f:
-            pickle.dump(self.documents, f)
+    @property
+    def _uses_bm25(self) -> bool:
+        return self.config.retrieval_mode != RetrievalMode.DENSE
+
+    def _load_bm25(self) -> None:
+        if not BM25Index.exists(self.config.bm25_dir):
+            print("Сборка BM25-индекса по сохранённым чанкам...")
+            bm25_writer = BM25IndexWriter(self.config.bm25_dir)
+            for vector_id, canonical_id, chunk in self.documents.entries():
+                if canonical_id == vector_id:
+                    bm25_writer.add(vector_id, chunk["text"])
+            bm25_writer.commit()
+        self.bm25 = BM25Index.open(self.config.bm25_dir)
+
+    @metrics.timed("index.add_vectors")
+    def _add_vectors(self, embeddings: np.ndarray, ids: np.ndarray) -> None:
+        """
+        Добавляет векторы в индекс. Индексы, требующие обучения, создаются только после
+        накопления train_sample_size векторов (или в конце индексации), обучаются на них,
+        и лишь затем в них добавляются накопленные векторы.
+        """
+        if self.index is None and not self.config.index_params.needs_training:
+            self.index = create_index(self.config.index_params, embeddings.shape[1])
+            self._apply_search_params()
+        if self.index is not None and self.index.is_trained:
+            self.index.add_with_ids(embeddings, ids)
+            return
 
-        print(f"Индекс сохранён. Всего чанков: {len(self.documents)}")
+        self._train_buffer.append((embeddings, ids))
+        if sum(len(buffered_ids) for _, buffered_ids in self._train_buffer) >= self.config.train_sample_size:
+            self._train_index()
 
+    @metrics.timed("index.train")
+    def _train_index(self) -> None:
+        if not self._train_buffer:
+            return
+        embeddings = np.concatenate([vectors for vectors, _ in self._train_buffer])
+        ids = np.concatenate([buffered_ids for _, buffered_ids in self._train_buffer])
+        self._train_buffer = []
+
+        print(f"Обучение индекса на {len(ids)} векторах...")
+        self.index = create_index(self.config.index_params, embeddings.shape[1], train_size=len(ids))
+        self.index.train(embeddings)
+        self._apply_search_params()
+        self.index.add_with_ids(embeddings, ids)
+
+    def _apply_search_params(self) -> None:
+        apply_search_params(self.index, nprobe=self.config.nprobe, ef_search=self.config.ef_search)
+
+    @metrics.timed("index.save")
+    def _save(self) -> None:
+        """Сохраняет FAISS-индекс и последним - манифест с отметкой поколения"""
+        if self.index is not None:
+            import faiss
+
+            tmp_file = self.config.index_file.with_name(self.config.index_file.name + ".tmp")
+            faiss.write_index(self.index, str(tmp_file))
+            tmp_file.replace(self.config.index_file)
+        self.manifest.save(self.config.manifest_file)
+        self.index_version = self.manifest.version
+
+    @metrics.timed("index.load")
     def load_index(self) -> bool:
         if (not self.config.index_file.exists() or
-            not self.config.docs_file.exists()):
+            not ChunkStore.exists(self.config.docs_dir) or
+            not self.config.manifest_file.exists()):
+            return False
+        manifest = IndexManifest.load(self.config.manifest_file)
+        if (not self._generation_file.exists() or
+            self._generation_file.read_text(encoding="utf-8") != manifest.generation):
+            print("Индекс сохранён не полностью, он будет перестроен.")
             return False
+        for name, value in self._manifest_params().items():
+            if getattr(manifest, name) != value:
+                print(f"{_REBUILD_PARAMS[name]}, индекс будет перестроен.")
+                return False
+        self.manifest = manifest
+        self.index_version = manifest.version
+        import faiss
+
         self.index = faiss.read_index(str(self.config.index_file))
-        with open(self.config.docs_file, "rb") as f:
-            self.documents = pickle.load(f)
+        self._apply_search_params()
+        self.documents = ChunkStore.open(self.config.docs_dir)
+        if self._uses_bm25:
+            self._load_bm25()
+        self._invalidate_caches()
         print(f"Индекс загружен. Чанков: {len(self.documents)}")
         return True
 
-    def retrieve(self, query: str) -> str:
-        if self.index is None or len(self.documents) == 0:
-            return ""
-        query_vec = self.embedding_model.encode([query])
-        _, I = self.index.search(
-            query_vec.astype("float32"),
-            self.config.retrieval_k  # Берём k из конфигурации
-        )
+    @property
+    def is_empty(self) -> bool:
+        return self.index is None or len(self.documents) == 0
+
+    def search_vectors(self, embeddings: np.ndarray, k: int) -> list[dict[VectorId, float]]:
+        """id ближайших к эмбеддингам запросов векторов с расстояниями, по возрастанию расстояния"""
+        if self.is_empty:
+            return [{} for _ in embeddings]
+        with metrics.span("retrieval.faiss_search"):
+            D, I = self.index.search(embeddings, k)
+        # FAISS дополняет строку id -1, если векторов меньше k
+        return [
+            {int(idx): float(distance) for idx, distance in zip(ids, distances) if idx >= 0}
+            for ids, distances in zip(I, D)
+        ]
+
+    def search_bm25(self, queries: list[str], k: int) -> list[list[tuple[VectorId, float]]]:
+        """id чанков, найденных BM25, с оценками, по убыванию оценки"""
+        if self.is_empty:
+            return [[] for _ in queries]
+        with metrics.span("retrieval.bm25_search"):
+            return self.bm25.search_many(queries, k)
+
+    def _search_many(self, queries: list[str]) -> list[list[SearchHit]]:
+        if self.is_empty:
+            return [[] for _ in queries]
+        k = self.config.retrieval_k  # Берём k из конфигурации
+        mode = self.config.retrieval_mode
+        depth = k if mode == RetrievalMode.DENSE else max(k, self.config.fusion_candidates)
+
+        dense = [{} for _ in queries]
+        if mode != RetrievalMode.SPARSE:
+            dense = self.search_vectors(self._encode_queries(queries), depth)
+        sparse = [[] for _ in queries]
+        if mode != RetrievalMode.DENSE:
+            sparse = [[vector_id for vector_id, _ in row] for row in self.search_bm25(queries, depth)]
+        rankings = rank_candidates(mode, dense, sparse, k=k, rrf_k=self.config.rrf_k)
+
         results = []
-        for idx in I[0]:
-            if idx < len(self.documents):
-                doc = self.documents[idx]
-                results.append(f"[Источник: {doc['source']}]\n{doc['text']}")
-        return "\n\n---\n\n".join(results)
+        for row, distances in zip(rankings, dense):
+            hits = []
+            for vector_id in row:
+                chunk = self.documents.get(vector_id)
+                if chunk is not None:
+                    hits.append(SearchHit(chunk=chunk, distance=distances.get(vector_id)))
+            results.append(hits)
+        return results
 
 
 class ChromaRAGEngine(RAGEngineBase[ChromaRAGConfig]):
+    """
+    Движок на ChromaDB. Эмбеддинги считаются на нашей стороне (с дисковым кэшем)
+    и записываются в коллекцию пакетами через upsert. id чанка - "<источник>#<номер чанка>",
+    поэтому повторная запись того же файла перезаписывает чанки, а не дублирует их.
+    При включённой дедупликации в коллекцию пишутся только канонические чанки,
+    источники их дубликатов дописываются в метаданные после записи всех чанков.
+    Манифест файлов с параметрами нарезки, дедупликации и модели эмбеддингов хранится
+    в метаданных коллекции: при загрузке чанки удалённых и изменённых файлов удаляются,
+    а добавленных и изменённых - записываются, при смене параметров коллекция перестраивается.
+    С дедупликацией источники дубликатов лежат в метаданных чужих чанков,
+    поэтому любое изменение файлов перестраивает коллекцию целиком.
+    """
     engine_type = RAGEngineType.CHROMADB
+    config_class = ChromaRAGConfig
+
+    def __init__(
+            self,
+            config: ChromaRAGConfig,
+            chunk_generator: ChunkGenerator,
+            embedding_model: TextEncoder,
+            embedding_cache: EmbeddingCache | None = None
+    ):
+        super().__init__(
+            config=config,
+            chunk_generator=chunk_generator,
+            embedding_model=embedding_model,
+            embedding_cache=embedding_cache,
+        )
+        self.collection: "Collection | None" = None
+        self.manifest = IndexManifest()
+        self._count = 0
 
     @property
-    def settings(self) -> Settings:
+    def settings(self) -> "Settings":
+        from chromadb.config import Settings
+
         return Settings(
-            chromedb_http_host=self.config.host,
-            chromedb_http_port=self.config.port,
             allow_reset=self.config.allow_reset,
             anonymized_telemetry=self.config.anonymized_telemetry
         )
 
-    @property
-    def client(self) -> ClientAPI:
-        """Ленивая инициализация клиента ChromaDB"""
-        if self.config.persist_directory:
-            self._client = chromadb.PersistentClient(
-                path=str(self.config.persist_directory),
+    @cached_property
+    def client(self) -> "ClientAPI":
+        """Клиент ChromaDB создаётся один раз на всё время работы движка"""
+        import chromadb
+
+        if self.config.client_type == ChromaClientType.HTTP:
+            print(f"Подключение к ChromaDB {self.config.host}:{self.config.port}")
+            return chromadb.HttpClient(
+                host=self.config.host,
+                port=self.config.port,
                 settings=self.settings
             )
-        else:
-            self._client = chromadb.Client(self.settings)
-        return self._client
+        if self.config.client_type == ChromaClientType.EPHEMERAL:
+            return chromadb.EphemeralClient(settings=self.settings)
+        return chromadb.PersistentClient(
+            path=str(self.config.persist_directory or self.config.db_dir),
+            settings=self.settings
+        )
 
+    def _get_collection(self) -> "Collection":
+        # Эмбеддинги всегда передаются явно, встроенная embedding function коллекции не нужна
+        return self.client.get_or_create_collection(
+            name=self.config.collection_name,
+            embedding_function=None
+        )
+
+    def _collection_version(self) -> str:
+        # build_index пересоздаёт коллекцию, поэтому её id меняется при каждой перестройке
+        return f"{self.collection.id}:{self.manifest.version}"
+
+    def _manifest_params(self) -> dict[str, dict[str, Any]]:
+        return dict(
+            dedup_params=self.config.dedup.model_dump(mode="json"),
+            chunk_params=self.chunk_generator.params,
+            embedding_params=self.config.embedding.model_dump(mode="json")
+        )
 
-    def _embed_func(self, texts: list[str]) -> list[list[float]]:
-        return self.embedding_model.encode(texts).tolist()
+    def _write_manifest(self) -> None:
+        self.collection.modify(metadata={_CHROMA_MANIFEST_KEY: self.manifest.model_dump_json()})
+
+    def _save_manifest(self) -> None:
+        self._write_manifest()
+        self._count = self.collection.count()
+        self.index_version = self._collection_version()
+        self._invalidate_caches()
+
+    def _iter_chunks(self, diff: ManifestDiff) -> Iterator[tuple[str, Chunk]]:
+        """Поток чанков изменённых файлов со стабильными id, файлы регистрируются в манифесте"""
+        states = {state.path: state for state in diff.changed}
+        for file, chunks in self.chunk_generator.iter_files_chunks(list(states)):
+            state = states[file]
+            if chunks is None:
+                # Неразобранный файл не регистрируется и будет разобран заново при следующем обновлении
+                self.manifest.remove_file(state.key)
+                continue
+            self.manifest.add_file(state, len(chunks))
+            for number, chunk in enumerate(chunks):
+                yield f"{state.key}#{number}", chunk
 
+    @property
+    def _batch_size(self) -> int:
+        return min(self.config.upsert_batch_size, self.client.get_max_batch_size())
+
+    def load_or_build_index(self) -> None:
+        if self.load_index():
+            self.update_index()
+        else:
+            self.build_index()
+
+    @metrics.timed("index.build")
     def build_index(self) -> None:
-        chunks = self.chunk_generator.get_chunks()
-        if not chunks:
-            print("Нет чанков для индексации.")
+        """Полная перестройка коллекции"""
+        files = self.chunk_generator.local_manager.get_files()
+        if not files:
+            raise DocsNotExist
+
+        from chromadb.errors import NotFoundError
+
+        try:
+            self.client.delete_collection(self.config.collection_name)
+        except NotFoundError:
+            pass
+        self.collection = self._get_collection()
+        self.manifest = IndexManifest(**self._manifest_params())
+        batch_size = self._batch_size
+
+        chunks = self._iter_chunks(self.manifest.diff(files))
+        duplicate_sources: dict[str, list[str]] = {}
+        if self.config.dedup.enabled:
+            chunks = self._skip_duplicates(chunks, ChunkDeduplicator(self.config.dedup), duplicate_sources)
+        added = 0
+        for batch in batched(chunks, batch_size):
+            self._upsert_batch(batch)
+            added += len(batch)
+            print(f"Проиндексировано чанков: {added}")
+        if duplicate_sources:
+            print(f"Найдено дубликатов: {sum(len(sources) for sources in duplicate_sources.values())}")
+            for batch in batched(list(duplicate_sources.items()), batch_size):
+                self.collection.update(
+                    ids=[chunk_id for chunk_id, _ in batch],
+                    metadatas=[
+                        {"source": merge_sources([chunk_id.rsplit("#", 1)[0], *sources])}
+                        for chunk_id, sources in batch
+                    ]
+                )
+
+        self._save_manifest()
+        print(f"Коллекция сохранена. Всего чанков: {self._count}")
+
+    @metrics.timed("index.update")
+    def update_index(self) -> None:
+        """Приводит коллекцию в соответствие с файлами в директории заметок"""
+        files = self.chunk_generator.local_manager.get_files()
+        if not files and not self.manifest.files:
+            raise DocsNotExist
+
+        diff = self.manifest.diff(files)
+        if diff.is_empty:
+            print("Коллекция актуальна.")
+            self._write_manifest()
             return
+        print(f"Изменено файлов: {len(diff.changed)}, удалено: {len(diff.deleted)}")
+        if self.config.dedup.enabled:
+            print("При дедупликации коллекция перестраивается целиком.")
+            self.build_index()
+            return
+
+        stale_keys = [*diff.deleted, *(state.key for state in diff.changed if state.key in self.manifest.files)]
+        stale_ids = [
+            f"{key}#{number}"
+            for key in stale_keys
+            for number in range(len(self.manifest.files[key].ids))
+        ]
+        batch_size = self._batch_size
+        for batch in batched(stale_ids, batch_size):
+            self.collection.delete(ids=batch)
+        for key in diff.deleted:
+            self.manifest.remove_file(key)
+
+        added = 0
+        for batch in batched(self._iter_chunks(diff), batch_size):
+            self._upsert_batch(batch)
+            added += len(batch)
+            print(f"Проиндексировано чанков: {added}")
+        self._save_manifest()
+        print(f"Коллекция обновлена. Всего чанков: {self._count}")
+
+    @staticmethod
+    def _skip_duplicates(
+            chunks: Iterator[tuple[str, Chunk]],
+            deduplicator: ChunkDeduplicator[str],
+            duplicate_sources: dict[str, list[str]]
+    ) -> Iterator[tuple[str, Chunk]]:
+        """Пропускает дубликаты, собирая их источники по id канонического чанка"""
+        for chunk_id, chunk in chunks:
+            canonical_id = deduplicator.check(chunk_id, chunk["text"])
+            if canonical_id is None:
+                yield chunk_id, chunk
+            else:
+                duplicate_sources.setdefault(canonical_id, []).append(chunk["source"])
+
+    def _upsert_batch(self, batch: list[tuple[str, Chunk]]) -> None:
+        texts = [chunk["text"] for _, chunk in batch]
+        embeddings = np.asarray(self._encode_chunks(texts), dtype="float32")
+        with metrics.span("index.upsert"):
+            self.collection.upsert(
+                ids=[chunk_id for chunk_id, _ in batch],
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=[{"source": chunk["source"]} for _, chunk in batch]
+            )
 
-        texts = [c["text"] for c in chunks]
-        sources = [c["source"] for c in chunks]
+    @metrics.timed("index.load")
+    def load_index(self) -> bool:
+        self.collection = self._get_collection()
+        self._count = self.collection.count()
+        stored = (self.collection.metadata or {}).get(_CHROMA_MANIFEST_KEY)
+        if stored is None:
+            print("В коллекции нет манифеста, она будет перестроена.")
+            return False
+        manifest = IndexManifest.model_validate_json(stored)
+        for name, value in self._manifest_params().items():
+            if getattr(manifest, name) != value:
+                print(f"{_REBUILD_PARAMS[name]}, коллекция будет перестроена.")
+                return False
+        self.manifest = manifest
+        self.index_version = self._collection_version()
+        self._invalidate_caches()
+        print(f"Коллекция загружена. Документов: {self._count}")
+        return True
 
-        print(f"Генерация эмбеддингов для {len(texts)} чанков...")
-        embeddings = self.embedding_model.encode(texts, show_progress_bar=True)
-        dim = embeddings.shape[1]
+    def _search_many(self, queries: list[str]) -> list[list[SearchHit]]:
+        if self.collection is None or self._count == 0:
+            return [[] for _ in queries]
 
-        self.index = faiss.IndexFlatL2(dim)
-        self.index.add(np.array(embeddings).astype("float32"))
+        embeddings = self._encode_queries(queries)
+        with metrics.span("retrieval.chroma_query"):
+            results = self.collection.query(
+                query_embeddings=embeddings,
+                n_results=min(self.config.retrieval_k, self._count),
+                include=["documents", "metadatas", "distances"]
+            )
 
-        self.documents = [
-            {"text": txt, "source": src}
-            for txt, src in zip(texts, sources)
+        return [
+            [
+                SearchHit(chunk={"text": doc, "source": meta["source"]}, distance=distance)
+                for doc, meta, distance in zip(docs, metas, distances)
+            ]
+            for docs, metas, distances in zip(
+                results["documents"], results["metadatas"], results["distances"]
+            )
         ]
 
-        self.config.index_dir.mkdir(exist_ok=True)
-        faiss.write_index(self.index, str(self.config.index_file))
-        with open(self.config.docs_file, "wb") as f:
-            pickle.dump(self.documents, f)
 
-        print(f"Индекс сохранён. Всего чанков: {len(self.documents)}")
-
-    def load_index(self) -> bool:
-        self.collection = self.client.get_or_create_collection(
-            name=self.config.collection_name,
-            embedding_function=self._embed_func
-        )
-        count = self.collection.count()
-        print(f"Коллекция загружена. Документов: {count}")
-        return count > 0
-
-    def retrieve(self, query: str) -> str:
-        if self.collection is None or self.collection.count() == 0:
-            return ""
-
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=self.config.retrieval_k,
-            include=["documents", "metadatas"]
+class ShardingMode(str, Enum):
+    # Шард - папка верхнего уровня директории заметок, файлы в её корне - шард __root__
+    FOLDER = "folder"
+    # num_shards шардов по хэшу имени файла
+    HASH = "hash"
+
+
+ROOT_SHARD = "__root__"
+
+
+def shard_name(key: str, mode: ShardingMode, num_shards: int) -> str:
+    """Шард файла по его имени относительно директории заметок"""
+    if mode == ShardingMode.FOLDER:
+        folder, separator, _ = key.partition("/")
+        return folder if separator else ROOT_SHARD
+    return f"{mmh3.hash(key, signed=False) % num_shards:02d}"
+
+
+class ShardedFAISSRAGConfig(FAISSRAGConfig):
+    sharding: ShardingMode = ShardingMode.FOLDER
+    num_shards: int = 4
+    # Потоки для параллельной загрузки шардов и поиска по ним
+    shard_workers: int = 4
+
+
+class ShardedFAISSRAGEngine(RAGEngineBase[ShardedFAISSRAGConfig]):
+    """
+    FAISS-индекс, разделённый на шарды по папкам верхнего уровня или по хэшу имени файла.
+    Каждый шард - отдельный FAISSRAGEngine со своими индексом, ChunkStore, манифестом и BM25
+    в index_dir/shards/<шард>/, поэтому изменения в одной папке переиндексируют только её шард,
+    а rebuild_shard перестраивает один шард, не трогая остальные.
+    При запуске шарды загружаются параллельно, затем изменённые обновляются по очереди:
+    эмбеддинг и так занимает все ядра, а кэш эмбеддингов не рассчитан на запись из нескольких потоков.
+    Запрос эмбеддится один раз, поиск по шардам идёт параллельно, кандидаты объединяются:
+    dense - по расстоянию, как в одном индексе, BM25 - по оценкам шардов, которые считаются
+    по статистике своего шарда и поэтому сравнимы между шардами лишь приближённо.
+    Дубликаты чанков ищутся внутри шарда.
+    """
+    engine_type = RAGEngineType.FAISS_SHARDED
+    config_class = ShardedFAISSRAGConfig
+
+    def __init__(
+            self,
+            config: ShardedFAISSRAGConfig,
+            chunk_generator: ChunkGenerator,
+            embedding_model: TextEncoder,
+            embedding_cache: EmbeddingCache | None = None
+    ):
+        super().__init__(
+            config=config,
+            chunk_generator=chunk_generator,
+            embedding_model=embedding_model,
+            embedding_cache=embedding_cache
         )
+        self.shards: dict[str, FAISSRAGEngine] = {}
 
-        formatted_results = []
-        for doc, meta in zip(results["documents"][0], results["metadatas"][0]):
-            formatted_results.append(f"[Источник: {meta['source']}]\n{doc}")
+    @property
+    def _shards_dir(self) -> Path:
+        return self.config.index_dir / "shards"
+
+    @cached_property
+    def _executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.config.shard_workers, thread_name_prefix="faiss-shard")
+
+    def _create_shard(self, name: str) -> FAISSRAGEngine:
+        shard_dir = self._shards_dir / name
+        # Запросы эмбеддятся и кэшируются один раз на уровне всего индекса
+        config = self.config.model_copy(update=dict(
+            index_dir=shard_dir,
+            index_file=shard_dir / "index.faiss",
+            docs_dir=shard_dir / "documents",
+            manifest_file=shard_dir / "manifest.json",
+            bm25_dir=shard_dir / "bm25",
+            query_cache_size=0
+        ))
+        return FAISSRAGEngine(
+            config=config,
+            chunk_generator=self.chunk_generator,
+            embedding_model=self.embedding_model,
+            embedding_cache=self.embedding_cache
+        )
 
+    def _group_files(self) -> dict[str, dict[str, Path]]:
+        files = self.chunk_generator.local_manager.get_files()
+        if not files:
+            raise DocsNotExist
+        groups: dict[str, dict[str, Path]] = {}
+        for key, file in files.items():
+            groups.setdefault(shard_name(key, self.config.sharding, self.config.num_shards), {})[key] = file
+        return dict(sorted(groups.items()))
+
+    def _saved_shards(self) -> list[str]:
+        if not self._shards_dir.exists():
+            return []
+        return sorted(path.name for path in self._shards_dir.iterdir() if path.is_dir())
+
+    def _drop_stale_shards(self, names: set[str]) -> None:
+        """Удаляет шарды, в которых не осталось файлов"""
+        for name in self._saved_shards():
+            if name not in names:
+                print(f"В шарде {name} не осталось файлов, он будет удалён.")
+                shard = self.shards.pop(name, None)
+                if shard is not None:
+                    shard.documents.close()
+                shutil.rmtree(self._shards_dir / name)
+
+    def _load_shards(self, names: list[str]) -> dict[str, bool]:
+        """Параллельно загружает шарды, возвращает, какие из них загрузились"""
+        shards = {name: self.shards.get(name) or self._create_shard(name) for name in names}
+        loaded = list(self._executor.map(lambda shard: shard.load_index(), shards.values()))
+        self.shards.update(shards)
+        return dict(zip(shards, loaded))
+
+    def _on_shards_changed(self) -> None:
+        versions = ";".join(f"{name}:{shard.index_version}" for name, shard in sorted(self.shards.items()))
+        self.index_version = hashlib.sha256(versions.encode("utf-8")).hexdigest()[:16]
+        self._invalidate_caches()
+        chunks = sum(len(shard.documents) for shard in self.shards.values())
+        print(f"Шардов: {len(self.shards)}, всего чанков: {chunks}")
+
+    def load_or_build_index(self) -> None:
+        groups = self._group_files()
+        self._drop_stale_shards(set(groups))
+        for name, loaded in self._load_shards(list(groups)).items():
+            if loaded:
+                self.shards[name].update_index(groups[name])
+            else:
+                print(f"Шард {name} будет построен.")
+                self.shards[name].build_index(groups[name])
+        self._on_shards_changed()
+
+    @metrics.timed("index.build")
+    def build_index(self) -> None:
+        """Полная перестройка всех шардов"""
+        groups = self._group_files()
+        self._drop_stale_shards(set(groups))
+        for shard in self.shards.values():
+            shard.documents.close()
+        self.shards = {}
+        for name, files in groups.items():
+            print(f"Шард {name}: файлов {len(files)}")
+            shard = self._create_shard(name)
+            shard.build_index(files)
+            self.shards[name] = shard
+        self._on_shards_changed()
+
+    def rebuild_shard(self, name: str) -> None:
+        """Перестраивает один шард по текущим файлам, остальные шарды не меняются"""
+        groups = self._group_files()
+        if name not in groups:
+            raise ValueError(f"Нет файлов для шарда {name}. Шарды: {', '.join(groups)}")
+        others = [saved for saved in self._saved_shards() if saved != name and saved not in self.shards]
+        if others:
+            self._load_shards(others)
+        shard = self.shards.get(name) or self._create_shard(name)
+        shard.build_index(groups[name])
+        self.shards[name] = shard
+        self._on_shards_changed()
+
+    @metrics.timed("index.load")
+    def load_index(self) -> bool:
+        """Параллельно загружает сохранённые шарды. False, если шардов нет или какой-то не загрузился"""
+        names = self._saved_shards()
+        if not names:
+            return False
+        loaded = self._load_shards(names)
+        self._on_shards_changed()
+        return all(loaded.values())
+
+    def _search_many(self, queries: list[str]) -> list[list[SearchHit]]:
+        shards = [shard for shard in self.shards.values() if not shard.is_empty]
+        if not shards:
+            return [[] for _ in queries]
+        k = self.config.retrieval_k
+        mode = self.config.retrieval_mode
+        depth = k if mode == RetrievalMode.DENSE else max(k, self.config.fusion_candidates)
+        embeddings = self._encode_queries(queries) if mode != RetrievalMode.SPARSE else None
+
+        def search_shard(shard: FAISSRAGEngine) -> tuple[list[dict[VectorId, float]], list[list[tuple[VectorId, float]]]]:
+            dense = shard.search_vectors(embeddings, depth) if embeddings is not None else [{} for _ in queries]
+            sparse = shard.search_bm25(queries, depth) if mode != RetrievalMode.DENSE else [[] for _ in queries]
+            return dense, sparse
+
+        found = list(self._executor.map(search_shard, shards)) if len(shards) > 1 else [search_shard(shards[0])]
+
+        # id векторов в разных шардах пересекаются, кандидат - пара (номер шарда, id)
+        dense: list[dict[tuple[int, VectorId], float]] = []
+        sparse: list[list[tuple[int, VectorId]]] = []
+        for row in range(len(queries)):
+            nearest = sorted(
+                (((number, vector_id), distance)
+                 for number, (shard_dense, _) in enumerate(found)
+                 for vector_id, distance in shard_dense[row].items()),
+                key=lambda item: item[1]
+            )
+            dense.append(dict(nearest[:depth]))
+            best = sorted(
+                (((number, vector_id), score)
+                 for number, (_, shard_sparse) in enumerate(found)
+                 for vector_id, score in shard_sparse[row]),
+                key=lambda item: item[1],
+                reverse=True
+            )
+            sparse.append([candidate for candidate, _ in best[:depth]])
+        rankings = rank_candidates(mode, dense, sparse, k=k, rrf_k=self.config.rrf_k)
 
-        return "\n\n---\n\n".join(formatted_results)
+        results = []
+        for row, distances in zip(rankings, dense):
+            hits = []
+            for number, vector_id in row:
+                chunk = shards[number].documents.get(vector_id)
+                if chunk is not None:
+                    hits.append(SearchHit(chunk=chunk, distance=distances.get((number, vector_id))))
+            results.append(hits)
+        return results
 
 
 class RagEngineFactory:
 
     engines: list[Type[RAGEngineBase]] = [
         FAISSRAGEngine,
+        ShardedFAISSRAGEngine,
         ChromaRAGEngine
     ]
 
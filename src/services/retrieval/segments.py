@@ -0,0 +1,99 @@
+import shutil
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from src.services.retrieval.manifest import VectorId
+
+
+_CATALOG_FILE = "segments.json"
+
+
+def replace_dir(tmp_dir: Path, target_dir: Path) -> None:
+    """Заменяет target_dir полностью записанной директорией tmp_dir"""
+    old_dir = target_dir.with_name(target_dir.name + ".old")
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    if target_dir.exists():
+        target_dir.rename(old_dir)
+    tmp_dir.rename(target_dir)
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+
+
+class SegmentEntry(BaseModel):
+    name: str
+    # id строк более ранних сегментов, удалённых при записи этого сегмента
+    removed: list[VectorId] = []
+
+
+class SegmentCatalog(BaseModel):
+    """
+    Список сегментов хранилища, которое обновляется дописыванием.
+    Каждое обновление пишет новый сегмент в поддиректорию и отмечает в нём id удалённых строк:
+    они скрывают строки более ранних сегментов, но не самого сегмента, поэтому строку
+    можно переписать с тем же id. Сегмент становится видимым только после сохранения каталога.
+    """
+    segments: list[SegmentEntry] = []
+
+    @staticmethod
+    def exists(root_dir: Path) -> bool:
+        return (root_dir / _CATALOG_FILE).exists()
+
+    @classmethod
+    def load(cls, root_dir: Path) -> "SegmentCatalog":
+        return cls.model_validate_json((root_dir / _CATALOG_FILE).read_text(encoding="utf-8"))
+
+    def save(self, root_dir: Path) -> None:
+        path = root_dir / _CATALOG_FILE
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(self.model_dump_json(), encoding="utf-8")
+        tmp_path.replace(path)
+
+    def next_name(self) -> str:
+        return f"{int(self.segments[-1].name) + 1:06d}" if self.segments else f"{0:06d}"
+
+    def removed_sets(self) -> list[set[VectorId]]:
+        """Для каждого сегмента - id его строк, удалённые более поздними сегментами"""
+        result: list[set[VectorId]] = []
+        removed: set[VectorId] = set()
+        for entry in reversed(self.segments):
+            result.append(set(removed))
+            removed.update(entry.removed)
+        return result[::-1]
+
+
+class SegmentWriter:
+    """
+    Запись одного сегмента. При append сегмент дописывается к хранилищу в root_dir,
+    иначе хранилище перезаписывается целиком одним сегментом через временную директорию.
+    """
+
+    def __init__(self, root_dir: Path, append: bool = False):
+        self._root_dir = root_dir
+        self._append = append and SegmentCatalog.exists(root_dir)
+        self._catalog = SegmentCatalog.load(root_dir) if self._append else SegmentCatalog()
+        self._removed: set[VectorId] = set()
+        self._name = self._catalog.next_name()
+        self._tmp_root = root_dir if self._append else root_dir.with_name(root_dir.name + ".tmp")
+        self.segment_dir = self._tmp_root / (self._name + ".tmp")
+        if not self._append and self._tmp_root.exists():
+            shutil.rmtree(self._tmp_root)
+        if self.segment_dir.exists():
+            shutil.rmtree(self.segment_dir)
+        self.segment_dir.mkdir(parents=True)
+
+    def remove(self, ids: set[VectorId]) -> None:
+        """Скрывает строки с этими id в ранее записанных сегментах"""
+        self._removed.update(ids)
+
+    def commit(self) -> None:
+        """Вызывается после записи файлов сегмента в segment_dir"""
+        segment_dir = self._tmp_root / self._name
+        if segment_dir.exists():
+            shutil.rmtree(segment_dir)
+        self.segment_dir.rename(segment_dir)
+        self._catalog.segments.append(SegmentEntry(name=self._name, removed=sorted(self._removed)))
+        self._catalog.save(self._tmp_root)
+        if not self._append:
+            replace_dir(self._tmp_root, self._root_dir)
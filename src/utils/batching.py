@@ -0,0 +1,17 @@
+from itertools import islice
+from typing import Iterable, Iterator, TypeVar
+
+
+T = TypeVar("T")
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """
+    Утилита разбивает поток элементов на списки не длиннее size,
+    не материализуя весь поток в памяти.
+    """
+    if size <= 0:
+        raise ValueError("size должен быть положительным числом")
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,32 @@
+from threading import RLock
+from typing import Any, Callable, Generic, TypeVar
+
+
+ValueTypeVar = TypeVar("ValueTypeVar")
+
+
+class locked_cached_property(Generic[ValueTypeVar]):
+    """
+    Аналог functools.cached_property, безопасный при одновременном обращении из нескольких потоков:
+    значение вычисляется один раз, остальные потоки ждут его под блокировкой свойства.
+    """
+
+    def __init__(self, func: Callable[[Any], ValueTypeVar]):
+        self._func = func
+        self._name = func.__name__
+        self._lock = RLock()
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._name = name
+
+    def __get__(self, instance: Any, owner: type | None = None) -> ValueTypeVar:
+        if instance is None:
+            return self  # type: ignore[return-value]
+        cache = instance.__dict__
+        if self._name in cache:
+            return cache[self._name]
+        with self._lock:
+            if self._name not in cache:
+                cache[self._name] = self._func(instance)
+            return cache[self._name]
@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Generic, Hashable, TypeVar
+
+
+KeyTypeVar = TypeVar("KeyTypeVar", bound=Hashable)
+ValueTypeVar = TypeVar("ValueTypeVar")
+
+
+class LRUCache(Generic[KeyTypeVar, ValueTypeVar]):
+    """
+    Потокобезопасный LRU-кэш в памяти процесса с опциональным TTL и счётчиками попаданий.
+    maxsize = 0 отключает кэш.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict[KeyTypeVar, tuple[float, ValueTypeVar]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: KeyTypeVar) -> ValueTypeVar | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self._ttl is not None and time.monotonic() - item[0] > self._ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: KeyTypeVar, value: ValueTypeVar) -> None:
+        if self._maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,195 @@
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import math
+from threading import Lock
+import time
+from typing import Any, Callable, Iterator, TypeVar
+
+import numpy as np
+
+
+# Длительность этапов (спанов) запроса и индексации, метка stage - имя спана
+STAGE_SECONDS = "rag_stage_seconds"
+
+# Границы корзин гистограмм в секундах: от поиска по индексу до генерации ответа LLM
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+Span = tuple[str, float]
+FuncTypeVar = TypeVar("FuncTypeVar", bound=Callable[..., Any])
+
+_trace: ContextVar[list[Span] | None] = ContextVar("metrics_trace", default=None)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами, как в Prometheus.
+    Перцентили считаются точно по последним window наблюдениям.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = tuple(sorted(buckets))
+        # Последняя корзина - +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._recent: deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self._recent.append(value)
+
+    def percentiles(self) -> dict[str, float]:
+        if not self._recent:
+            return {}
+        values = np.fromiter(self._recent, dtype="float64", count=len(self._recent))
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(values.max())}
+
+    def cumulative_buckets(self) -> list[tuple[float, int]]:
+        """Пары (верхняя граница, число наблюдений не больше неё), последняя граница - inf"""
+        result = []
+        total = 0
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    pairs = [*labels, extra] if extra is not None else list(labels)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса: счётчики и гистограммы задержек с метками.
+    span замеряет длительность этапа в гистограмму rag_stage_seconds,
+    trace собирает спаны одного запроса в текущем потоке или задаче asyncio.
+    Экспорт - to_dict (JSON) и to_prometheus (текстовый формат Prometheus).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._histograms: dict[str, dict[Labels, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Замеряет длительность блока как этап stage, в том числе завершившегося исключением"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(stage, time.perf_counter() - start_time)
+
+    def record_span(self, stage: str, elapsed: float) -> None:
+        """Спан, замеренный вне этого процесса, например в дочернем процессе пула"""
+        self.observe(STAGE_SECONDS, elapsed, stage=stage)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+    def timed(self, stage: str) -> Callable[[FuncTypeVar], FuncTypeVar]:
+        """Декоратор: каждый вызов функции - спан stage"""
+        def decorator(func: FuncTypeVar) -> FuncTypeVar:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper  # type: ignore[return-value]
+        return decorator
+
+    @contextmanager
+    def trace(self) -> Iterator[list[Span]]:
+        """Спаны, завершившиеся внутри блока, в порядке завершения"""
+        spans: list[Span] = []
+        token = _trace.set(spans)
+        try:
+            yield spans
+        finally:
+            _trace.reset(token)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(labels), "value": value} for labels, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(labels),
+                            "count": histogram.count,
+                            "sum": histogram.sum,
+                            **histogram.percentiles(),
+                        }
+                        for labels, histogram in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in self._counters.items():
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value!r}")
+            for name, series in self._histograms.items():
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    for bound, count in histogram.cumulative_buckets():
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_bound(bound)))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum!r}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_spans(spans: list[Span], prefixes: tuple[str, ...] = ("request", "llm.")) -> str:
+    """Этапы запроса одной строкой, например "request.search 0.03 сек, llm.send_request 1.20 сек" """
+    return ", ".join(f"{stage} {elapsed:.2f} сек" for stage, elapsed in spans if stage.startswith(prefixes))
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+import cProfile
+from datetime import datetime
+import io
+from pathlib import Path
+import pstats
+from threading import Lock
+import tracemalloc
+from typing import Iterator
+from uuid import uuid4
+
+
+# Кадры самого профилировщика и загрузчика модулей не интересны в сводке по памяти
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def new_run_id() -> str:
+    """Идентификатор прогона: время и короткий случайный суффикс, сортируется по времени"""
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid4().hex[:6]}"
+
+
+class UseCaseProfiler:
+    """
+    Профилирование сценариев Controller: CPU-профиль cProfile и, если включено,
+    снимок выделений памяти tracemalloc. Для каждого прогона в profile_dir пишутся
+    <id>_<сценарий>.prof (pstats, snakeviz), <id>_<сценарий>.tracemalloc (tracemalloc.Snapshot.load)
+    и <id>_<сценарий>.txt со сводкой top самых затратных функций и строк, которая же печатается.
+    Профилируемые сценарии выполняются по одному: и cProfile, и tracemalloc глобальны для процесса.
+    """
+
+    def __init__(self, profile_dir: Path, top: int = 20, memory: bool = True):
+        self.profile_dir = profile_dir
+        self.top = top
+        self.memory = memory
+        self._lock = Lock()
+
+    @contextmanager
+    def profile(self, name: str, title: str = "") -> Iterator[str]:
+        """Профилирует блок, отдаёт id прогона"""
+        run_id = new_run_id()
+        with self._lock:
+            profiler = cProfile.Profile()
+            started_tracemalloc = self.memory and not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start()
+            profiler.enable()
+            try:
+                yield run_id
+            finally:
+                profiler.disable()
+                snapshot = tracemalloc.take_snapshot() if self.memory else None
+                peak = tracemalloc.get_traced_memory()[1] if self.memory else 0
+                if started_tracemalloc:
+                    tracemalloc.stop()
+                self._report(f"{run_id}_{name}", title or name, profiler, snapshot, peak)
+
+    def _report(
+            self,
+            prefix: str,
+            title: str,
+            profiler: cProfile.Profile,
+            snapshot: tracemalloc.Snapshot | None,
+            peak: int
+    ) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(self.profile_dir / f"{prefix}.prof"))
+
+        stream = io.StringIO()
+        stream.write(f"Профиль {prefix}: {title}\n")
+        pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats("cumulative").print_stats(self.top)
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces(_MEMORY_FILTERS)
+            snapshot.dump(str(self.profile_dir / f"{prefix}.tracemalloc"))
+            stream.write(f"Пик памяти Python: {peak / 1024 / 1024:.1f} МБ. Больше всего памяти занимают:\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                stream.write(f"  {stat}\n")
+
+        summary = stream.getvalue()
+        (self.profile_dir / f"{prefix}.txt").write_text(summary, encoding="utf-8")
+        print(summary)
+        print(f"Профиль сохранён в {self.profile_dir / prefix}.*")
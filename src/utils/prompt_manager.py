@@ -1,6 +1,7 @@
 from enum import Enum
 from typing import Type
 
+from src.api_clients.base import Prompt
 from src.types_.base_types import UserQuestion
 
 
@@ -10,14 +11,25 @@ class PromptTypes(str, Enum):
 
 
 class BasePromptManager:
+    """
+    Промпт из неизменных инструкций (system) и переменной части (user) - заметок и вопроса.
+    Инструкции одинаковы у всех запросов и идут первыми, поэтому LLM переиспользует
+    их KV-кэш и не пересчитывает их на каждом запросе.
+    """
     prompt_type: PromptTypes = None
-    _RAG_PROMPT_TEMPLATE = ""
+    _SYSTEM_PROMPT = ""
+    _QUESTION_TEMPLATE = "{question}"
+    _CONTEXT_TEMPLATE = "Заметки:\n{context}\n\n"
     
     def __init__(self, question: UserQuestion, context=None):
-        self._prompt = f"Заметки: {context}\n" if context else "" + self._RAG_PROMPT_TEMPLATE.format(question=question)
+        notes = self._CONTEXT_TEMPLATE.format(context=context) if context else ""
+        self._prompt = Prompt(
+            system=self._SYSTEM_PROMPT,
+            user=notes + self._QUESTION_TEMPLATE.format(question=question)
+        )
 
     @property
-    def result(self) -> str:
+    def result(self) -> Prompt:
         """ Промпт для запроса к LLM """
         return self._prompt
 
@@ -26,15 +38,14 @@ class LawPromptManager(BasePromptManager):
     
     prompt_type = PromptTypes.LAW
     
-    _RAG_PROMPT_TEMPLATE = """
-        ### РОЛЬ: Ты — педантичный российский юрист. Твоя база — ТОЛЬКО предоставленный текст.\n"
+    _SYSTEM_PROMPT = (
+        "### РОЛЬ: Ты — педантичный российский юрист. Твоя база — ТОЛЬКО предоставленный текст.\n"
         "### ПРАВИЛА:\n"
         "1. ЦИТИРУЙ ДОСЛОВНО. Не меняй юридические формулировки.\n"
         "2. Выделяй **ЖИРНЫМ** ключевые требования (например, **участие специалиста**).\n"
-        "3. Пиши кратко и по существу. Если ответа нет, пиши 'ИНФОРМАЦИЯ НЕ НАЙДЕНА'.\n\n"
-        "### ВОПРОС: {question}\n\n"
-        "### ЮРИДИЧЕСКИЙ ОТВЕТ:"
-    """
+        "3. Пиши кратко и по существу. Если ответа нет, пиши 'ИНФОРМАЦИЯ НЕ НАЙДЕНА'."
+    )
+    _QUESTION_TEMPLATE = "### ВОПРОС: {question}\n\n### ЮРИДИЧЕСКИЙ ОТВЕТ:"
 
 
 class PromptManager(BasePromptManager):
@@ -42,12 +53,10 @@ class PromptManager(BasePromptManager):
     prompt_type = PromptTypes.GENERAL
     
     
-    _RAG_PROMPT_TEMPLATE = """
+    _SYSTEM_PROMPT = """
     Ты — высококлассный помощник ассистент, отвечающий ТОЛЬКО на основе предоставленных заметок.
     Если информации не достаточно — подготовь ее сам. Ответ подготовь в формате md"
 
-    Вопрос пользователя: {question}
-
     Формат ответа будет указан ниже в кавычках """ """, внутри кавычек будут вставлены пояснения в (). Они относятся ко всему блоку до (). 
     Ты должен учесть их и не включать в ответ в чистом виде. Разделители - /// необходимо сохранить для парсинга твоего ответа:
     \"""
@@ -59,10 +68,11 @@ class PromptManager(BasePromptManager):
     
     (Ты должен понять эта информация полностью отвечает на мой запрос и достаточна, если нет, то добавь блок ниже в ///)
     ///
-    # {question}
+    # <Тут повтори вопрос пользователя>
     <Тут указана дополнительная информация из LLM>
     ///
     """
+    _QUESTION_TEMPLATE = "Вопрос пользователя: {question}"
 
     # def parse(self, answer: str) -> IsNeedCreate:
     #     """
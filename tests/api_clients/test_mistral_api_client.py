@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import redirect_stdout
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from src.api_clients.base import ModelsEnum, Prompt
+from src.api_clients.mistral_api_client import MistralClient, MistralInitData
+
+
+PROMPT = Prompt(system="Отвечай кратко", user="Вопрос")
+USAGE = {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9}
+
+
+def sse_event(content: str, finish_reason: str | None = None, usage: dict | None = None) -> str:
+    data = {
+        "id": "1",
+        "object": "chat.completion.chunk",
+        "created": 1,
+        "model": "mistral-small",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        data["usage"] = usage
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+SSE_BODY = (sse_event("При") + sse_event("вет") + sse_event("", "stop", USAGE) + "data: [DONE]\n\n").encode("utf-8")
+
+COMPLETION = {
+    "id": "1",
+    "object": "chat.completion",
+    "created": 1,
+    "model": "mistral-small",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Ответ"}, "finish_reason": "stop"}],
+    "usage": USAGE,
+}
+
+
+class TestMistralClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MistralClient(MistralInitData(api_key="key", model=ModelsEnum.SMALL))
+        self.transports: list[object] = []
+        self.bodies: list[dict] = []
+        # Первый запрос каждого теста получает 503, и клиент повторяет его
+        self.failures = 1
+
+    def tearDown(self):
+        self.client.close()
+
+    def _response(self, transport: object, request: httpx.Request) -> httpx.Response:
+        self.transports.append(transport)
+        self.bodies.append(json.loads(request.content))
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(503, json={"message": "перегружен"})
+        if self.bodies[-1].get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=SSE_BODY)
+        return httpx.Response(200, json=COMPLETION)
+
+    def _run(self, func, *args):
+        with patch.object(httpx.HTTPTransport, "handle_request", autospec=True, side_effect=self._response), \
+                patch("src.api_clients.mistral_api_client.time.sleep") as sleep, \
+                redirect_stdout(io.StringIO()):
+            result = func(*args)
+        return result, sleep
+
+    def test_stream_parses_sse_and_retries_on_same_pool(self):
+        tokens, sleep = self._run(lambda: list(self.client.stream_request(PROMPT)))
+
+        self.assertEqual(tokens, ["При", "вет"])
+        sleep.assert_called_once_with(5)
+        self.assertEqual(len(self.transports), 2)
+        self.assertIs(self.transports[0], self.transports[1])
+        self.assertEqual(self.bodies[0]["messages"], [
+            {"role": "system", "content": PROMPT.system},
+            {"role": "user", "content": PROMPT.user},
+        ])
+
+    def test_requests_share_one_pool(self):
+        http_client = self.client._http_client
+        sdk = self.client._client
+        answer, _ = self._run(self.client.send_request, PROMPT)
+        tokens, _ = self._run(lambda: list(self.client.stream_request(PROMPT)))
+
+        self.assertEqual(answer, "Ответ")
+        self.assertEqual(tokens, ["При", "вет"])
+        self.assertIs(self.client._http_client, http_client)
+        self.assertIs(self.client._client, sdk)
+        self.assertEqual(len(self.transports), 3)
+        self.assertEqual({id(transport) for transport in self.transports}, {id(self.transports[0])})
+
+    def test_async_stream_parses_sse(self):
+        transports = []
+
+        async def handle(transport: httpx.AsyncHTTPTransport, request: httpx.Request) -> httpx.Response:
+            transports.append(transport)
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=SSE_BODY)
+
+        async def run() -> list[list[str]]:
+            try:
+                return [
+                    [token async for token in self.client.stream_request_async(PROMPT)]
+                    for _ in range(2)
+                ]
+            finally:
+                await self.client.aclose()
+
+        with patch.object(httpx.AsyncHTTPTransport, "handle_async_request", new=handle):
+            results = asyncio.run(run())
+
+        self.assertEqual(results, [["При", "вет"], ["При", "вет"]])
+        self.assertEqual(len(transports), 2)
+        self.assertIs(transports[0], transports[1])
@@ -0,0 +1,129 @@
+import asyncio
+from contextlib import redirect_stdout
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.api_clients.base import OllamaModelsEnum, Prompt
+from src.api_clients.ollama_api_client import OllamaApiClient, OllamaInitModel
+from src.utils.metrics import STAGE_SECONDS, metrics
+
+
+PROMPT = Prompt(system="Отвечай кратко", user="Вопрос")
+
+STREAM_LINES = [
+    {"response": "При", "done": False},
+    {"response": "вет", "done": False},
+    {"response": "", "done": True, "context": [1, 2], "prompt_eval_count": 7, "eval_count": 2},
+]
+
+
+def ndjson(lines: list[dict]) -> bytes:
+    # Пустые строки между объектами Ollama не шлёт, но клиент должен их пропускать
+    return "\n\n".join(json.dumps(line, ensure_ascii=False) for line in lines).encode("utf-8") + b"\n"
+
+
+class TestOllamaApiClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = OllamaApiClient(OllamaInitModel(
+            base_url="http://ollama:11434/",
+            model=OllamaModelsEnum.QWEN_2_5,
+            reuse_context=True,
+        ))
+        self.requests: list[tuple[object, dict]] = []
+        metrics.reset()
+
+    def tearDown(self):
+        self.client.close()
+        metrics.reset()
+
+    def _send(self, adapter: HTTPAdapter, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        payload = json.loads(request.body)
+        self.requests.append((adapter, payload))
+        response = requests.Response()
+        response.status_code = 200
+        response.request = request
+        response.url = request.url
+        if payload["stream"]:
+            response.raw = io.BytesIO(ndjson(STREAM_LINES))
+        else:
+            response.raw = io.BytesIO(json.dumps({"response": "Ответ", "done": True, "context": [3]}).encode("utf-8"))
+        return response
+
+    def _counter(self, name: str) -> float:
+        return metrics.to_dict()["counters"][name][0]["value"]
+
+    def test_stream_parses_ndjson(self):
+        with patch.object(HTTPAdapter, "send", autospec=True, side_effect=self._send):
+            tokens = list(self.client.stream_request(PROMPT))
+
+        self.assertEqual(tokens, ["При", "вет"])
+        [(_, payload)] = self.requests
+        self.assertEqual(payload["system"], PROMPT.system)
+        self.assertEqual(payload["prompt"], PROMPT.user)
+        self.assertTrue(payload["stream"])
+        self.assertEqual(self.client._context, [1, 2])
+        self.assertEqual(self._counter("llm_prompt_tokens_total"), 7)
+        self.assertEqual(self._counter("llm_completion_tokens_total"), 2)
+
+    def test_session_is_reused_across_requests(self):
+        with patch.object(HTTPAdapter, "send", autospec=True, side_effect=self._send), redirect_stdout(io.StringIO()):
+            session = self.client._session
+            list(self.client.stream_request(PROMPT))
+            answer = self.client.send_request(PROMPT)
+            self.client.send_request(PROMPT)
+
+        self.assertEqual(answer, "Ответ")
+        self.assertIs(self.client._session, session)
+        adapters = {id(adapter) for adapter, _ in self.requests}
+        self.assertEqual(adapters, {id(session.get_adapter("http://ollama:11434"))})
+        # context предыдущего ответа передаётся в следующий запрос
+        self.assertEqual([payload.get("context") for _, payload in self.requests], [None, [1, 2], [3]])
+
+    def test_async_stream_parses_ndjson_over_one_pool(self):
+        transports = []
+
+        async def handle(transport: httpx.AsyncHTTPTransport, request: httpx.Request) -> httpx.Response:
+            transports.append(transport)
+            return httpx.Response(200, content=ndjson(STREAM_LINES))
+
+        async def run() -> list[list[str]]:
+            try:
+                return [
+                    [token async for token in self.client.stream_request_async(PROMPT)]
+                    for _ in range(2)
+                ]
+            finally:
+                await self.client.aclose()
+
+        with patch.object(httpx.AsyncHTTPTransport, "handle_async_request", new=handle):
+            results = asyncio.run(run())
+
+        self.assertEqual(results, [["При", "вет"], ["При", "вет"]])
+        self.assertEqual(len(transports), 2)
+        self.assertIs(transports[0], transports[1])
+
+    def test_async_request_is_timed_without_printing(self):
+        async def handle(transport: httpx.AsyncHTTPTransport, request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"response": "Ответ", "done": True})
+
+        async def run() -> str:
+            try:
+                return await self.client.send_request_async(PROMPT)
+            finally:
+                await self.client.aclose()
+
+        output = io.StringIO()
+        with patch.object(httpx.AsyncHTTPTransport, "handle_async_request", new=handle), redirect_stdout(output):
+            answer = asyncio.run(run())
+
+        self.assertEqual(answer, "Ответ")
+        self.assertEqual(output.getvalue(), "")
+        stages = [item["labels"]["stage"] for item in metrics.to_dict()["histograms"][STAGE_SECONDS]]
+        self.assertEqual(stages, ["llm.send_request_async"])
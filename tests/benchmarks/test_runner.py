@@ -0,0 +1,65 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+from src.benchmarks.corpus import CorpusFormat, CorpusSpec, generate_corpus
+from src.benchmarks.runner import compare_reports, latency_stats
+
+
+def report(seconds: float, p95: float, peak_rss_mb: float = 100.0) -> dict:
+    return {
+        "stages": {
+            "embed": {"seconds": seconds, "peak_rss_mb": peak_rss_mb, "latency_ms": None},
+            "faiss.retrieve": {
+                "seconds": 1.0, "peak_rss_mb": peak_rss_mb, "latency_ms": {"p95": p95}
+            },
+        }
+    }
+
+
+class TestCompareReports(unittest.TestCase):
+
+    def test_within_tolerance(self):
+        self.assertEqual(compare_reports(report(1.1, 11.0), report(1.0, 10.0), tolerance=0.2), [])
+
+    def test_slower_stages_are_regressions(self):
+        regressions = compare_reports(report(2.0, 20.0), report(1.0, 10.0), tolerance=0.2)
+
+        self.assertEqual(
+            {(r.stage, r.metric) for r in regressions},
+            {("embed", "seconds"), ("faiss.retrieve", "latency_p95_ms")}
+        )
+
+    def test_memory_regression(self):
+        regressions = compare_reports(report(1.0, 10.0, 200.0), report(1.0, 10.0, 100.0))
+
+        self.assertEqual({r.metric for r in regressions}, {"peak_rss_mb"})
+
+    def test_missing_stage_is_skipped(self):
+        baseline = report(1.0, 10.0)
+        del baseline["stages"]["faiss.retrieve"]
+
+        self.assertEqual(compare_reports(report(1.0, 50.0), baseline), [])
+
+
+class TestBenchmarkHelpers(unittest.TestCase):
+
+    def test_latency_stats(self):
+        stats = latency_stats([0.001] * 99 + [0.1])
+
+        self.assertAlmostEqual(stats["p50"], 1.0)
+        self.assertAlmostEqual(stats["max"], 100.0)
+        self.assertGreater(stats["p99"], stats["p95"])
+
+    def test_corpus_is_deterministic(self):
+        spec = CorpusSpec(documents=4, words_per_document=50, formats=[CorpusFormat.MD, CorpusFormat.TXT])
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            first_files = generate_corpus(spec, Path(first))
+            second_files = generate_corpus(spec, Path(second))
+
+            self.assertEqual([f.name for f in first_files], [f.name for f in second_files])
+            self.assertEqual(
+                [f.read_text(encoding="utf-8") for f in first_files],
+                [f.read_text(encoding="utf-8") for f in second_files]
+            )
+            self.assertEqual({f.suffix for f in first_files}, {".md", ".txt"})
@@ -0,0 +1,126 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+import io
+import os
+from pathlib import Path
+import tempfile
+from types import SimpleNamespace
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+import numpy as np
+
+from src.server.batcher import MicroBatcher
+from src.services.answer_cache.answer_cache import AnswerCache
+from src.services.retrieval.base import SearchHit, format_chunks
+from src.services.retrieval.context_packer import ContextBudget, ContextPacker
+from src.utils.metrics import metrics
+from src.utils.prompt_manager import PromptFactory, PromptTypes
+
+# Импорт use cases читает настройки из окружения и .env, поэтому обязательные настройки подставляются
+REQUIRED_SETTINGS = {
+    "NOTES_DIR": "notes",
+    "CHUNK_SIZE": "600",
+    "OVERLAP": "80",
+    "PROMPT_TYPE": PromptTypes.GENERAL.value,
+    "LLM_TYPE": "ollama",
+    "EMBEDDING_MODEL": "intfloat/multilingual-e5-small",
+    "OLLAMA_BASE_URL": "http://localhost:11434",
+    "OLLAMA_MODEL": "qwen2.5",
+    "CHROMA_DIR_PATH": "chroma",
+    "CHROMA_COLLECTION_NAME": "notes",
+    "CHROMA_DB_HOST": "localhost",
+    "CHROMA_DB_PORT": "8000",
+    "RETRIEVAL_K": "4",
+    "MISTRAL_API_TOKEN": "token",
+    "MISTRAL_MODEL": "mistral-small",
+    "RAG_ENGINE_TYPE": "faiss",
+}
+with patch.dict(os.environ, {**REQUIRED_SETTINGS, **os.environ}):
+    from src.controllers.use_cases.get_request import AsyncRequestUseCase, AsyncRetrieveUseCase
+
+
+def count_words(texts: list[str]) -> list[int]:
+    return [len(text.split()) for text in texts]
+
+
+HITS = {
+    "налог": [
+        SearchHit(chunk={"text": "налог на имущество", "source": "a.md"}, distance=0.1),
+        SearchHit(chunk={"text": "далёкая заметка", "source": "b.md"}, distance=0.9),
+    ],
+    "суп": [SearchHit(chunk={"text": "суп варится два часа", "source": "c.md"}, distance=0.2)],
+}
+
+
+class TestAsyncUseCases(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.searches: list[list[str]] = []
+        engine = Mock(index_version="v1")
+        engine.search_many.side_effect = self._search_many
+        engine.embed_queries.side_effect = lambda queries: [np.ones(4, dtype="float32") * len(q) for q in queries]
+        self.app = SimpleNamespace(
+            settings=SimpleNamespace(PROMPT_TYPE=PromptTypes.GENERAL),
+            engine=engine,
+            llm_client=Mock(model_name="ollama:qwen2.5", send_request_async=AsyncMock(return_value="ответ")),
+            answer_cache=None,
+            retrieval_executor=self.executor,
+            query_batcher=MicroBatcher(engine.search_many, self.executor, max_batch_size=32, max_wait=0.01),
+            embedding_batcher=MicroBatcher(engine.embed_queries, self.executor, max_batch_size=32, max_wait=0.01),
+            context_packer=ContextPacker(count_words, ContextBudget(max_distance=0.5)),
+            prompt_manager_class=PromptFactory.get_prompt_class_by_type(PromptTypes.GENERAL),
+        )
+        metrics.reset()
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self._tmp.cleanup()
+        metrics.reset()
+
+    def _search_many(self, queries: list[str]) -> list[list[SearchHit]]:
+        self.searches.append(queries)
+        return [HITS[query] for query in queries]
+
+    async def _run(self, use_case, *questions: str) -> list[str]:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            results = await asyncio.gather(*(use_case(self.app, question).execute() for question in questions))
+        # Сервис не печатает ничего на каждый запрос
+        self.assertEqual(output.getvalue(), "")
+        return list(results)
+
+    def _counter(self, name: str, **labels: str) -> float:
+        series = metrics.to_dict()["counters"].get(name, [])
+        return next((item["value"] for item in series if item["labels"] == labels), 0.0)
+
+    async def test_retrieve_batches_concurrent_queries(self):
+        contexts = await self._run(AsyncRetrieveUseCase, "налог", "суп")
+
+        self.assertEqual(self.searches, [["налог", "суп"]])
+        self.assertEqual(contexts, [
+            format_chunks([hit.chunk for hit in HITS["налог"]]),
+            format_chunks([hit.chunk for hit in HITS["суп"]]),
+        ])
+
+    async def test_request_packs_context_silently(self):
+        [answer] = await self._run(AsyncRequestUseCase, "налог")
+
+        self.assertEqual(answer, "ответ")
+        [prompt] = self.app.llm_client.send_request_async.await_args.args
+        self.assertIn("налог на имущество", prompt.text)
+        self.assertNotIn("далёкая заметка", prompt.text)
+        self.assertEqual(self._counter("rag_context_dropped_chunks_total", reason="distance"), 1)
+
+    async def test_request_uses_answer_cache(self):
+        self.app.answer_cache = AnswerCache(Path(self._tmp.name), "model")
+
+        first = await self._run(AsyncRequestUseCase, "налог")
+        second = await self._run(AsyncRequestUseCase, "налог")
+
+        self.assertEqual(first, second)
+        self.app.llm_client.send_request_async.assert_awaited_once()
+        self.assertEqual(self._counter("rag_answer_cache_hits_total"), 1)
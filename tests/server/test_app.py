@@ -0,0 +1,69 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from src.server.app import RAGServer
+
+
+class TestRAGServer(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        # Controller не импортируется: импорт src.controllers читает настройки из .env
+        self.controller = Mock(get_answer_async=AsyncMock(), retrieve_async=AsyncMock())
+        self.server = RAGServer(self.controller)
+
+    async def _request(self, method: str, path: str, body: bytes = b"") -> tuple[int, dict]:
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.server({"type": "http", "method": method, "path": path}, receive, send)
+        start, response = sent
+        return start["status"], json.loads(response["body"])
+
+    async def test_ask(self):
+        self.controller.get_answer_async.return_value = "ответ"
+
+        status, payload = await self._request("POST", "/ask", '{"question": " вопрос "}'.encode("utf-8"))
+
+        self.assertEqual((status, payload), (200, {"answer": "ответ"}))
+        self.controller.get_answer_async.assert_awaited_once_with("вопрос")
+
+    async def test_retrieve(self):
+        self.controller.retrieve_async.return_value = "контекст"
+
+        status, payload = await self._request("POST", "/retrieve", b'{"query": "q"}')
+
+        self.assertEqual((status, payload), (200, {"context": "контекст"}))
+
+    async def test_bad_requests(self):
+        for path, body in (
+                ("/ask", b""),
+                ("/ask", b"{not json"),
+                ("/ask", b"[1, 2]"),
+                ("/ask", b'{"question": "  "}'),
+                ("/retrieve", b'{"query": 1}'),
+        ):
+            with self.subTest(path=path, body=body):
+                status, payload = await self._request("POST", path, body)
+
+                self.assertEqual(status, 400)
+                self.assertIn("error", payload)
+        self.controller.get_answer_async.assert_not_awaited()
+        self.controller.retrieve_async.assert_not_awaited()
+
+    async def test_unknown_route_and_method(self):
+        self.assertEqual((await self._request("GET", "/nope"))[0], 404)
+        self.assertEqual((await self._request("GET", "/ask"))[0], 405)
+
+    async def test_controller_error(self):
+        self.controller.get_answer_async.side_effect = RuntimeError("LLM недоступна")
+
+        status, payload = await self._request("POST", "/ask", b'{"question": "q"}')
+
+        self.assertEqual((status, payload), (500, {"error": "LLM недоступна"}))
@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+import unittest
+
+from src.server.batcher import MicroBatcher
+
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.batches: list[list[int]] = []
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def _square(self, items: list[int]) -> list[int]:
+        self.batches.append(items)
+        return [item * item for item in items]
+
+    async def test_flushes_on_max_batch_size(self):
+        batcher = MicroBatcher(self._square, self.executor, max_batch_size=3, max_wait=60)
+
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(3))), timeout=5)
+
+        self.assertEqual(results, [0, 1, 4])
+        self.assertEqual(self.batches, [[0, 1, 2]])
+
+    async def test_flushes_after_max_wait(self):
+        batcher = MicroBatcher(self._square, self.executor, max_batch_size=100, max_wait=0.05)
+
+        start_time = time.perf_counter()
+        results = await asyncio.wait_for(asyncio.gather(batcher.submit(2), batcher.submit(3)), timeout=5)
+
+        self.assertGreaterEqual(time.perf_counter() - start_time, 0.05)
+        self.assertEqual(results, [4, 9])
+        self.assertEqual(self.batches, [[2, 3]])
+
+    async def test_results_follow_submission_order(self):
+        batcher = MicroBatcher(self._square, self.executor, max_batch_size=4, max_wait=0.01)
+
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+        self.assertEqual(results, [i * i for i in range(10)])
+        self.assertEqual([item for batch in self.batches for item in batch], list(range(10)))
+        self.assertTrue(all(len(batch) <= 4 for batch in self.batches))
+
+    async def test_error_reaches_every_caller(self):
+        def fail(items: list[int]) -> list[int]:
+            raise RuntimeError("индекс не загружен")
+
+        batcher = MicroBatcher(fail, self.executor, max_batch_size=3, max_wait=60)
+
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from src.services.answer_cache.answer_cache import AnswerCache, AnswerCacheKey
+
+
+KEY = AnswerCacheKey(prompt_type="law", llm_model="ollama:qwen2.5", index_version="v1")
+
+
+class TestAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _cache(self, **kwargs) -> AnswerCache:
+        return AnswerCache(cache_dir=self.cache_dir, model_name="org/model", threshold=0.9, **kwargs)
+
+    def test_similar_question_hits(self):
+        cache = self._cache()
+        cache.set(KEY, "Срок давности?", np.array([1.0, 0.0, 0.0]), "Три года")
+
+        entry = cache.get(KEY, np.array([0.95, 0.1, 0.0]))
+
+        self.assertEqual(entry.answer, "Три года")
+        self.assertIsNone(cache.get(KEY, np.array([0.5, 0.5, 0.0])))
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_key_must_match(self):
+        cache = self._cache()
+        cache.set(KEY, "Срок давности?", np.array([1.0, 0.0]), "Три года")
+
+        self.assertIsNone(cache.get(KEY.model_copy(update={"llm_model": "mistral:mistral-tiny"}), np.array([1.0, 0.0])))
+
+    def test_persists_and_invalidates(self):
+        cache = self._cache()
+        cache.set(KEY, "a", np.array([1.0, 0.0]), "A")
+        cache.set(KEY.model_copy(update={"index_version": "v2"}), "b", np.array([0.0, 1.0]), "B")
+
+        reloaded = self._cache()
+        self.assertEqual(len(reloaded), 2)
+        reloaded.invalidate("v2")
+
+        self.assertEqual(len(self._cache()), 1)
+        self.assertIsNone(reloaded.get(KEY, np.array([1.0, 0.0])))
+
+    def test_evicts_least_recently_used(self):
+        cache = self._cache(max_entries=2)
+        cache.set(KEY, "a", np.array([1.0, 0.0, 0.0]), "A")
+        cache.set(KEY, "b", np.array([0.0, 1.0, 0.0]), "B")
+        cache.get(KEY, np.array([1.0, 0.0, 0.0]))
+
+        cache.set(KEY, "c", np.array([0.0, 0.0, 1.0]), "C")
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(KEY, np.array([0.0, 1.0, 0.0])))
+        self.assertEqual(cache.get(KEY, np.array([1.0, 0.0, 0.0])).answer, "A")
+
+    def test_appends_and_compacts(self):
+        cache = self._cache(max_entries=2)
+        entries_file = self.cache_dir / "org__model" / "entries.jsonl"
+        for number in range(5):
+            cache.set(KEY, str(number), np.eye(5)[number], str(number))
+            if number < 4:
+                # Вытесненные записи остаются в файле до сжатия
+                self.assertEqual(len(entries_file.read_text(encoding="utf-8").splitlines()), number + 1)
+
+        self.assertEqual(len(entries_file.read_text(encoding="utf-8").splitlines()), 2)
+        reloaded = self._cache(max_entries=2)
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(reloaded.get(KEY, np.eye(5)[4]).answer, "4")
+        self.assertIsNone(reloaded.get(KEY, np.eye(5)[0]))
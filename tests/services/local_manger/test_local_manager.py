@@ -0,0 +1,61 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import tempfile
+import unittest
+
+from unstructured.documents.elements import Element, Text
+
+from src.services.local_manger.local_manager import LocalManager, ParseStatus
+from src.utils.metrics import STAGE_SECONDS, metrics
+
+
+class BrokenAwareManager(LocalManager):
+    """Читает файлы как есть и не может разобрать файлы с broken в имени"""
+
+    def _partition_file(self, file: Path) -> list[Element]:
+        if "broken" in file.name:
+            raise ValueError("повреждённый файл")
+        return [Text(file.read_text(encoding="utf-8"))]
+
+
+class TestParallelParsing(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.notes = Path(self._tmp.name)
+        for i in range(6):
+            (self.notes / f"{i}.md").write_text(f"заметка {i}", encoding="utf-8")
+        (self.notes / "3_broken.md").write_text("не разобрать", encoding="utf-8")
+        (self.notes / "4_empty.md").write_text("  ", encoding="utf-8")
+        metrics.reset()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+        metrics.reset()
+
+    def _parse(self, workers: int) -> list[tuple[Path, object]]:
+        manager = BrokenAwareManager(self.notes, parse_workers=workers)
+        files = list(manager.get_files().values())
+        with redirect_stdout(io.StringIO()):
+            return list(manager.iter_documents_data(files))
+
+    def _parse_spans_count(self) -> int:
+        series = metrics.to_dict()["histograms"][STAGE_SECONDS]
+        return next(item["count"] for item in series if item["labels"] == {"stage": "index.parse_document"})
+
+    def test_results_match_sequential_parsing(self):
+        sequential = self._parse(workers=1)
+        parallel = self._parse(workers=2)
+
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([file.name for file, _ in parallel], sorted(file.name for file, _ in parallel))
+        results = {file.name: data for file, data in parallel}
+        self.assertIs(results["3_broken.md"], ParseStatus.FAILED)
+        self.assertIsNone(results["4_empty.md"])
+        self.assertEqual(results["5.md"], {"text": "заметка 5", "source": "5.md"})
+
+    def test_parallel_parsing_is_timed_in_parent(self):
+        self._parse(workers=2)
+
+        self.assertEqual(self._parse_spans_count(), 8)
@@ -0,0 +1,24 @@
+from pathlib import Path
+
+import numpy as np
+from unstructured.documents.elements import Element, Text
+
+from src.services.local_manger.local_manager import LocalManager
+
+
+class PlainTextManager(LocalManager):
+    """Читает файлы как есть, без unstructured"""
+
+    def _partition_file(self, file: Path) -> list[Element]:
+        return [Text(file.read_text(encoding="utf-8"))]
+
+
+class WordHashEncoder:
+    """Мешок слов, разложенный по 16 корзинам: одинаковые тексты дают одинаковые векторы"""
+
+    def encode(self, sentences: list[str], **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(sentences), 16), dtype="float32")
+        for row, sentence in enumerate(sentences):
+            for word in sentence.split():
+                vectors[row, sum(word.encode("utf-8")) % 16] += 1
+        return vectors
@@ -0,0 +1,81 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.services.retrieval.base import format_chunks
+from src.services.retrieval.chunk_generator import ChunkGenerator
+from src.services.retrieval.rag_engine import FAISSRAGConfig, FAISSRAGEngine, RetrievalMode
+from tests.services.retrieval.fakes import PlainTextManager, WordHashEncoder
+
+
+NOTES = {
+    "a.md": "договор купли продажи",
+    "b.md": "суп варится два часа",
+    "c.md": "налог на имущество",
+}
+
+
+class TestBatchedRetrieval(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self._tmp.name)
+        notes = tmp / "notes"
+        notes.mkdir()
+        for name, text in NOTES.items():
+            (notes / name).write_text(text, encoding="utf-8")
+        index_dir = tmp / "index"
+        config = FAISSRAGConfig(
+            index_dir=index_dir,
+            index_file=index_dir / "index.faiss",
+            docs_dir=index_dir / "documents",
+            manifest_file=index_dir / "manifest.json",
+            bm25_dir=index_dir / "bm25",
+            retrieval_k=1,
+            retrieval_mode=RetrievalMode.HYBRID,
+        )
+        chunk_generator = ChunkGenerator(local_manager=PlainTextManager(notes), chunk_size=100, overlap=0)
+        self.engine = FAISSRAGEngine(config=config, chunk_generator=chunk_generator, embedding_model=WordHashEncoder())
+        with redirect_stdout(io.StringIO()):
+            self.engine.build_index()
+        self.encode = patch.object(WordHashEncoder, "encode", autospec=True, side_effect=WordHashEncoder.encode).start()
+        self.search = patch.object(FAISSRAGEngine, "_search_many", autospec=True, side_effect=FAISSRAGEngine._search_many).start()
+
+    def tearDown(self):
+        patch.stopall()
+        self.engine.documents.close()
+        self._tmp.cleanup()
+
+    def _calls(self, mock) -> list[list[str]]:
+        return [list(call.args[1]) for call in mock.call_args_list]
+
+    def test_repeated_queries_are_searched_once(self):
+        queries = [NOTES["b.md"], NOTES["a.md"], NOTES["b.md"]]
+
+        hits = self.engine.search_many(queries)
+
+        self.assertEqual(self._calls(self.encode), [[NOTES["b.md"], NOTES["a.md"]]])
+        self.assertEqual(self._calls(self.search), [[NOTES["b.md"], NOTES["a.md"]]])
+        self.assertEqual([result[0].chunk["source"] for result in hits], ["b.md", "a.md", "b.md"])
+        self.assertIs(hits[0], hits[2])
+
+    def test_cache_hits_and_misses_keep_order(self):
+        self.engine.search(NOTES["a.md"])
+        self.encode.reset_mock()
+        self.search.reset_mock()
+
+        queries = [NOTES["c.md"], NOTES["a.md"], NOTES["b.md"]]
+        contexts = self.engine.retrieve_many(queries)
+
+        self.assertEqual(self._calls(self.encode), [[NOTES["c.md"], NOTES["b.md"]]])
+        self.assertEqual(self._calls(self.search), [[NOTES["c.md"], NOTES["b.md"]]])
+        self.assertEqual(contexts, [
+            format_chunks([{"text": NOTES[name], "source": name}]) for name in ("c.md", "a.md", "b.md")
+        ])
+
+        self.engine.retrieve_many(queries)
+        self.assertEqual(self.search.call_count, 1)
+        self.assertEqual(self.encode.call_count, 1)
@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.services.retrieval.bm25_index import BM25Index, BM25IndexWriter, tokenize
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.index_dir = Path(self._tmp.name) / "bm25"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _build(self, docs: dict[int, str]) -> BM25Index:
+        writer = BM25IndexWriter(self.index_dir)
+        for vector_id, text in docs.items():
+            writer.add(vector_id, text)
+        writer.commit()
+        return BM25Index.open(self.index_dir)
+
+    def test_tokenize_keeps_identifiers(self):
+        self.assertEqual(tokenize("Статья 81 ТК, get_chunks()"), ["статья", "81", "тк", "get_chunks"])
+
+    def test_exact_identifier_ranks_first(self):
+        index = self._build({
+            10: "Трудовой договор расторгается по статье 77",
+            20: "Расторжение трудового договора по статье 81 по инициативе работодателя",
+            30: "Договор аренды квартиры",
+        })
+
+        result = index.search("договор по статье 81", k=2)
+
+        self.assertEqual([vector_id for vector_id, _ in result], [20, 10])
+
+    def test_unknown_terms(self):
+        index = self._build({1: "первый документ"})
+
+        self.assertEqual(index.search("неизвестное слово", k=3), [])
+
+    def test_rebuild_replaces_index(self):
+        self._build({1: "старый текст"})
+        index = self._build({2: "новый текст"})
+
+        self.assertTrue(BM25Index.exists(self.index_dir))
+        self.assertEqual([vector_id for vector_id, _ in index.search("текст", k=5)], [2])
+
+    def test_append_segment_and_remove(self):
+        self._build({1: "трудовой договор", 2: "договор аренды"})
+        writer = BM25IndexWriter(self.index_dir, append=True)
+        writer.remove({1})
+        writer.add(3, "трудовой договор с работником")
+        writer.commit()
+
+        index = BM25Index.open(self.index_dir)
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual([vector_id for vector_id, _ in index.search("трудовой договор", k=5)], [3, 2])
@@ -0,0 +1,135 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.services.retrieval.chunk_store import ChunkStore, ChunkStoreWriter
+
+
+class TestChunkStore(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.store_dir = Path(self._tmp.name) / "documents"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, chunks: dict[int, dict[str, str]]) -> ChunkStore:
+        writer = ChunkStoreWriter(self.store_dir)
+        for vector_id, chunk in chunks.items():
+            writer.add(vector_id, chunk)
+        writer.commit()
+        return ChunkStore.open(self.store_dir)
+
+    def test_roundtrip(self):
+        chunks = {
+            1: {"text": "первый", "source": "a.md"},
+            5: {"text": "second", "source": "b.md"},
+            7: {"text": "третий", "source": "a.md"},
+        }
+
+        store = self._write(chunks)
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get(7), chunks[7])
+        self.assertIsNone(store.get(2))
+        self.assertIsNone(store.get(100))
+        self.assertEqual(dict(store.items()), chunks)
+        store.close()
+
+    def test_rewrite_replaces_store(self):
+        self._write({1: {"text": "old", "source": "a.md"}}).close()
+
+        store = self._write({2: {"text": "new", "source": "b.md"}})
+
+        self.assertIsNone(store.get(1))
+        self.assertEqual(store.get(2), {"text": "new", "source": "b.md"})
+        store.close()
+
+    def test_duplicates_add_sources(self):
+        writer = ChunkStoreWriter(self.store_dir)
+        writer.add(1, {"text": "пункт договора", "source": "a.md"})
+        writer.add(2, {"text": "другой текст", "source": "a.md"})
+        writer.add(3, {"text": "Пункт договора.", "source": "b.md"}, canonical_id=1)
+        writer.add(4, {"text": "пункт договора", "source": "a.md"}, canonical_id=1)
+        writer.commit()
+
+        store = ChunkStore.open(self.store_dir)
+
+        self.assertEqual(store.get(1), {"text": "пункт договора", "source": "a.md, b.md"})
+        self.assertEqual(store.get(2)["source"], "a.md")
+        self.assertEqual(store.duplicates_count, 2)
+        self.assertEqual([canonical_id for _, canonical_id, _ in store.entries()], [1, 2, 1, 1])
+        store.close()
+
+    def test_store_without_duplicates_index(self):
+        writer = ChunkStoreWriter(self.store_dir)
+        writer.add(1, {"text": "пункт договора", "source": "a.md"})
+        writer.add(2, {"text": "пункт договора", "source": "b.md"}, canonical_id=1)
+        writer.commit()
+        # Сегмент, записанный до появления индекса дубликатов
+        for name in ("duplicate_ids.npy", "duplicate_canonical_ids.npy", "duplicate_source_ids.npy"):
+            (self.store_dir / "000000" / name).unlink()
+
+        store = ChunkStore.open(self.store_dir)
+
+        self.assertEqual(store.get(1)["source"], "a.md, b.md")
+        self.assertEqual(store.duplicates_count, 1)
+        store.close()
+
+    def test_empty_store(self):
+        store = self._write({})
+
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(store.get(0))
+        self.assertTrue(ChunkStore.exists(self.store_dir))
+
+    def test_ids_must_increase(self):
+        writer = ChunkStoreWriter(self.store_dir)
+        writer.add(2, {"text": "a", "source": "a.md"})
+
+        with self.assertRaises(ValueError):
+            writer.add(1, {"text": "b", "source": "a.md"})
+
+    def test_append_hides_removed_rows(self):
+        writer = ChunkStoreWriter(self.store_dir)
+        writer.add(1, {"text": "пункт договора", "source": "a.md"})
+        writer.add(2, {"text": "пункт договора", "source": "b.md"}, canonical_id=1)
+        writer.add(3, {"text": "суп", "source": "c.md"})
+        writer.commit()
+
+        writer = ChunkStoreWriter(self.store_dir, append=True)
+        writer.remove({1, 2})
+        # Дубликат удалённого чанка переписывается с тем же id как канонический
+        writer.add(2, {"text": "пункт договора", "source": "b.md"})
+        writer.add(4, {"text": "новый", "source": "d.md"})
+        writer.commit()
+        store = ChunkStore.open(self.store_dir)
+
+        self.assertEqual(store.segments_count, 2)
+        self.assertEqual(len(store), 3)
+        self.assertIsNone(store.get(1))
+        self.assertEqual(store.get(2), {"text": "пункт договора", "source": "b.md"})
+        self.assertEqual([(vector_id, canonical_id) for vector_id, canonical_id, _ in store.entries()], [(2, 2), (3, 3), (4, 4)])
+        self.assertEqual(store.duplicates_count, 0)
+        self.assertEqual(store.removed_count, 2)
+        store.close()
+
+    def test_duplicates_of_across_segments(self):
+        self._write({1: {"text": "пункт", "source": "a.md"}}).close()
+        writer = ChunkStoreWriter(self.store_dir, append=True)
+        writer.add(5, {"text": "пункт", "source": "b.md"}, canonical_id=1)
+        writer.commit()
+        store = ChunkStore.open(self.store_dir)
+
+        self.assertEqual(store.get(1)["source"], "a.md, b.md")
+        self.assertEqual(store.duplicates_of([1]), [(5, {"text": "пункт", "source": "b.md"})])
+        store.close()
+
+    def test_needs_compaction(self):
+        store = self._write({vector_id: {"text": "t", "source": "a.md"} for vector_id in range(10)})
+
+        self.assertFalse(store.needs_compaction(2, threshold=0.3))
+        self.assertTrue(store.needs_compaction(3, threshold=0.3))
+        self.assertTrue(ChunkStore.empty().needs_compaction(0, threshold=0.3))
+        store.close()
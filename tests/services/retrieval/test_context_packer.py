@@ -0,0 +1,60 @@
+import unittest
+
+from src.services.retrieval.base import SearchHit
+from src.services.retrieval.context_packer import ContextBudget, ContextPacker
+
+
+def count_words(texts: list[str]) -> list[int]:
+    return [len(text.split()) for text in texts]
+
+
+def hit(text: str, source: str, distance: float | None = None) -> SearchHit:
+    return SearchHit(chunk={"text": text, "source": source}, distance=distance)
+
+
+class TestContextPacker(unittest.TestCase):
+
+    def setUp(self):
+        # Заголовок "[Источник: x]" - 2 слова, разделитель "---" - 1
+        self.hits = [
+            hit("one two three", "a.md", 0.1),
+            hit("four five six seven eight nine", "b.md", 0.2),
+            hit("ten", "c.md", 0.3),
+        ]
+
+    def test_without_budget_keeps_everything(self):
+        packer = ContextPacker(count_words, ContextBudget())
+
+        packed = packer.pack(self.hits, prompt_tokens=1000)
+
+        self.assertEqual(packed.used, self.hits)
+        self.assertIsNone(packed.report)
+        self.assertIn("[Источник: c.md]\nten", packed.context)
+
+    def test_skips_chunk_that_does_not_fit(self):
+        packer = ContextPacker(count_words, ContextBudget(max_prompt_tokens=30, reserve_tokens=10))
+
+        packed = packer.pack(self.hits, prompt_tokens=10)
+
+        self.assertEqual(packed.available_tokens, 10)
+        self.assertEqual([h.chunk["source"] for h in packed.used], ["a.md", "c.md"])
+        self.assertEqual([h.chunk["source"] for h in packed.dropped_by_budget], ["b.md"])
+        self.assertEqual(packed.tokens, 9)
+        self.assertIn("b.md", packed.report)
+
+    def test_prompt_longer_than_budget(self):
+        packer = ContextPacker(count_words, ContextBudget(max_prompt_tokens=30))
+
+        packed = packer.pack(self.hits, prompt_tokens=100)
+
+        self.assertEqual(packed.context, "")
+        self.assertEqual(len(packed.dropped_by_budget), 3)
+
+    def test_max_distance(self):
+        packer = ContextPacker(count_words, ContextBudget(max_distance=0.25))
+        hits = self.hits + [hit("bm25 only", "d.md")]
+
+        packed = packer.pack(hits, prompt_tokens=0)
+
+        self.assertEqual([h.chunk["source"] for h in packed.used], ["a.md", "b.md", "d.md"])
+        self.assertEqual(packed.dropped_by_distance, [self.hits[2]])
@@ -0,0 +1,75 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.services.retrieval.dedup import ChunkDeduplicator, DedupParams, merge_sources
+
+
+CLAUSE = (
+    "Стороны договорились, что все споры, возникающие из настоящего договора, "
+    "подлежат рассмотрению в суде по месту нахождения истца в установленном законом порядке."
+)
+
+
+class TestChunkDeduplicator(unittest.TestCase):
+
+    def setUp(self):
+        self.deduplicator = ChunkDeduplicator(DedupParams(enabled=True))
+        self.deduplicator.check(1, CLAUSE)
+
+    def test_exact_copy_ignores_case_and_punctuation(self):
+        self.assertEqual(self.deduplicator.check(2, "  " + CLAUSE.upper().replace(",", "")), 1)
+
+    def test_near_duplicate(self):
+        self.assertEqual(self.deduplicator.check(2, CLAUSE + " Иное не предусмотрено."), 1)
+
+    def test_different_text_becomes_canonical(self):
+        text = "Налоговый вычет при покупке квартиры предоставляется один раз в жизни."
+
+        self.assertIsNone(self.deduplicator.check(2, text))
+        self.assertEqual(self.deduplicator.check(3, text), 2)
+        self.assertEqual(self.deduplicator.duplicates, 1)
+
+    def test_signatures_are_stable(self):
+        other = ChunkDeduplicator(DedupParams(enabled=True))
+        other.add("a", CLAUSE)
+
+        self.assertEqual(other.check("b", "См. также: " + CLAUSE), "a")
+
+    def test_merge_sources(self):
+        self.assertEqual(merge_sources(["a.md", "b.md", "a.md"]), "a.md, b.md")
+
+
+class TestDeduplicatorState(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.state_dir = Path(self._tmp.name) / "dedup"
+        self.params = DedupParams(enabled=True)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_save_and_load(self):
+        deduplicator = ChunkDeduplicator(self.params)
+        deduplicator.check(1, CLAUSE)
+        deduplicator.check(2, "Налоговый вычет при покупке квартиры предоставляется один раз в жизни.")
+        deduplicator.save(self.state_dir)
+
+        loaded = ChunkDeduplicator.load(self.state_dir, self.params)
+
+        self.assertTrue(ChunkDeduplicator.exists(self.state_dir))
+        self.assertEqual(loaded.check(3, CLAUSE.upper()), 1)
+        self.assertEqual(loaded.check(4, CLAUSE + " Иное не предусмотрено."), 1)
+        self.assertIsNone(loaded.check(5, "Совсем другой текст про суп."))
+
+    def test_removed_chunks_are_forgotten(self):
+        deduplicator = ChunkDeduplicator(self.params)
+        deduplicator.check(1, CLAUSE)
+        deduplicator.save(self.state_dir)
+        loaded = ChunkDeduplicator.load(self.state_dir, self.params)
+        loaded.remove([1])
+
+        self.assertIsNone(loaded.check(2, CLAUSE))
+        loaded.save(self.state_dir)
+        self.assertEqual(ChunkDeduplicator.load(self.state_dir, self.params).check(3, CLAUSE), 2)
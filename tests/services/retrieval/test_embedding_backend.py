@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+from src.services.retrieval.embedding_backend import compare_embeddings, measure_throughput
+
+
+class TestCompareEmbeddings(unittest.TestCase):
+
+    def test_identical_up_to_scale(self):
+        reference = np.array([[1.0, 0.0], [0.6, 0.8]], dtype="float32")
+
+        result = compare_embeddings(reference, reference * 3)
+
+        self.assertAlmostEqual(result["cosine_mean"], 1.0, places=6)
+        self.assertAlmostEqual(result["cosine_min"], 1.0, places=6)
+
+    def test_reports_worst_row(self):
+        reference = np.array([[1.0, 0.0], [1.0, 0.0]], dtype="float32")
+        candidate = np.array([[1.0, 0.0], [0.0, 1.0]], dtype="float32")
+
+        result = compare_embeddings(reference, candidate)
+
+        self.assertAlmostEqual(result["cosine_mean"], 0.5, places=6)
+        self.assertAlmostEqual(result["cosine_min"], 0.0, places=6)
+
+
+class TestMeasureThroughput(unittest.TestCase):
+
+    def test_warm_up_is_not_measured(self):
+        batches: list[int] = []
+
+        class Encoder:
+            def encode(self, sentences: list[str], **kwargs) -> np.ndarray:
+                batches.append(len(sentences))
+                return np.zeros((len(sentences), 2), dtype="float32")
+
+        throughput = measure_throughput(Encoder(), ["a", "b"], repeats=5)
+
+        self.assertEqual(batches, [2, 10])
+        self.assertGreater(throughput, 0)
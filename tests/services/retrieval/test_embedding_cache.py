@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from src.services.retrieval.embedding_cache import EmbeddingCache
+
+
+class FakeEncoder:
+
+    def __init__(self):
+        self.encoded: list[str] = []
+
+    def encode(self, sentences: list[str], **kwargs) -> np.ndarray:
+        self.encoded.extend(sentences)
+        return np.array([[len(s), ord(s[0])] for s in sentences], dtype="float32")
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+        self.encoder = FakeEncoder()
+        self.cache = EmbeddingCache(cache_dir=self.dir, model_name="org/model")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_encodes_only_missing_texts(self):
+        first = self.cache.encode(self.encoder, ["a", "bb"])
+        second = self.cache.encode(self.encoder, ["bb", "ccc", "a"])
+
+        self.assertEqual(self.encoder.encoded, ["a", "bb", "ccc"])
+        np.testing.assert_array_equal(first, [[1, 97], [2, 98]])
+        np.testing.assert_array_equal(second, [[2, 98], [3, 99], [1, 97]])
+
+    def test_duplicates_in_batch_encoded_once(self):
+        result = self.cache.encode(self.encoder, ["a", "a"])
+
+        self.assertEqual(self.encoder.encoded, ["a"])
+        np.testing.assert_array_equal(result, [[1, 97], [1, 97]])
+
+    def test_persisted_between_instances(self):
+        self.cache.encode(self.encoder, ["a", "bb"])
+
+        cache = EmbeddingCache(cache_dir=self.dir, model_name="org/model")
+        result = cache.encode(self.encoder, ["bb"])
+
+        self.assertEqual(self.encoder.encoded, ["a", "bb"])
+        np.testing.assert_array_equal(result, [[2, 98]])
+
+    def test_models_do_not_share_cache(self):
+        self.cache.encode(self.encoder, ["a"])
+
+        EmbeddingCache(cache_dir=self.dir, model_name="org/other").encode(self.encoder, ["a"])
+
+        self.assertEqual(self.encoder.encoded, ["a", "a"])
@@ -0,0 +1,31 @@
+from contextlib import redirect_stdout
+import io
+import unittest
+
+from src.services.retrieval.faiss_index import FAISSIndexParams, FAISSIndexType, create_index
+
+
+class TestCreateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.params = FAISSIndexParams(index_type=FAISSIndexType.IVF_PQ, nlist=4, pq_m=4, pq_nbits=4)
+
+    def _base_name(self, train_size: int) -> str:
+        import faiss
+
+        with redirect_stdout(io.StringIO()):
+            index = create_index(self.params, 16, train_size=train_size)
+        return type(faiss.downcast_index(index.index)).__name__
+
+    def test_pq_needs_points_for_every_codebook_centroid(self):
+        self.assertEqual(self._base_name(39 * 16 - 1), "IndexIVFFlat")
+        self.assertEqual(self._base_name(39 * 16), "IndexIVFPQ")
+
+    def test_nlist_is_clamped_by_train_size(self):
+        import faiss
+
+        params = FAISSIndexParams(index_type=FAISSIndexType.IVF_FLAT, nlist=1024)
+        with redirect_stdout(io.StringIO()):
+            index = create_index(params, 16, train_size=390)
+
+        self.assertEqual(faiss.downcast_index(index.index).nlist, 10)
@@ -0,0 +1,15 @@
+import unittest
+
+from src.services.retrieval.fusion import reciprocal_rank_fusion
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+
+    def test_items_found_by_both_searches_win(self):
+        dense = [1, 2, 3]
+        sparse = [4, 3, 5]
+
+        self.assertEqual(reciprocal_rank_fusion([dense, sparse], k=2)[0], 3)
+
+    def test_limits_result(self):
+        self.assertEqual(reciprocal_rank_fusion([[1, 2, 3], []], k=2), [1, 2])
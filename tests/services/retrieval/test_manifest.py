@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.services.retrieval.manifest import IndexManifest
+
+
+class TestIndexManifest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+        self.manifest = IndexManifest()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, name: str, text: str) -> Path:
+        path = self.dir / name
+        path.write_text(text, encoding="utf-8")
+        return path
+
+    def _index_all(self, files: dict[str, Path], chunks_count: int = 2):
+        diff = self.manifest.diff(files)
+        for state in diff.changed:
+            self.manifest.add_file(state, chunks_count)
+        return diff
+
+    def test_new_files_are_changed(self):
+        files = {"a.md": self._write("a.md", "a"), "b.md": self._write("b.md", "b")}
+
+        diff = self._index_all(files)
+
+        self.assertEqual([s.key for s in diff.changed], ["a.md", "b.md"])
+        self.assertEqual(diff.deleted, [])
+        self.assertEqual(self.manifest.files["a.md"].ids, range(0, 2))
+        self.assertEqual(self.manifest.files["b.md"].ids, range(2, 4))
+
+    def test_unchanged_files(self):
+        files = {"a.md": self._write("a.md", "a")}
+        self._index_all(files)
+
+        self.assertTrue(self.manifest.diff(files).is_empty)
+
+    def test_touched_file_with_same_content(self):
+        path = self._write("a.md", "a")
+        files = {"a.md": path}
+        self._index_all(files)
+        os.utime(path, (1, 1))
+
+        self.assertTrue(self.manifest.diff(files).is_empty)
+        self.assertEqual(self.manifest.files["a.md"].mtime, 1)
+
+    def test_changed_and_deleted_files(self):
+        files = {"a.md": self._write("a.md", "a"), "b.md": self._write("b.md", "b")}
+        self._index_all(files)
+        self._write("a.md", "changed")
+        del files["b.md"]
+
+        diff = self.manifest.diff(files)
+
+        self.assertEqual([s.key for s in diff.changed], ["a.md"])
+        self.assertEqual(diff.deleted, ["b.md"])
+        self.assertEqual(sorted(self.manifest.stale_ids(diff)), [0, 1, 2, 3])
+
+    def test_save_and_load(self):
+        self._index_all({"a.md": self._write("a.md", "a")})
+        path = self.dir / "manifest.json"
+
+        self.manifest.save(path)
+
+        self.assertEqual(IndexManifest.load(path), self.manifest)
+
+    def test_version_depends_on_content_only(self):
+        files = {"a.md": self._write("a.md", "a")}
+        self._index_all(files)
+        version = self.manifest.version
+
+        os.utime(files["a.md"], (1, 1))
+        self.manifest.diff(files)
+        self.assertEqual(self.manifest.version, version)
+
+        files["a.md"].write_text("changed", encoding="utf-8")
+        self._index_all(files)
+        self.assertNotEqual(self.manifest.version, version)
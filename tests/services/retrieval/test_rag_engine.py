@@ -0,0 +1,360 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from unstructured.documents.elements import Element
+
+from src.services.retrieval.chunk_generator import ChunkGenerator
+from src.services.retrieval.dedup import ChunkDeduplicator, DedupParams
+from src.services.retrieval.embedding_backend import EmbeddingParams
+from src.services.retrieval.faiss_index import FAISSIndexParams, FAISSIndexType
+from src.services.retrieval.rag_engine import (
+    ChromaRAGConfig,
+    ChromaRAGEngine,
+    FAISSRAGConfig,
+    FAISSRAGEngine,
+    RetrievalMode,
+)
+from tests.services.retrieval.fakes import PlainTextManager, WordHashEncoder
+
+
+class FlakyManager(PlainTextManager):
+    """Не может разобрать файлы из broken"""
+
+    def __init__(self, dir_path: Path):
+        super().__init__(dir_path)
+        self.broken: set[str] = set()
+
+    def _partition_file(self, file: Path) -> list[Element]:
+        if file.name in self.broken:
+            raise ValueError("повреждённый файл")
+        return super()._partition_file(file)
+
+
+class TestFAISSRAGEngine(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.notes = self.tmp / "notes"
+        self.notes.mkdir()
+        (self.notes / "a.md").write_text("договор купли продажи", encoding="utf-8")
+        (self.notes / "b.md").write_text("суп варится два часа", encoding="utf-8")
+        self.local_manager = FlakyManager(self.notes)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _engine(self, chunk_size: int = 100, model: str = "a", **config_fields) -> FAISSRAGEngine:
+        index_dir = self.tmp / "index"
+        config = FAISSRAGConfig(
+            index_dir=index_dir,
+            index_file=index_dir / "index.faiss",
+            docs_dir=index_dir / "documents",
+            manifest_file=index_dir / "manifest.json",
+            bm25_dir=index_dir / "bm25",
+            retrieval_k=1,
+            embedding=EmbeddingParams(model=model),
+            **config_fields
+        )
+        chunk_generator = ChunkGenerator(local_manager=self.local_manager, chunk_size=chunk_size, overlap=0)
+        return FAISSRAGEngine(config=config, chunk_generator=chunk_generator, embedding_model=WordHashEncoder())
+
+    def test_rebuilds_when_chunking_or_model_changes(self):
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine()
+            engine.build_index()
+            self.assertTrue(self._engine().load_index())
+            self.assertFalse(self._engine(chunk_size=10).load_index())
+            self.assertFalse(self._engine(model="b").load_index())
+
+            rebuilt = self._engine(chunk_size=10)
+            rebuilt.load_or_build_index()
+
+        self.assertEqual(rebuilt.manifest.chunk_params["chunk_size"], 10)
+        self.assertNotEqual(rebuilt.index_version, engine.index_version)
+        self.assertTrue(all(len(chunk["text"]) <= 10 for _, chunk in rebuilt.documents.items()))
+
+    def test_failed_file_is_retried(self):
+        self.local_manager.broken.add("b.md")
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine()
+            engine.build_index()
+        self.assertEqual(list(engine.manifest.files), ["a.md"])
+
+        self.local_manager.broken.clear()
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine()
+            engine.load_or_build_index()
+
+        self.assertEqual(sorted(engine.manifest.files), ["a.md", "b.md"])
+        [hit] = engine.search("суп варится два часа")
+        self.assertEqual(hit.chunk["source"], "b.md")
+
+    def test_streaming_build_matches_one_shot_build(self):
+        import faiss
+
+        for i in range(10):
+            (self.notes / f"note_{i}.md").write_text(f"заметка номер {i} " * (i + 1), encoding="utf-8")
+
+        def build(batch_size: int) -> tuple[list, np.ndarray, list[int]]:
+            with redirect_stdout(io.StringIO()), patch.object(
+                    WordHashEncoder, "encode", autospec=True, side_effect=WordHashEncoder.encode
+            ) as encode:
+                engine = self._engine(chunk_size=20, embedding_batch_size=batch_size)
+                engine.build_index()
+            ids = faiss.vector_to_array(engine.index.id_map)
+            vectors = engine.index.index.reconstruct_n(0, engine.index.ntotal)
+            items = list(engine.documents.items())
+            engine.documents.close()
+            return items, vectors[np.argsort(ids)], [len(call.args[1]) for call in encode.call_args_list]
+
+        one_shot_items, one_shot_vectors, one_shot_batches = build(batch_size=1000)
+        streamed_items, streamed_vectors, streamed_batches = build(batch_size=4)
+
+        self.assertGreater(len(one_shot_items), 4)
+        self.assertEqual(one_shot_batches, [len(one_shot_items)])
+        self.assertEqual(len(streamed_batches), -(-len(one_shot_items) // 4))
+        self.assertTrue(all(size <= 4 for size in streamed_batches))
+        self.assertEqual(streamed_items, one_shot_items)
+        np.testing.assert_array_equal(streamed_vectors, one_shot_vectors)
+
+    def _dedup_engine(self, **config_fields) -> FAISSRAGEngine:
+        return self._engine(dedup=DedupParams(enabled=True), retrieval_mode=RetrievalMode.HYBRID, **config_fields)
+
+    def test_update_appends_segment(self):
+        (self.notes / "c.md").write_text("договор купли продажи", encoding="utf-8")
+        with redirect_stdout(io.StringIO()):
+            self._dedup_engine(compaction_threshold=0.9).build_index()
+            first_segment = self.tmp / "index" / "documents" / "000000" / "texts.bin"
+            mtime = first_segment.stat().st_mtime_ns
+            (self.notes / "a.md").write_text("налог на доходы", encoding="utf-8")
+
+            engine = self._dedup_engine(compaction_threshold=0.9)
+            # Состояние дедупликатора читается с диска, а не собирается заново по всем чанкам
+            with patch.object(ChunkDeduplicator, "add", side_effect=AssertionError):
+                engine.load_or_build_index()
+
+        self.assertEqual(engine.documents.segments_count, 2)
+        self.assertEqual(first_segment.stat().st_mtime_ns, mtime)
+        self.assertEqual(len(engine.documents), 3)
+        # c.md был дубликатом изменённого a.md и стал каноническим чанком
+        self.assertEqual(engine.documents.duplicates_count, 0)
+        self.assertEqual(engine.search("договор купли продажи")[0].chunk["source"], "c.md")
+        self.assertEqual(engine.search("налог на доходы")[0].chunk["source"], "a.md")
+
+    def test_update_compacts_past_threshold(self):
+        with redirect_stdout(io.StringIO()):
+            self._dedup_engine(compaction_threshold=0.5).build_index()
+            (self.notes / "a.md").write_text("налог на доходы", encoding="utf-8")
+            (self.notes / "b.md").unlink()
+
+            engine = self._dedup_engine(compaction_threshold=0.5)
+            engine.load_or_build_index()
+
+        self.assertEqual(engine.documents.segments_count, 1)
+        self.assertEqual([chunk["source"] for _, chunk in engine.documents.items()], ["a.md"])
+        self.assertEqual(engine.search("налог на доходы")[0].chunk["source"], "a.md")
+
+    def test_interrupted_save_forces_rebuild(self):
+        with redirect_stdout(io.StringIO()):
+            self._engine().build_index()
+            (self.notes / "b.md").write_text("налог на доходы", encoding="utf-8")
+            engine = self._engine()
+            engine.load_index()
+            # Хранилище чанков уже записано, а манифест - ещё нет
+            with patch.object(FAISSRAGEngine, "_save", side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    engine.update_index()
+            engine.documents.close()
+
+            self.assertFalse(self._engine().load_index())
+            rebuilt = self._engine()
+            rebuilt.load_or_build_index()
+
+        self.assertTrue(self._engine().load_index())
+        self.assertEqual(rebuilt.search("налог на доходы")[0].chunk["source"], "b.md")
+
+
+class TestFAISSIndexTypes(unittest.TestCase):
+    """Сборка, поиск и инкрементальное обновление приближённых индексов"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.notes = self.tmp / "notes"
+        self.notes.mkdir()
+        # Обучающих векторов хватает на кодовые книги PQ с pq_nbits=4: 39 точек на каждый из 16 центроидов
+        rng = np.random.default_rng(0)
+        words = [f"слово{number}" for number in range(64)]
+        for number in range(700):
+            text = " ".join(rng.choice(words, size=8))
+            (self.notes / f"{number:03d}.md").write_text(text, encoding="utf-8")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _engine(self, index_type: FAISSIndexType) -> FAISSRAGEngine:
+        index_dir = self.tmp / index_type.value
+        config = FAISSRAGConfig(
+            index_dir=index_dir,
+            index_file=index_dir / "index.faiss",
+            docs_dir=index_dir / "documents",
+            manifest_file=index_dir / "manifest.json",
+            bm25_dir=index_dir / "bm25",
+            retrieval_k=1,
+            index_params=FAISSIndexParams(index_type=index_type, nlist=4, pq_m=4, pq_nbits=4),
+            nprobe=4,
+        )
+        chunk_generator = ChunkGenerator(local_manager=PlainTextManager(self.notes), chunk_size=200, overlap=0)
+        return FAISSRAGEngine(config=config, chunk_generator=chunk_generator, embedding_model=WordHashEncoder())
+
+    def _base_name(self, engine: FAISSRAGEngine) -> str:
+        import faiss
+
+        return type(faiss.downcast_index(engine.index.index)).__name__
+
+    def _top_source(self, engine: FAISSRAGEngine, query: str) -> str:
+        [hit] = engine.search(query)
+        return hit.chunk["source"]
+
+    def test_build_search_and_update(self):
+        expected = {
+            FAISSIndexType.IVF_FLAT: "IndexIVFFlat",
+            FAISSIndexType.IVF_PQ: "IndexIVFPQ",
+            FAISSIndexType.HNSW: "IndexHNSWFlat",
+        }
+        # Слово, повторённое много раз, уводит вектор далеко от остальных даже после квантования PQ
+        added_text = "налог " * 30
+        for index_type, base_name in expected.items():
+            with self.subTest(index_type=index_type):
+                with redirect_stdout(io.StringIO()):
+                    self._engine(index_type).build_index()
+                    (self.notes / "new.md").write_text(added_text, encoding="utf-8")
+                    engine = self._engine(index_type)
+                    with patch.object(FAISSRAGEngine, "build_index", side_effect=AssertionError):
+                        engine.load_or_build_index()
+
+                self.assertEqual(self._base_name(engine), base_name)
+                self.assertEqual(engine.index.ntotal, 701)
+                self.assertEqual(self._top_source(engine, added_text), "new.md")
+                (self.notes / "new.md").unlink()
+
+    def test_removal_from_ivf_is_incremental(self):
+        for index_type in (FAISSIndexType.IVF_FLAT, FAISSIndexType.IVF_PQ):
+            with self.subTest(index_type=index_type):
+                with redirect_stdout(io.StringIO()):
+                    self._engine(index_type).build_index()
+                    (self.notes / "000.md").unlink()
+                    engine = self._engine(index_type)
+                    with patch.object(FAISSRAGEngine, "build_index", side_effect=AssertionError):
+                        engine.load_or_build_index()
+
+                self.assertEqual(engine.index.ntotal, 699)
+                self.assertNotIn("000.md", engine.manifest.files)
+                (self.notes / "000.md").write_text("слово0", encoding="utf-8")
+
+    def test_hnsw_removal_rebuilds_index(self):
+        with redirect_stdout(io.StringIO()):
+            self._engine(FAISSIndexType.HNSW).build_index()
+            (self.notes / "000.md").write_text("налог " * 30, encoding="utf-8")
+            engine = self._engine(FAISSIndexType.HNSW)
+            output = io.StringIO()
+            with redirect_stdout(output), patch.object(FAISSRAGEngine, "build_index", wraps=engine.build_index) as build:
+                engine.load_or_build_index()
+
+        build.assert_called_once()
+        self.assertIn("Индекс не поддерживает удаление векторов", output.getvalue())
+        self.assertEqual(engine.index.ntotal, 700)
+        self.assertEqual(self._top_source(engine, "налог " * 30), "000.md")
+
+
+class TestChromaRAGEngine(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.notes = self.tmp / "notes"
+        self.notes.mkdir()
+        (self.notes / "a.md").write_text("договор купли продажи", encoding="utf-8")
+        (self.notes / "b.md").write_text("суп варится два часа", encoding="utf-8")
+        (self.notes / "c.md").write_text("налог на имущество", encoding="utf-8")
+        self.local_manager = PlainTextManager(self.notes)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _engine(self, chunk_size: int = 100, dedup: bool = False) -> ChromaRAGEngine:
+        config = ChromaRAGConfig(
+            db_dir=self.tmp / "chroma",
+            collection_name="notes",
+            host="localhost",
+            port=8000,
+            retrieval_k=1,
+            upsert_batch_size=2,
+            dedup=DedupParams(enabled=dedup),
+        )
+        chunk_generator = ChunkGenerator(local_manager=self.local_manager, chunk_size=chunk_size, overlap=0)
+        return ChromaRAGEngine(config=config, chunk_generator=chunk_generator, embedding_model=WordHashEncoder())
+
+    def _top_source(self, engine: ChromaRAGEngine, query: str) -> str:
+        return engine.search_many([query])[0][0].chunk["source"]
+
+    def test_bulk_ingest_and_reload(self):
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine()
+            engine.build_index()
+            reloaded = self._engine()
+            with patch.object(ChromaRAGEngine, "build_index", side_effect=AssertionError):
+                reloaded.load_or_build_index()
+
+        self.assertEqual(engine.collection.count(), 3)
+        self.assertEqual(self._top_source(engine, "договор купли продажи"), "a.md")
+        self.assertEqual(reloaded.collection.id, engine.collection.id)
+        self.assertEqual(reloaded.index_version, engine.index_version)
+        self.assertEqual(self._top_source(reloaded, "суп варится два часа"), "b.md")
+
+    def test_reload_picks_up_changed_files(self):
+        with redirect_stdout(io.StringIO()):
+            self._engine().build_index()
+            (self.notes / "a.md").write_text("рецепт борща со свёклой", encoding="utf-8")
+            (self.notes / "b.md").unlink()
+            (self.notes / "d.md").write_text("отпуск у моря", encoding="utf-8")
+            engine = self._engine()
+            with patch.object(ChromaRAGEngine, "build_index", side_effect=AssertionError):
+                engine.load_or_build_index()
+
+        self.assertEqual(sorted(engine.manifest.files), ["a.md", "c.md", "d.md"])
+        self.assertEqual(engine.collection.count(), 3)
+        self.assertEqual(self._top_source(engine, "рецепт борща со свёклой"), "a.md")
+        self.assertEqual(self._top_source(engine, "отпуск у моря"), "d.md")
+        self.assertEqual(sorted(engine.collection.get()["ids"]), ["a.md#0", "c.md#0", "d.md#0"])
+
+    def test_rebuilds_when_chunking_changes(self):
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine()
+            engine.build_index()
+            self.assertTrue(self._engine().load_index())
+            self.assertFalse(self._engine(chunk_size=10).load_index())
+            self.assertFalse(self._engine(dedup=True).load_index())
+
+            rebuilt = self._engine(chunk_size=10)
+            rebuilt.load_or_build_index()
+
+        self.assertEqual(rebuilt.manifest.chunk_params["chunk_size"], 10)
+        self.assertNotEqual(rebuilt.collection.id, engine.collection.id)
+        documents = rebuilt.collection.get(include=["documents"])["documents"]
+        self.assertTrue(all(len(text) <= 10 for text in documents))
+
+    def test_dedup_merges_sources(self):
+        (self.notes / "b.md").write_text("договор купли продажи", encoding="utf-8")
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine(dedup=True)
+            engine.build_index()
+
+        self.assertEqual(engine.collection.count(), 2)
+        self.assertEqual(self._top_source(engine, "договор купли продажи"), "a.md, b.md")
@@ -0,0 +1,105 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import tempfile
+import unittest
+
+from src.services.retrieval.chunk_generator import ChunkGenerator
+from src.services.retrieval.rag_engine import (
+    ROOT_SHARD,
+    ShardedFAISSRAGConfig,
+    ShardedFAISSRAGEngine,
+    ShardingMode,
+    shard_name,
+)
+from tests.services.retrieval.fakes import PlainTextManager, WordHashEncoder
+
+
+class TestShardName(unittest.TestCase):
+
+    def test_folder(self):
+        self.assertEqual(shard_name("law/civil/code.md", ShardingMode.FOLDER, 4), "law")
+        self.assertEqual(shard_name("readme.md", ShardingMode.FOLDER, 4), ROOT_SHARD)
+
+    def test_hash_is_stable_and_bounded(self):
+        names = {shard_name(f"note_{i}.md", ShardingMode.HASH, 4) for i in range(100)}
+
+        self.assertEqual(names, {"00", "01", "02", "03"})
+        self.assertEqual(shard_name("a/b.md", ShardingMode.HASH, 4), shard_name("a/b.md", ShardingMode.HASH, 4))
+
+
+class TestShardedFAISSRAGEngine(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.notes = self.tmp / "notes"
+        self.texts = {
+            "law/civil.md": "договор купли продажи заключается в письменной форме",
+            "law/labor.md": "трудовой договор заключается с работником",
+            "recipes/soup.md": "суп варится на медленном огне два часа",
+            "todo.md": "купить молоко и хлеб",
+        }
+        for key, text in self.texts.items():
+            self._write(key, text)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, key: str, text: str) -> None:
+        path = self.notes / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+    def _engine(self) -> ShardedFAISSRAGEngine:
+        index_dir = self.tmp / "index"
+        config = ShardedFAISSRAGConfig(
+            index_dir=index_dir,
+            index_file=index_dir / "index.faiss",
+            docs_dir=index_dir / "documents",
+            manifest_file=index_dir / "manifest.json",
+            bm25_dir=index_dir / "bm25",
+            retrieval_k=1,
+        )
+        chunk_generator = ChunkGenerator(local_manager=PlainTextManager(self.notes), chunk_size=100, overlap=0)
+        return ShardedFAISSRAGEngine(config=config, chunk_generator=chunk_generator, embedding_model=WordHashEncoder())
+
+    def _top_source(self, engine: ShardedFAISSRAGEngine, query: str) -> str:
+        [hit] = engine.search(query)
+        return hit.chunk["source"]
+
+    def test_build_load_and_search_across_shards(self):
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine()
+            engine.build_index()
+            loaded = self._engine()
+            self.assertTrue(loaded.load_index())
+
+        self.assertEqual(sorted(loaded.shards), [ROOT_SHARD, "law", "recipes"])
+        self.assertEqual(loaded.index_version, engine.index_version)
+        for key, text in self.texts.items():
+            self.assertEqual(self._top_source(loaded, text), key)
+
+    def test_update_touches_only_changed_shard(self):
+        with redirect_stdout(io.StringIO()):
+            self._engine().load_or_build_index()
+            root_index = self.tmp / "index" / "shards" / ROOT_SHARD / "index.faiss"
+            root_mtime = root_index.stat().st_mtime_ns
+            (self.notes / "recipes" / "soup.md").unlink()
+            self._write("law/tax.md", "налог на доходы физических лиц")
+
+            engine = self._engine()
+            engine.load_or_build_index()
+
+        self.assertEqual(sorted(engine.shards), [ROOT_SHARD, "law"])
+        self.assertFalse((self.tmp / "index" / "shards" / "recipes").exists())
+        self.assertEqual(root_index.stat().st_mtime_ns, root_mtime)
+        self.assertEqual(self._top_source(engine, "налог на доходы физических лиц"), "law/tax.md")
+
+    def test_rebuild_unknown_shard(self):
+        with redirect_stdout(io.StringIO()):
+            engine = self._engine()
+            engine.build_index()
+
+        with self.assertRaises(ValueError):
+            engine.rebuild_shard("missing")
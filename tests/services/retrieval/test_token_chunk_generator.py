@@ -0,0 +1,65 @@
+import unittest
+from pathlib import Path
+
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from tokenizers.processors import TemplateProcessing
+
+from src.services.local_manger.local_manager import LocalManager
+from src.services.retrieval.chunk_generator import TokenChunkGenerator
+
+
+def _word_tokenizer() -> Tokenizer:
+    """Токенизатор "одно слово - один токен" со служебными [CLS]/[SEP], как у BERT"""
+    tokenizer = Tokenizer(WordLevel({"[UNK]": 0, "[CLS]": 1, "[SEP]": 2}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.post_processor = TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 1), ("[SEP]", 2)]
+    )
+    # Обрезка у исходного токенизатора не должна влиять на подсчёт длины
+    tokenizer.enable_truncation(max_length=4)
+    return tokenizer
+
+
+class TestTokenChunkGenerator(unittest.TestCase):
+
+    def _generator(self, chunk_size: int, overlap: int) -> TokenChunkGenerator:
+        return TokenChunkGenerator(
+            local_manager=LocalManager(Path("unused")),
+            tokenizer=_word_tokenizer(),
+            chunk_size=chunk_size,
+            overlap=overlap
+        )
+
+    def test_packs_paragraphs_within_limit(self):
+        generator = self._generator(chunk_size=8, overlap=0)
+        text = "one two three\n\nfour five\n\nsix seven eight nine"
+
+        chunks = generator._chunk_doc(text)
+
+        # 8 токенов минус [CLS]/[SEP] - 6 слов на чанк, абзацы не разрезаются
+        self.assertEqual(chunks, ["one two three\n\nfour five", "six seven eight nine"])
+
+    def test_splits_long_paragraph_by_sentences(self):
+        generator = self._generator(chunk_size=7, overlap=0)
+        text = "First sentence here. Second one is here. Third."
+
+        chunks = generator._chunk_doc(text)
+
+        self.assertEqual(chunks, ["First sentence here.", "Second one is here.", "Third."])
+
+    def test_sentence_overlap(self):
+        generator = self._generator(chunk_size=11, overlap=3)
+        text = "Alpha beta gamma delta. Eps zeta. Eta theta iota kappa."
+
+        chunks = generator._chunk_doc(text)
+
+        self.assertEqual(chunks, ["Alpha beta gamma delta. Eps zeta.", "Eps zeta. Eta theta iota kappa."])
+
+    def test_long_sentence_cut_by_tokens(self):
+        generator = self._generator(chunk_size=5, overlap=0)
+
+        chunks = generator._chunk_doc("a b c d e f g")
+
+        self.assertEqual(chunks, ["a b c", "d e f", "g"])
@@ -0,0 +1,35 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.locked_cached_property import locked_cached_property
+
+
+class Container:
+
+    def __init__(self):
+        self.calls = 0
+
+    @locked_cached_property
+    def component(self) -> object:
+        self.calls += 1
+        time.sleep(0.05)
+        return object()
+
+
+class TestLockedCachedProperty(unittest.TestCase):
+
+    def test_computed_once_under_concurrent_access(self):
+        container = Container()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: container.component, range(8)))
+
+        self.assertEqual(container.calls, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_not_computed_until_accessed(self):
+        container = Container()
+
+        self.assertNotIn("component", container.__dict__)
+        container.component
+        self.assertIn("component", container.__dict__)
@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+
+from src.utils.lru_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache: LRUCache[str, int] = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_counters(self):
+        cache: LRUCache[str, int] = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_ttl(self):
+        cache: LRUCache[str, int] = LRUCache(maxsize=2, ttl=10)
+        with patch("src.utils.lru_cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with patch("src.utils.lru_cache.time.monotonic", return_value=105):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("src.utils.lru_cache.time.monotonic", return_value=111):
+            self.assertIsNone(cache.get("a"))
+
+    def test_disabled(self):
+        cache: LRUCache[str, int] = LRUCache(maxsize=0)
+        cache.set("a", 1)
+
+        self.assertIsNone(cache.get("a"))
+
+    def test_clear(self):
+        cache: LRUCache[str, int] = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
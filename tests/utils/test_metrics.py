@@ -0,0 +1,61 @@
+import unittest
+
+from src.utils.metrics import STAGE_SECONDS, MetricsRegistry, format_spans
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+
+    def test_counters_by_labels(self):
+        self.metrics.inc("llm_prompt_tokens_total", 10, model="a")
+        self.metrics.inc("llm_prompt_tokens_total", 5, model="a")
+        self.metrics.inc("llm_prompt_tokens_total", 1, model="b")
+
+        series = self.metrics.to_dict()["counters"]["llm_prompt_tokens_total"]
+
+        self.assertEqual(
+            {item["labels"]["model"]: item["value"] for item in series},
+            {"a": 15.0, "b": 1.0}
+        )
+
+    def test_histogram_percentiles(self):
+        for value in range(1, 101):
+            self.metrics.observe("latency_seconds", value / 100)
+
+        [series] = self.metrics.to_dict()["histograms"]["latency_seconds"]
+
+        self.assertEqual(series["count"], 100)
+        self.assertAlmostEqual(series["sum"], 50.5)
+        self.assertAlmostEqual(series["p50"], 0.505)
+        self.assertAlmostEqual(series["max"], 1.0)
+
+    def test_spans_are_traced_and_recorded_on_error(self):
+        with self.metrics.trace() as spans:
+            with self.metrics.span("request"):
+                with self.metrics.span("request.search"):
+                    pass
+            with self.assertRaises(ValueError):
+                with self.metrics.span("llm.send_request"):
+                    raise ValueError
+        with self.metrics.span("outside"):
+            pass
+
+        self.assertEqual([stage for stage, _ in spans], ["request.search", "request", "llm.send_request"])
+        stages = {item["labels"]["stage"] for item in self.metrics.to_dict()["histograms"][STAGE_SECONDS]}
+        self.assertEqual(stages, {"request", "request.search", "llm.send_request", "outside"})
+        self.assertEqual(format_spans([("request.search", 0.5), ("retrieval.search", 0.4)]), "request.search 0.50 сек")
+
+    def test_prometheus_text(self):
+        self.metrics.inc("rag_answer_cache_hits_total")
+        self.metrics.observe(STAGE_SECONDS, 0.003, stage='say "hi"')
+        self.metrics.observe(STAGE_SECONDS, 0.5, stage='say "hi"')
+
+        text = self.metrics.to_prometheus()
+
+        self.assertIn("# TYPE rag_answer_cache_hits_total counter\nrag_answer_cache_hits_total 1.0\n", text)
+        self.assertIn('rag_stage_seconds_bucket{stage="say \\"hi\\"",le="0.0025"} 0\n', text)
+        self.assertIn('rag_stage_seconds_bucket{stage="say \\"hi\\"",le="0.005"} 1\n', text)
+        self.assertIn('rag_stage_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 2\n', text)
+        self.assertIn('rag_stage_seconds_count{stage="say \\"hi\\""} 2\n', text)
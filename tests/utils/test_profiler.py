@@ -0,0 +1,45 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import pstats
+import tempfile
+import tracemalloc
+import unittest
+
+from src.utils.profiler import UseCaseProfiler
+
+
+def allocate_lists() -> list[list[int]]:
+    return [list(range(1000)) for _ in range(100)]
+
+
+class TestUseCaseProfiler(unittest.TestCase):
+
+    def test_writes_cpu_and_memory_profiles(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = UseCaseProfiler(Path(tmp), top=5)
+            with redirect_stdout(io.StringIO()) as output:
+                with profiler.profile("RequestUseCase", title="вопрос") as run_id:
+                    allocate_lists()
+
+            prefix = Path(tmp) / f"{run_id}_RequestUseCase"
+            stats = pstats.Stats(str(prefix.with_suffix(".prof")))
+            self.assertTrue(any(func[2] == "allocate_lists" for func in stats.stats))
+            snapshot = tracemalloc.Snapshot.load(str(prefix.with_suffix(".tracemalloc")))
+            self.assertTrue(snapshot.statistics("lineno"))
+            summary = prefix.with_suffix(".txt").read_text(encoding="utf-8")
+            self.assertIn("вопрос", summary)
+            self.assertIn("allocate_lists", output.getvalue())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_cpu_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = UseCaseProfiler(Path(tmp), memory=False)
+            with redirect_stdout(io.StringIO()):
+                with profiler.profile("LoadIndex") as run_id:
+                    allocate_lists()
+
+            self.assertEqual(
+                sorted(path.name for path in Path(tmp).iterdir()),
+                [f"{run_id}_LoadIndex.prof", f"{run_id}_LoadIndex.txt"]
+            )
@@ -0,0 +1,27 @@
+import unittest
+
+from src.utils.prompt_manager import LawPromptManager, PromptManager
+
+
+class TestPromptManager(unittest.TestCase):
+
+    def test_question_kept_with_context(self):
+        prompt = LawPromptManager(question="Срок давности?", context="[Источник: a.md]\nтекст").result
+
+        self.assertIn("[Источник: a.md]\nтекст", prompt.user)
+        self.assertIn("### ВОПРОС: Срок давности?", prompt.user)
+        self.assertTrue(prompt.user.index("текст") < prompt.user.index("Срок давности?"))
+
+    def test_instructions_are_shared_prefix(self):
+        first = PromptManager(question="Как настроить FAISS?", context="заметка").result
+        second = PromptManager(question="numpy").result
+
+        self.assertEqual(first.system, second.system)
+        self.assertNotIn("FAISS", first.system)
+        self.assertTrue(first.text.startswith(first.system))
+        self.assertTrue(second.text.startswith(first.system))
+
+    def test_without_context(self):
+        prompt = LawPromptManager(question="Срок давности?").result
+
+        self.assertNotIn("Заметки", prompt.user)